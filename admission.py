@@ -0,0 +1,429 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager, asynccontextmanager
+from metrics import histogram, counter
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Overloaded(Exception):
+    """
+    Raised when a call is refused admission; map to an HTTP error with Retry-After.
+
+    Args:
+        reason: "queue_full" (refused on arrival) or "queue_timeout" (waited too long)
+        retry_after: Suggested seconds before retrying
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM capacity exhausted ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        # A full queue is refused immediately; a request that waited out its turn is a 503
+        return 429 if self.reason == "queue_full" else 503
+
+
+class _LimiterStats:
+    """Shared bookkeeping of ConcurrencyLimiter and AsyncConcurrencyLimiter."""
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, name: str):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self.average_hold = 5.0
+        self.queue_waits = histogram(f"{name}_queue_wait_seconds", f"Time {name} calls wait for a slot",
+                                     QUEUE_WAIT_BUCKETS)
+        self.rejected = {
+            reason: counter(f"{name}_rejected_total", f"{name} calls refused admission", {"reason": reason})
+            for reason in ("queue_full", "queue_timeout")
+        }
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained."""
+        rounds = math.ceil((self.waiting + 1) / self.max_concurrent)
+        return min(60, max(1, math.ceil(self.average_hold * rounds)))
+
+    def reject(self, reason: str) -> Overloaded:
+        self.rejected[reason].inc()
+        return Overloaded(reason, self.retry_after())
+
+    def record_hold(self, seconds: float) -> None:
+        self.average_hold = 0.8 * self.average_hold + 0.2 * seconds
+
+
+class ConcurrencyLimiter(_LimiterStats):
+    """
+    Bound concurrent calls to a slow dependency (the LLM), with a bounded queue.
+
+    At most ``max_concurrent`` callers hold a slot; up to ``max_queue`` more
+    wait for one, each for at most ``queue_timeout`` seconds. Anyone beyond
+    that is refused at once with Overloaded, so request threads fail fast
+    instead of piling up until the gunicorn timeout.
+
+    Args:
+        max_concurrent: Slots
+        max_queue: Callers allowed to wait for a slot
+        queue_timeout: Seconds a caller waits before giving up
+        name: Metric name prefix
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, queue_timeout: float = 10.0,
+                 name: str = "llm"):
+        super().__init__(max_concurrent, max_queue, queue_timeout, name)
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Take a slot, waiting in the queue if needed. Raises Overloaded."""
+        start = time.perf_counter()
+        with self._condition:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    raise self.reject("queue_full")
+                self.waiting += 1
+                try:
+                    deadline = start + self.queue_timeout
+                    while self.active >= self.max_concurrent:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            raise self.reject("queue_timeout")
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        self.queue_waits.observe(time.perf_counter() - start)
+
+    def release(self, held_seconds: float | None = None) -> None:
+        with self._condition:
+            self.active -= 1
+            if held_seconds is not None:
+                self.record_hold(held_seconds)
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block. Raises Overloaded."""
+        self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+class AsyncConcurrencyLimiter(_LimiterStats):
+    """ConcurrencyLimiter for coroutines on one event loop."""
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, queue_timeout: float = 10.0,
+                 name: str = "llm"):
+        super().__init__(max_concurrent, max_queue, queue_timeout, name)
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block. Raises Overloaded."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        start = time.perf_counter()
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self.reject("queue_full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self.reject("queue_timeout") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.queue_waits.observe(time.perf_counter() - start)
+        self.active += 1
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.record_hold(time.perf_counter() - held)
+            self._semaphore.release()
+
+
+class SingleFlight:
+    """
+    Share one execution of a function among concurrent callers with the same key.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for and receive the same result (or exception). The key is
+    forgotten as soon as the call finishes, so this never serves stale
+    results; caching is answer_cache's job.
+    """
+
+    def __init__(self, name: str = "llm"):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = counter(f"{name}_coalesced_total", f"{name} calls answered by an identical in-flight call")
+
+    def do(self, key, fn) -> tuple:
+        """
+        Run fn, or wait for the in-flight call with the same key.
+
+        Returns:
+            tuple: (result, leader), leader being True for the caller that ran fn
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self.coalesced.inc()
+            return future.result(), False
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), True
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop."""
+
+    def __init__(self, name: str = "llm"):
+        self._calls = {}
+        self.coalesced = counter(f"{name}_coalesced_total", f"{name} calls answered by an identical in-flight call")
+
+    async def do(self, key, coroutine_fn) -> tuple:
+        """Await coroutine_fn(), or the in-flight call with the same key. Returns (result, leader)."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced.inc()
+            # Shielded so one waiter disconnecting does not cancel the call for the others
+            return await asyncio.shield(task), False
+        task = asyncio.ensure_future(coroutine_fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), True
+
+
+class SharedStream:
+    """
+    One source iterator read by several subscribers, each from the first item.
+
+    Items are kept as they arrive, so a subscriber that joins late replays
+    what it missed. Whichever subscriber needs an item that has not been
+    produced yet pulls it from the source, so the stream continues when the
+    subscriber that started it goes away. The source is closed once every
+    subscriber has closed; ``on_close`` runs exactly once, when the source
+    is exhausted, fails or is abandoned.
+    """
+
+    def __init__(self, source, on_close=None):
+        self._source = source
+        self._on_close = on_close
+        self._items = []
+        self._error = None
+        self._done = False
+        self._pulling = False
+        self._subscribers = 0
+        self._cond = threading.Condition()
+
+    def subscribe(self) -> "StreamSubscriber":
+        with self._cond:
+            self._subscribers += 1
+        return StreamSubscriber(self)
+
+    def _next(self, position: int):
+        with self._cond:
+            while True:
+                if position < len(self._items):
+                    return self._items[position]
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    raise StopIteration
+                if not self._pulling:
+                    self._pulling = True
+                    break
+                self._cond.wait()
+        try:
+            item = next(self._source)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except BaseException as e:
+            self._finish(e)
+            raise
+        with self._cond:
+            self._items.append(item)
+            self._pulling = False
+            abandoned = self._subscribers == 0
+            self._cond.notify_all()
+        if abandoned:
+            self._abandon()
+        return item
+
+    def _unsubscribe(self) -> None:
+        with self._cond:
+            self._subscribers -= 1
+            # A subscriber still pulling an item abandons the source once it has it
+            abandoned = self._subscribers == 0 and not self._done and not self._pulling
+        if abandoned:
+            self._abandon()
+
+    def _abandon(self) -> None:
+        try:
+            close = getattr(self._source, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish(None)
+
+    def _finish(self, error: BaseException | None) -> None:
+        with self._cond:
+            if self._done:
+                return
+            self._done = True
+            self._pulling = False
+            self._error = error
+            self._cond.notify_all()
+        if self._on_close is not None:
+            self._on_close()
+
+
+class StreamSubscriber:
+    """Iterator over a SharedStream from its first item; close() when done reading."""
+
+    def __init__(self, stream: SharedStream):
+        self._stream = stream
+        self._position = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self._stream._next(self._position)
+        self._position += 1
+        return item
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stream._unsubscribe()
+
+
+class StreamSingleFlight:
+    """
+    SingleFlight for streamed calls: concurrent callers with the same key
+    read one stream.
+
+    The first caller for a key starts the stream; callers arriving before
+    it ends subscribe to it and receive every item from the beginning, so a
+    burst of identical questions makes one upstream call. The key is
+    forgotten when the stream ends.
+    """
+
+    def __init__(self, name: str = "llm_stream"):
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.coalesced = counter(f"{name}_coalesced_total", f"{name} calls answered by an identical in-flight call")
+
+    def open(self, key, start) -> tuple:
+        """
+        Subscribe to the in-flight stream for key, or start one.
+
+        Args:
+            key: Coalescing key
+            start: Callable returning (iterator, on_close), where on_close
+                runs once the stream has ended (e.g. to release a slot)
+
+        Returns:
+            tuple: (StreamSubscriber, leader), leader being True for the caller that started the stream
+
+        Raises:
+            Exception: Whatever start raised (e.g. Overloaded); callers that
+                were waiting for the same start receive it too
+        """
+        with self._lock:
+            entry = self._streams.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._streams[key] = Future()
+        if not leader:
+            self.coalesced.inc()
+            # A stream that ended meanwhile still replays every item it produced
+            return entry.result().subscribe(), False
+        try:
+            source, on_close = start()
+        except BaseException as e:
+            with self._lock:
+                self._streams.pop(key, None)
+            entry.set_exception(e)
+            raise
+
+        def finished():
+            with self._lock:
+                if self._streams.get(key) is entry:
+                    del self._streams[key]
+            if on_close is not None:
+                on_close()
+
+        stream = SharedStream(source, finished)
+        subscriber = stream.subscribe()
+        entry.set_result(stream)
+        return subscriber, True
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case-, whitespace- and trailing-punctuation-insensitive form of a question.
+
+    The one normalizer for both the embedding cache keys and the coalescing
+    keys, so questions that share an LLM call also share an embedding.
+    """
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def web_threads() -> int:
+    """Request threads per gunicorn worker: WEB_THREADS (default 8), which the Procfile passes as --threads."""
+    return int(os.getenv("WEB_THREADS", "8"))
+
+
+def limiter_settings(threads: int | None = None) -> dict:
+    """
+    LLM_MAX_CONCURRENCY (default 4), LLM_MAX_QUEUE and LLM_QUEUE_TIMEOUT seconds (10).
+
+    Pass ``threads`` for a limiter shared by a worker's request threads. Only
+    a request thread can wait for a slot, so with threads - max_concurrent
+    waiters or more the queue never fills: the 429 never fires and overflow
+    sits in gunicorn's socket backlog instead. The queue then defaults to,
+    and is capped at, threads - max_concurrent - 1, leaving one thread to
+    refuse requests. Without ``threads`` (coroutines) it defaults to 16.
+    """
+    max_concurrent = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    max_queue = os.getenv("LLM_MAX_QUEUE")
+    if threads is None:
+        max_queue = int(max_queue or 16)
+    else:
+        cap = max(0, threads - max_concurrent - 1)
+        if max_queue is not None and int(max_queue) > cap:
+            print(f"LLM_MAX_QUEUE={max_queue} cannot fill with {threads} threads and {max_concurrent} "
+                  f"concurrent LLM calls; using {cap}")
+        max_queue = cap if max_queue is None else min(int(max_queue), cap)
+    return {
+        "max_concurrent": max_concurrent,
+        "max_queue": max_queue,
+        "queue_timeout": float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    }
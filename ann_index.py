@@ -0,0 +1,231 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "fp16", "sq8", "pq")
+# Compressed storage: float16 or int8 scalar quantization, or product-quantized codes
+QUANTIZED_TYPES = ("fp16", "sq8", "pq", "ivfpq")
+PARAMS_FILE = "index_params.json"
+VECTORS_FILE = "vectors.npy"
+
+# Search-time knobs; they can be changed after build without retraining
+DEFAULT_NPROBE = 8
+DEFAULT_EF_SEARCH = 64
+
+
+def default_nlist(n: int) -> int:
+    """Pick an IVF list count: ~4*sqrt(n), with at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(d: int) -> int:
+    """Pick a PQ sub-quantizer count dividing d, aiming for 8-dimensional sub-vectors."""
+    for m in (d // 8, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if m >= 1 and d % m == 0:
+            return m
+    return 1
+
+
+def default_pq_nbits(n: int) -> int:
+    """Bits per PQ code: k-means wants ~39 training points per centroid, so small corpora get smaller codebooks."""
+    return max(1, min(8, int(math.log2(max(n // 39, 2)))))
+
+
+def factory_string(index_type: str, n: int, d: int, params: dict) -> str:
+    """
+    Translate an index type and its build parameters into a faiss.index_factory string.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        n: Number of vectors the index will be trained on
+        d: Vector dimension
+        params: Build parameters (nlist, hnsw_m, pq_m, pq_nbits)
+
+    Returns:
+        str: Factory string, e.g. "IVF64,PQ48x8" or "SQ8"
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{params.get('hnsw_m', 32)}"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "pq":
+        return f"PQ{params.get('pq_m') or default_pq_m(d)}x{params.get('pq_nbits') or default_pq_nbits(n)}"
+    nlist = params.get("nlist") or default_nlist(n)
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivfpq":
+        pq_m = params.get("pq_m") or default_pq_m(d)
+        nbits = params.get("pq_nbits") or default_pq_nbits(n)
+        return f"IVF{nlist},PQ{pq_m}x{nbits}"
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {', '.join(INDEX_TYPES)}")
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", params: dict | None = None,
+                train_size: int = 50000, seed: int = 1234) -> faiss.Index:
+    """
+    Build and fill an L2 index of the given type.
+
+    Trainable types are trained on a random sample of at most train_size
+    vectors before all vectors are added.
+
+    Args:
+        vectors: float32 array of shape (n, d)
+        index_type: One of INDEX_TYPES
+        params: Build and search parameters (nlist, hnsw_m, pq_m, pq_nbits, nprobe, efSearch)
+        train_size: Maximum number of training vectors
+        seed: Seed for the training sample
+
+    Returns:
+        faiss.Index: Populated index with search parameters applied
+    """
+    params = dict(params or {})
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    index = faiss.index_factory(d, factory_string(index_type, n, d, params), faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if n > train_size:
+            rng = np.random.default_rng(seed)
+            sample = vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        index.train(sample)
+    index.add(vectors)
+    apply_search_params(index, params)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Return the INDEX_TYPES name of an index built by build_index."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def apply_search_params(index: faiss.Index, params: dict) -> None:
+    """Set nprobe (IVF) and efSearch (HNSW) on an index, using defaults when unset."""
+    index_type = index_type_of(index)
+    space = faiss.ParameterSpace()
+    if index_type in ("ivf", "ivfpq"):
+        space.set_index_parameter(index, "nprobe", int(params.get("nprobe", DEFAULT_NPROBE)))
+    elif index_type == "hnsw":
+        space.set_index_parameter(index, "efSearch", int(params.get("efSearch", DEFAULT_EF_SEARCH)))
+
+
+def search_params_of(index: faiss.Index) -> dict:
+    """Return the index type and current search parameters of an index."""
+    index_type = index_type_of(index)
+    params = {"index_type": index_type}
+    if index_type in ("ivf", "ivfpq"):
+        params["nprobe"] = faiss.extract_index_ivf(index).nprobe
+    elif index_type == "hnsw":
+        params["efSearch"] = faiss.downcast_index(index).hnsw.efSearch
+    return params
+
+
+def save_index_params(directory: str, index: faiss.Index, filename: str = PARAMS_FILE, rerank: int = 0) -> None:
+    """Save the index type and search parameters; rerank > 1 also records the exact re-ranking factor."""
+    params = search_params_of(index)
+    if rerank > 1:
+        params["rerank"] = rerank
+    with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=1)
+
+
+def load_index_params(directory: str, filename: str = PARAMS_FILE) -> dict:
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def reconstruct_vectors(index: faiss.Index) -> np.ndarray:
+    """
+    Recover the stored vectors of an index, in position order.
+
+    Exact for flat and HNSW indexes; IVF-PQ returns its lossy approximation,
+    which is why non-flat builds also keep the original vectors on disk.
+    """
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def to_flat(index: faiss.Index, vectors: np.ndarray | None = None) -> faiss.Index:
+    """
+    Return an exact, mutable IndexFlatL2 with the same vectors.
+
+    Args:
+        index: Any index
+        vectors: Original vectors in position order, if available
+
+    Returns:
+        faiss.Index: The index itself if already flat, else a new IndexFlatL2
+    """
+    if index_type_of(index) == "flat" and vectors is None:
+        return index
+    flat = faiss.IndexFlatL2(index.d)
+    flat.add(np.ascontiguousarray(vectors if vectors is not None else reconstruct_vectors(index), dtype=np.float32))
+    return flat
+
+
+def load_rerank_vectors(directory: str, filename: str = VECTORS_FILE) -> np.ndarray | None:
+    """Memory-map saved original vectors for exact re-ranking, or None if there are none."""
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def search_reranked(index: faiss.Index, queries: np.ndarray, k: int, vectors: np.ndarray | None = None,
+                    rerank: int = 0):
+    """
+    Search an index, optionally re-ranking rerank * k candidates by exact distance.
+
+    Re-ranking reads only the candidates' rows of vectors, so with a
+    memory-mapped vectors.npy the full-precision vectors stay on disk and
+    only the touched pages are cached.
+
+    Args:
+        index: Any index
+        queries: float32 array of shape (nq, d)
+        k: Number of results per query
+        vectors: Original vectors in position order (usually memory-mapped)
+        rerank: Candidate multiplier; re-ranking is off unless > 1 and vectors is given
+
+    Returns:
+        tuple: (distances, positions) arrays of shape (nq, k), like index.search
+    """
+    if vectors is None or rerank <= 1:
+        return index.search(queries, k)
+    _, candidates = index.search(queries, k * rerank)
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    positions = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, found) in enumerate(zip(queries, candidates)):
+        found = found[found >= 0]
+        if not len(found):
+            continue
+        # Sorted reads keep memory-mapped access sequential
+        found = np.sort(found)
+        exact = np.sum((np.asarray(vectors[found], dtype=np.float32) - query) ** 2, axis=1)
+        best = np.argsort(exact, kind="stable")[:k]
+        distances[row, :len(best)] = exact[best]
+        positions[row, :len(best)] = found[best]
+    return distances, positions
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Per-subject cache of generated answers, matched by query similarity.
+
+    An entry is reused when a new question's embedding is within the cosine
+    threshold of a stored one AND the retrieval returned the same chunk ids,
+    so paraphrases of a question over the same context skip the Gemini call.
+    Entries expire after ``ttl`` seconds, each subject keeps at most
+    ``max_entries`` (least recently used evicted first), and a subject's
+    entries are dropped as soon as its index generation changes.
+
+    With a ``path`` the cache is persisted off the request path: changes
+    are written by a background thread at most every ``save_interval``
+    seconds, and once more at exit. Each write merges with the file on
+    disk, so several workers sharing the path add to it instead of
+    overwriting each other's answers.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 86400,
+                 max_entries: int = 512, path: str | None = None, save_interval: float = 30):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._subjects = {}  # subject -> {"generation": str, "entries": OrderedDict}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._cleared = set()  # subjects cleared since the last save; None clears all
+        self._writer = None
+        self._writer_pid = None
+        self._save_lock = threading.Lock()
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def lookup(self, subject: str, generation: str, embedding, chunk_ids) -> str | None:
+        """
+        Return a cached answer for a similar question over the same context.
+
+        Args:
+            subject: Subject the question was asked in
+            generation: Current generation of the subject's index
+            embedding: Query embedding
+            chunk_ids: Ids of the retrieved chunks, in rank order
+
+        Returns:
+            str: Cached answer, or None on a miss
+        """
+        query_vector = self._unit(embedding)
+        chunk_ids = tuple(chunk_ids)
+        now = time.time()
+        with self._lock:
+            entries = self._entries_for(subject, generation)
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in list(entries.items()):
+                if now - entry["created_at"] > self.ttl:
+                    del entries[entry_id]
+                    continue
+                if entry["chunk_ids"] != chunk_ids:
+                    continue
+                score = float(np.dot(entry["vector"], query_vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_id)
+            self.hits += 1
+            return entries[best_id]["answer"]
+
+    def store(self, subject: str, generation: str, embedding, chunk_ids, answer: str) -> None:
+        """
+        Remember an answer generated for a question and its retrieved context.
+
+        Args:
+            subject: Subject the question was asked in
+            generation: Current generation of the subject's index
+            embedding: Query embedding
+            chunk_ids: Ids of the retrieved chunks, in rank order
+            answer: Generated answer
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._insert(subject, generation, {
+                "vector": self._unit(embedding),
+                "chunk_ids": tuple(chunk_ids),
+                "answer": answer,
+                "created_at": time.time(),
+            })
+        self._schedule_save()
+
+    def clear(self, subject: str | None = None) -> None:
+        with self._lock:
+            if subject is None:
+                self._subjects.clear()
+                self._cleared.add(None)
+            else:
+                self._subjects.pop(subject, None)
+                self._cleared.add(subject)
+        self._schedule_save()
+
+    def flush(self) -> None:
+        """Write pending changes to ``path`` now (a no-op without a path or changes)."""
+        if not self.path or not self._dirty.is_set():
+            return
+        with self._save_lock:
+            self._dirty.clear()
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": sum(len(s["entries"]) for s in self._subjects.values()),
+                "subjects": len(self._subjects),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _entries_for(self, subject: str, generation: str) -> OrderedDict:
+        state = self._subjects.get(subject)
+        if state is None or state["generation"] != generation:
+            # The subject was reindexed, so every stored answer may cite stale context.
+            state = {"generation": generation, "entries": OrderedDict()}
+            self._subjects[subject] = state
+        return state["entries"]
+
+    def _insert(self, subject: str, generation: str, entry: dict) -> None:
+        entries = self._entries_for(subject, generation)
+        entries[self._next_id] = entry
+        self._next_id += 1
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _schedule_save(self) -> None:
+        if not self.path:
+            return
+        self._dirty.set()
+        # Threads do not survive a fork, so each worker starts its own writer;
+        # checked under the lock so concurrent stores start only one
+        with self._lock:
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                self._writer = threading.Thread(target=self._write_loop, name="answer-cache-writer",
+                                                daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            # Collect the changes of the next interval into one write
+            time.sleep(self.save_interval)
+            self.flush()
+
+    def _read_file(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not read answer cache {self.path}: {str(e)}")
+            return {}
+
+    def _load(self) -> None:
+        data = self._read_file()
+        now = time.time()
+        for subject, state in data.items():
+            for entry in state["entries"]:
+                if now - entry["created_at"] > self.ttl:
+                    continue
+                self._insert(subject, state["generation"], {
+                    "vector": np.asarray(entry["vector"], dtype=np.float32),
+                    "chunk_ids": tuple(entry["chunk_ids"]),
+                    "answer": entry["answer"],
+                    "created_at": entry["created_at"],
+                })
+
+    def _save(self) -> None:
+        # Snapshot under the lock; serializing and file I/O happen outside it
+        with self._lock:
+            snapshot = {
+                subject: (state["generation"], list(state["entries"].values()))
+                for subject, state in self._subjects.items()
+            }
+            cleared, self._cleared = self._cleared, set()
+        data = {
+            subject: {
+                "generation": generation,
+                "entries": [
+                    {
+                        "vector": entry["vector"].tolist(),
+                        "chunk_ids": list(entry["chunk_ids"]),
+                        "answer": entry["answer"],
+                        "created_at": entry["created_at"],
+                    }
+                    for entry in entries
+                ],
+            }
+            for subject, (generation, entries) in snapshot.items()
+        }
+        if None not in cleared:
+            data = self._merge(self._read_file(), data, cleared)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            # Atomic on POSIX and Windows, so a concurrent reader never sees a partial file.
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Warning: Could not write answer cache {self.path}: {str(e)}")
+
+    def _merge(self, on_disk: dict, ours: dict, cleared: set) -> dict:
+        """
+        Combine the file's entries (written by other workers) with ours.
+
+        For each subject the newest generation wins; entries of the same
+        generation are unioned, expired ones dropped, and the newest
+        ``max_entries`` kept.
+        """
+        now = time.time()
+        merged = {}
+        for subject in on_disk.keys() | ours.keys():
+            theirs = on_disk.get(subject) if subject not in cleared else None
+            mine = ours.get(subject)
+            states = [state for state in (theirs, mine) if state and state.get("entries")]
+            if not states:
+                continue
+            newest = max(states, key=lambda state: max(entry["created_at"] for entry in state["entries"]))
+            generation = newest["generation"]
+            entries = {}
+            for state in states:
+                if state["generation"] != generation:
+                    continue
+                for entry in state["entries"]:
+                    if now - entry["created_at"] <= self.ttl:
+                        entries[(entry["created_at"], entry["answer"])] = entry
+            kept = sorted(entries.values(), key=lambda entry: entry["created_at"])
+            kept = kept[max(0, len(kept) - self.max_entries):]
+            if kept:
+                merged[subject] = {"generation": generation, "entries": kept}
+        return merged
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    path=os.getenv("ANSWER_CACHE_PATH") or None,
+    save_interval=float(os.getenv("ANSWER_CACHE_SAVE_INTERVAL", "30")),
+)
@@ -1,14 +1,75 @@
-from flask import Flask, request, jsonify, render_template
+from metrics import (
+    histogram, counter, timed, render_prometheus, start_request_timings,
+    server_timing_header, CONTENT_TYPE, StartupTimer,
+)
+# Boot phases are printed once the module has loaded; heavy dependencies
+# (faiss, LangChain, the Gemini SDK, torch) are imported on first use in query.py
+startup = StartupTimer("app")
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 import os
+import json
+import time
+import logging
 from dotenv import load_dotenv
-from query import load_faiss_database, query_faiss, generate_answer
+startup.mark("flask")
+from query import (
+    retrieve_context, answer_once,
+    embed_query, document_ids, get_index_generation,
+    list_subjects, warmup, stream_answer_once, AnswerError,
+)
+from admission import Overloaded
+from answer_cache import answer_cache
+startup.mark("query")
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+logger = logging.getLogger(__name__)
+
+# Opt-in: add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+time_to_first_token = histogram(
+    "time_to_first_token_seconds",
+    "Time from receiving a /query/stream request to sending the first answer token",
+)
+
+# Opt-in: load the model and memory-map all indexes at import time. Under
+# gunicorn with preload_app (see gunicorn.conf.py) this runs once in the
+# master, and forked workers share the pages copy-on-write. Workers only
+# start listening after it finished, so /health needs no warming state.
+if os.getenv("PRELOAD_INDEXES", "0") == "1":
+    startup.mark("app")
+    warmup()
+    startup.mark("warmup")
+
+def overloaded_response(error: Overloaded):
+    response = jsonify({"error": "The answer service is busy. Please retry shortly."})
+    response.status_code = error.status_code
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+def request_errors(endpoint: str):
+    return counter("request_errors_total", "Requests that failed with an internal error", {"endpoint": endpoint})
+
+@app.before_request
+def start_timings():
+    g.started = time.perf_counter()
+    g.timings = start_request_timings()
+
+@app.after_request
+def add_server_timing(response):
+    if SERVER_TIMING and "timings" in g:
+        timings = g.timings + [("total", time.perf_counter() - g.started)]
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), content_type=CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -24,14 +85,7 @@ def chat(subject):
 
 @app.route('/subjects', methods=['GET'])
 def get_subjects():
-    index_dir = "faiss_index"
-    subjects = []
-    if os.path.exists(index_dir):
-        for item in os.listdir(index_dir):
-            if item.endswith("_latest"):
-                subject = item.replace("_latest", "")
-                subjects.append(subject)
-    return jsonify(subjects)
+    return jsonify(list_subjects())
 
 @app.route('/about')
 def about():
@@ -55,20 +109,118 @@ def query():
         if not subject or not user_query:
             return jsonify({"error": "Subject and query are required"}), 400
 
-        faiss_db = load_faiss_database(subject)
-        if not faiss_db:
+        retrieved = retrieve_context(subject, user_query)
+        if not retrieved:
             return jsonify({"error": f"No data found for subject '{subject}'"}), 404
+        similar_docs, context = retrieved
 
-        similar_docs = query_faiss(user_query, faiss_db)
-        context = "\n\n".join([doc.page_content for doc in similar_docs])
+        query_vector = embed_query(user_query)
+        chunk_ids = document_ids(similar_docs)
+        generation = get_index_generation(subject)
 
-        answer = generate_answer(user_query, context)
+        with timed("answer_cache"):
+            answer = answer_cache.lookup(subject, generation, query_vector, chunk_ids)
+        if answer is None:
+            # Identical questions in flight share one LLM call
+            answer, leader = answer_once(subject, user_query, context, chunk_ids)
+            if leader and not answer.startswith("Error generating answer"):
+                answer_cache.store(subject, generation, query_vector, chunk_ids, answer)
         return jsonify({"answer": answer})
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception:
+        request_errors('/query').inc()
+        logger.exception("Error handling /query")
+        return jsonify({"error": "Internal server error"}), 500
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/query/stream', methods=['GET', 'POST'])
+def query_stream():
+    """
+    Stream an answer as server-sent events.
+
+    Events: "sources" (retrieved chunks, sent first), "token" (a piece of the
+    answer), "error" and finally "done". Accepts the same JSON body as
+    /query, or subject/query URL parameters so browsers can use EventSource.
+    """
+    started = time.perf_counter()
+    try:
+        data = (request.get_json(silent=True) if request.method == 'POST' else request.args) or {}
+        subject = data.get('subject')
+        user_query = data.get('query')
+
+        if not subject or not user_query:
+            return jsonify({"error": "Subject and query are required"}), 400
+
+        retrieved = retrieve_context(subject, user_query)
+        if not retrieved:
+            return jsonify({"error": f"No data found for subject '{subject}'"}), 404
+        similar_docs, context = retrieved
+
+        query_vector = embed_query(user_query)
+        chunk_ids = document_ids(similar_docs)
+        generation = get_index_generation(subject)
+        with timed("answer_cache"):
+            cached_answer = answer_cache.lookup(subject, generation, query_vector, chunk_ids)
+        if cached_answer is None:
+            # Identical questions in flight read one LLM stream, which holds
+            # an llm_limiter slot until it ends or every reader has gone
+            answer_stream, leader = stream_answer_once(subject, user_query, context, chunk_ids)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception:
+        request_errors('/query/stream').inc()
+        logger.exception("Error handling /query/stream")
         return jsonify({"error": "Internal server error"}), 500
 
+    sources = [
+        {"id": chunk_id, "source": doc.metadata.get("source"), "subject": doc.metadata.get("subject", subject)}
+        for chunk_id, doc in zip(chunk_ids, similar_docs)
+    ]
+
+    def events():
+        yield sse_event("sources", sources)
+        if cached_answer is not None:
+            time_to_first_token.observe(time.perf_counter() - started)
+            yield sse_event("token", {"text": cached_answer})
+            yield sse_event("done", {})
+            return
+
+        parts = []
+        try:
+            for text in answer_stream:
+                if not parts:
+                    time_to_first_token.observe(time.perf_counter() - started)
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        except AnswerError as e:
+            # Same message, metrics and logging as a failed /query answer
+            yield sse_event("error", {"error": str(e)})
+            return
+        except Exception as e:
+            request_errors('/query/stream').inc()
+            logger.exception("Error streaming answer")
+            yield sse_event("error", {"error": f"Error generating answer: {str(e)}"})
+            return
+        if parts and leader:
+            answer_cache.store(subject, generation, query_vector, chunk_ids, "".join(parts))
+        yield sse_event("done", {})
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    if cached_answer is None:
+        # Runs even if the client left before the first event was sent
+        response.call_on_close(answer_stream.close)
+    return response
+
+startup.mark("routes")
+print(startup.summary())
+
 if __name__ == "__main__":
     import os
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,127 @@
+"""
+Recall/latency benchmark for the index types in ann_index.
+
+Compares every index type against the exact flat baseline on the same
+vectors and reports recall@k, p50/p99 single-query search latency, build
+time and index size as JSON.
+
+Usage:
+    python -m benchmarks.ann_benchmark --n 100000 --queries 500 --k 5
+    python -m benchmarks.ann_benchmark --index faiss_index/computer_network_latest
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index import INDEX_TYPES, build_index, reconstruct_vectors  # noqa: E402
+from index_registry import resolve_index_dir  # noqa: E402
+
+
+def synthetic_vectors(n: int, d: int = 384, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centres, roughly like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, d)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, d)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_index_vectors(path: str) -> np.ndarray:
+    """Load the vectors of a saved index directory or a faiss_index subject name."""
+    if not os.path.isdir(path):
+        path = resolve_index_dir(path) or path
+    vectors_file = os.path.join(path, "vectors.npy")
+    if os.path.exists(vectors_file):
+        return np.load(vectors_file)
+    return reconstruct_vectors(faiss.read_index(os.path.join(path, "index.faiss")))
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def benchmark_index(index: faiss.Index, queries: np.ndarray, k: int):
+    """Search one query at a time, like the serving path, and time each call."""
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return np.array(found), latencies
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, k: int, index_types, params: dict) -> dict:
+    report = {"n": int(vectors.shape[0]), "d": int(vectors.shape[1]), "queries": int(len(queries)),
+              "k": k, "results": {}}
+    truth = None
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, params)
+        build_seconds = time.perf_counter() - start
+        found, latencies = benchmark_index(index, queries, k)
+        if truth is None:
+            truth = found
+        report["results"][index_type] = {
+            "recall_at_k": round(recall_at_k(truth, found), 4),
+            "p50_ms": round(percentile_ms(latencies, 50), 4),
+            "p99_ms": round(percentile_ms(latencies, 99), 4),
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": index_bytes(index),
+        }
+        print(f"{index_type:>6}: recall@{k}={report['results'][index_type]['recall_at_k']:.3f} "
+              f"p50={report['results'][index_type]['p50_ms']:.3f}ms "
+              f"p99={report['results'][index_type]['p99_ms']:.3f}ms", file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Benchmark the vectors of an existing index directory or subject")
+    parser.add_argument("--n", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors = load_index_vectors(args.index).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.n)
+    # Queries are perturbed corpus vectors, so each has meaningful neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    params = {key: value for key, value in {"nprobe": args.nprobe, "efSearch": args.ef_search}.items()
+              if value is not None}
+    report = run(vectors, queries.astype(np.float32), args.k, args.types, params)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
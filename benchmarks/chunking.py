@@ -0,0 +1,110 @@
+"""
+Chunker comparison on a synthetic multi-page corpus.
+
+Times, per configuration, the chunker in chunker.py against what it
+replaced:
+
+    preprocess   RecursiveCharacterTextSplitter(1000, 200, add_start_index)
+                 over each whole document vs chunker.split_documents over
+                 one document per page
+    api          the word-by-word chunk_text formerly in
+                 src/services/preprocessing.py (500, no overlap) vs
+                 chunker.iter_chunks per page
+
+and reports chunk counts, median seconds and the speedup.
+
+Usage:
+    python -m benchmarks.chunking
+    python -m benchmarks.chunking --pages 1000 --pages-per-document 50 --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunker import iter_chunks, split_documents  # noqa: E402
+from benchmarks.components import synthetic_text  # noqa: E402
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 500) -> list[str]:
+    """The chunker src/services/preprocessing.py used before chunker.py."""
+    words = text.split()
+    chunks = []
+    current_chunk = ""
+    for word in words:
+        if len(current_chunk) + len(word) + 1 > chunk_size:
+            chunks.append(current_chunk.strip())
+            current_chunk = word
+        else:
+            current_chunk += " " + word
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def median_seconds(fn, repeat: int) -> tuple[float, int]:
+    times, count = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(fn())
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), count
+
+
+def run(page_count: int, pages_per_document: int, words_per_page: int, repeat: int) -> dict:
+    from langchain_core.documents import Document
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    pages = [synthetic_text(words_per_page, seed=page) for page in range(page_count)]
+    documents = ["\n".join(pages[i:i + pages_per_document]) for i in range(0, page_count, pages_per_document)]
+    whole_documents = [Document(page_content=text, metadata={"source": f"doc{i}.pdf"}) for i, text in enumerate(documents)]
+    page_documents = [
+        Document(page_content=text, metadata={"source": f"doc{page // pages_per_document}.pdf", "page": page + 1})
+        for page, text in enumerate(pages)
+    ]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len,
+                                              add_start_index=True)
+
+    cases = {
+        "preprocess": (
+            lambda: splitter.split_documents(whole_documents),
+            lambda: split_documents(page_documents, 1000, 200),
+        ),
+        "api": (
+            lambda: [chunk for text in documents for chunk in legacy_chunk_text(text)],
+            lambda: [text[start:end] for text in pages for start, end in iter_chunks(text, 500, 0)],
+        ),
+    }
+    report = {"pages": page_count, "characters": sum(map(len, pages)), "repeat": repeat, "results": {}}
+    for name, (before, after) in cases.items():
+        before_seconds, before_chunks = median_seconds(before, repeat)
+        after_seconds, after_chunks = median_seconds(after, repeat)
+        result = {
+            "before_seconds": round(before_seconds, 4), "before_chunks": before_chunks,
+            "after_seconds": round(after_seconds, 4), "after_chunks": after_chunks,
+            "speedup": round(before_seconds / after_seconds, 2),
+        }
+        report["results"][name] = result
+        print(f"{name:>10}: {before_seconds:.3f}s -> {after_seconds:.3f}s ({result['speedup']:.1f}x), "
+              f"{before_chunks} -> {after_chunks} chunks", file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--pages-per-document", type=int, default=50)
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.pages, args.pages_per_document, args.words_per_page, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Micro-benchmarks for the hot paths of indexing and serving.
+
+Covers PDF extraction (preprocess.load_subject_documents), chunking
+(chunker.py against RecursiveCharacterTextSplitter; see benchmarks/chunking.py),
+embedding throughput per batch size, FAISS search per index size and k,
+cold and warm load_faiss_database, and prompt construction. Everything
+runs on synthetic corpora generated here, so no network or real notes
+are needed; a component whose dependencies are not installed, or whose
+embedding model cannot be downloaded, is reported as skipped. Any other
+error fails the run.
+
+Results are emitted as JSON and compared against a stored baseline
+(benchmarks/baseline.json by default). Any median latency that grows, or
+throughput that drops, by more than --tolerance fails the run with exit
+code 1, as does a baseline metric of a component that ran but is now
+missing or skipped. Baselines are machine-specific: record one with --update-baseline
+on the machine that runs the comparison.
+
+With --compare the run is a gate: a missing baseline, or a requested
+component that was skipped, also fails it. Without --compare a missing
+baseline is only reported.
+
+Usage:
+    python -m benchmarks.components
+    python -m benchmarks.components --quick --only faiss_search prompt
+    python -m benchmarks.components --update-baseline
+    python -m benchmarks.components --compare
+"""
+import os
+import sys
+import json
+import time
+import functools
+import platform
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.ann_benchmark import synthetic_vectors  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+COMPONENTS = ("pdf_extraction", "chunking", "embedding", "faiss_search", "faiss_load", "prompt")
+# Compared metrics and the direction that counts as better
+COMPARED_METRICS = {"median_ms": "lower", "items_per_second": "higher"}
+
+
+class SkipComponent(Exception):
+    """A component cannot run in this environment (e.g. no offline embedding model)."""
+
+
+def load_embedding_model():
+    from query import get_embedding_model
+    try:
+        return get_embedding_model()
+    except OSError as e:
+        # Hugging Face raises OSError subclasses when the model is neither cached nor downloadable
+        raise SkipComponent(f"embedding model unavailable: {e}") from e
+
+
+@functools.lru_cache(maxsize=1)
+def synthetic_vocabulary(size: int = 2000) -> tuple[list[str], np.ndarray]:
+    """Pseudo-words and Zipf-like frequencies, as in real prose."""
+    rng = np.random.default_rng(0)
+    syllables = ["ta", "ro", "ni", "ka", "mem", "proc", "net", "ser", "ver", "lo", "ad", "dis", "tion", "ing"]
+    vocabulary = ["".join(rng.choice(syllables, rng.integers(1, 4))) for _ in range(size)]
+    weights = 1.0 / np.arange(1, size + 1)
+    return vocabulary, weights / weights.sum()
+
+
+def synthetic_text(words: int, seed: int = 0) -> str:
+    """Deterministic pseudo-English text with sentences and paragraphs."""
+    rng = np.random.default_rng(seed)
+    vocabulary, weights = synthetic_vocabulary()
+    picks = rng.choice(len(vocabulary), words, p=weights)
+    out, sentence = [], []
+    for i, pick in enumerate(picks):
+        sentence.append(vocabulary[pick])
+        if len(sentence) >= rng.integers(8, 20) or i == words - 1:
+            out.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+            if rng.random() < 0.15:
+                out.append("\n\n")
+    return " ".join(out)
+
+
+def write_text_pdf(path: str, pages: list[str], line_chars: int = 90, lines_per_page: int = 50) -> None:
+    """Write a minimal text-only PDF (Helvetica, one content stream per page) without extra dependencies."""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for text in pages:
+        words, lines, line = text.split(), [], ""
+        for word in words:
+            if len(line) + len(word) + 1 > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.append(line)
+        escaped = [l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for l in lines[:lines_per_page]]
+        stream = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({l}) Tj T*" for l in escaped) + " ET"
+        data = stream.encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_obj, content, font)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def measure(fn, repeat: int, items: int | None = None, warmup: int = 1) -> dict:
+    """
+    Time fn repeatedly.
+
+    Args:
+        fn: Zero-argument callable
+        repeat: Number of timed calls
+        items: Items processed per call, to report throughput
+        warmup: Untimed calls made first
+
+    Returns:
+        dict: median_ms, p95_ms, repeat and, if items is given, items_per_second
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    median = float(np.median(samples))
+    result = {"median_ms": round(median * 1000, 4), "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 4),
+              "repeat": repeat}
+    if items:
+        result["items_per_second"] = round(items / median, 2) if median > 0 else None
+    return result
+
+
+def bench_pdf_extraction(workdir: str, sizes: dict) -> dict:
+    from preprocess import load_subject_documents
+
+    subject_path = os.path.join(workdir, "pdfs", "synthetic_subject")
+    os.makedirs(subject_path, exist_ok=True)
+    for i in range(sizes["pdf_files"]):
+        pages = [synthetic_text(450, seed=i * 1000 + page) for page in range(sizes["pdf_pages"])]
+        write_text_pdf(os.path.join(subject_path, f"doc{i}.pdf"), pages)
+    pages = sizes["pdf_files"] * sizes["pdf_pages"]
+    return {"pdf_extraction": measure(lambda: load_subject_documents(subject_path), sizes["repeat_slow"], items=pages)}
+
+
+def bench_chunking(sizes: dict) -> dict:
+    text = synthetic_text(sizes["chunk_words"], seed=7)
+    results = {}
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    # Same settings as preprocess.py
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+    results["chunking/recursive_splitter"] = measure(lambda: splitter.split_text(text), sizes["repeat"],
+                                                     items=len(text))
+    from chunker import split_text
+    results["chunking/chunker"] = measure(lambda: split_text(text, 1000, 200), sizes["repeat"], items=len(text))
+    return results
+
+
+def bench_embedding(sizes: dict) -> dict:
+    model = load_embedding_model()
+    texts = [synthetic_text(60, seed=i) for i in range(max(sizes["embedding_batches"]))]
+    results = {}
+    for batch_size in sizes["embedding_batches"]:
+        batch = texts[:batch_size]
+        results[f"embedding/batch_{batch_size}"] = measure(lambda: model.embed_documents(batch), sizes["repeat_slow"],
+                                                           items=batch_size)
+    return results
+
+
+def bench_faiss_search(sizes: dict) -> dict:
+    import faiss
+
+    results = {}
+    for n in sizes["index_sizes"]:
+        vectors = synthetic_vectors(n)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        queries = synthetic_vectors(sizes["queries"], seed=99)
+        for k in sizes["k_values"]:
+            def search_all():
+                for query in queries:
+                    index.search(query.reshape(1, -1), k)
+            result = measure(search_all, sizes["repeat"], items=len(queries))
+            result["per_query_ms"] = round(result["median_ms"] / len(queries), 4)
+            results[f"faiss_search/n{n}_k{k}"] = result
+    return results
+
+
+def write_synthetic_store(index_dir: str, subject: str, n: int) -> None:
+    """Save a FAISS index, chunk store and BM25 index for synthetic chunks under <subject>_latest."""
+    import faiss
+    from chunk_store import write_chunk_store
+    from bm25 import BM25Index
+
+    path = os.path.join(index_dir, f"{subject}_latest")
+    os.makedirs(path, exist_ok=True)
+    texts = [synthetic_text(150, seed=i) for i in range(n)]
+    index = faiss.IndexFlatL2(384)
+    index.add(synthetic_vectors(n))
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+    write_chunk_store(path, [f"chunk-{i}" for i in range(n)], texts, [{"source": f"doc{i % 20}.pdf"} for i in range(n)])
+    BM25Index.build(texts).save(path)
+
+
+def bench_faiss_load(workdir: str, sizes: dict) -> dict:
+    import query
+
+    load_embedding_model()  # loaded once, outside the timings
+    index_dir = os.path.join(workdir, "faiss_index")
+    write_synthetic_store(index_dir, "synthetic", sizes["load_chunks"])
+
+    def cold():
+        query.faiss_cache.pop("synthetic", None)
+        query.load_faiss_database("synthetic", index_dir)
+
+    results = {"faiss_load/cold": measure(cold, sizes["repeat_slow"])}
+    results["faiss_load/warm"] = measure(lambda: query.load_faiss_database("synthetic", index_dir), sizes["repeat"])
+    query.faiss_cache.pop("synthetic", None)
+    return results
+
+
+def bench_prompt(sizes: dict) -> dict:
+    from query import build_prompt
+
+    chunks = [synthetic_text(150, seed=i) for i in range(sizes["prompt_chunks"])]
+    question = "Explain how the scheduler picks the next process to run."
+
+    def build():
+        build_prompt(question, "\n\n".join(chunks))
+    return {"prompt/build_prompt": measure(build, sizes["repeat"])}
+
+
+def sizes_for(quick: bool) -> dict:
+    if quick:
+        return {"repeat": 5, "repeat_slow": 2, "pdf_files": 2, "pdf_pages": 3, "chunk_words": 20000,
+                "embedding_batches": [1, 8], "index_sizes": [1000, 10000], "k_values": [1, 5],
+                "queries": 20, "load_chunks": 500, "prompt_chunks": 5}
+    return {"repeat": 20, "repeat_slow": 5, "pdf_files": 5, "pdf_pages": 10, "chunk_words": 100000,
+            "embedding_batches": [1, 8, 32, 64], "index_sizes": [1000, 10000, 100000], "k_values": [1, 5, 20],
+            "queries": 100, "load_chunks": 5000, "prompt_chunks": 5}
+
+
+def run(components, quick: bool) -> dict:
+    sizes = sizes_for(quick)
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "quick": quick},
+        "components": list(components),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        runners = {
+            "pdf_extraction": lambda: bench_pdf_extraction(workdir, sizes),
+            "chunking": lambda: bench_chunking(sizes),
+            "embedding": lambda: bench_embedding(sizes),
+            "faiss_search": lambda: bench_faiss_search(sizes),
+            "faiss_load": lambda: bench_faiss_load(workdir, sizes),
+            "prompt": lambda: bench_prompt(sizes),
+        }
+        for component in components:
+            start = time.perf_counter()
+            try:
+                results = runners[component]()
+            except (ImportError, SkipComponent) as e:
+                # Missing optional dependencies or an unavailable model skip the component;
+                # anything else is a failure and propagates
+                results = {component: {"skipped": f"{type(e).__name__}: {e}"}}
+            report["results"].update(results)
+            print(f"{component}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return report
+
+
+def skipped_components(report: dict) -> dict:
+    """Requested components that did not run, with the reason."""
+    return {component: report["results"][component]["skipped"] for component in report["components"]
+            if "skipped" in report["results"].get(component, {})}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compare a report with a baseline report.
+
+    Args:
+        report: Current results
+        baseline: Stored results
+        tolerance: Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Baseline metrics of the components this report ran must still be
+    present and not skipped, so a crashed component or a renamed metric
+    cannot pass silently.
+
+    Returns:
+        list: Human-readable regression descriptions, empty if none
+    """
+    regressions = []
+    ran = set(report.get("components") or {name.split("/")[0] for name in report["results"]})
+    for name, previous in baseline.get("results", {}).items():
+        component = name.split("/")[0]
+        if component not in ran or "skipped" in previous:
+            continue
+        skipped = report["results"].get(component, {}).get("skipped")
+        if skipped:
+            regressions.append(f"{name}: in the baseline but {component} was skipped ({skipped})")
+        elif name not in report["results"]:
+            regressions.append(f"{name}: in the baseline but missing from this run")
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if better == "lower" else (old - new) / old
+            if change > tolerance:
+                regressions.append(f"{name} {metric}: {old} -> {new} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=COMPONENTS, default=list(COMPONENTS))
+    parser.add_argument("--quick", action="store_true", help="Smaller corpora and fewer repeats")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="Fail if the baseline is missing or a requested component was skipped")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.only, args.quick)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return
+    skipped = skipped_components(report)
+    for component, reason in skipped.items():
+        print(f"SKIPPED {component}: {reason}", file=sys.stderr)
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.", file=sys.stderr)
+        if args.compare:
+            sys.exit(1)
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != report["environment"]:
+        print("Warning: baseline was recorded in a different environment:", baseline.get("environment"),
+              file=sys.stderr)
+    regressions = compare(report, baseline, args.tolerance)
+    if args.compare:
+        regressions += [f"{component}: skipped ({reason})" for component, reason in skipped.items()]
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+    print("No regressions against baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
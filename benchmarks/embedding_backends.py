@@ -0,0 +1,138 @@
+"""
+Fidelity and speed report for the embedding backends in embedding_backend.
+
+Loads the fp32 model as the reference and each backend next to it, then
+reports per backend:
+
+    cosine_mean/cosine_min   agreement of each text's vector with fp32
+    topk_agreement           overlap of the k nearest corpus texts per query
+                             with the fp32 neighbours (retrieval fidelity)
+    p50_ms/p99_ms            single-query encode latency
+    texts_per_second         batch-32 throughput
+    model_bytes              weight tensor bytes
+    rss_delta_mb             resident memory added by loading the model
+
+Set EMBEDDING_THREADS to pin torch threads for the whole run.
+
+Usage:
+    python -m benchmarks.embedding_backends
+    EMBEDDING_THREADS=1 python -m benchmarks.embedding_backends --backends torch int8 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_backend import EMBEDDING_BACKENDS, load_sentence_transformer  # noqa: E402
+from benchmarks.ann_benchmark import percentile_ms  # noqa: E402
+from benchmarks.components import synthetic_text  # noqa: E402
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def model_bytes(model) -> int:
+    """Bytes of all weight tensors, including the packed int8 weights of quantized layers."""
+    import torch
+
+    def size(value) -> int:
+        if isinstance(value, torch.Tensor):
+            return value.element_size() * value.nelement()
+        if isinstance(value, (tuple, list)):
+            return sum(size(item) for item in value)
+        return 0
+    return sum(size(value) for value in model.state_dict().values())
+
+
+def encode(model, texts) -> np.ndarray:
+    return np.asarray(model.encode(texts, batch_size=32, normalize_embeddings=True), dtype=np.float32)
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ corpus.T), axis=1, kind="stable")[:, :k]
+
+
+def run(model_name: str, backends, corpus_size: int, query_count: int, k: int) -> dict:
+    corpus_texts = [synthetic_text(80, seed=i) for i in range(corpus_size)]
+    query_texts = [synthetic_text(12, seed=100000 + i) for i in range(query_count)]
+
+    before = rss_mb()
+    reference = load_sentence_transformer(model_name, "torch")
+    reference_rss = rss_mb() - before
+    reference_corpus = encode(reference, corpus_texts)
+    reference_queries = encode(reference, query_texts)
+    reference_top = top_k(reference_corpus, reference_queries, k)
+
+    report = {"model": model_name, "corpus": corpus_size, "queries": query_count, "k": k,
+              "threads": int(os.getenv("EMBEDDING_THREADS", "0")) or None, "results": {}}
+    for backend in backends:
+        if backend == "torch":
+            model, rss_delta = reference, reference_rss
+        else:
+            before = rss_mb()
+            model = load_sentence_transformer(model_name, backend)
+            rss_delta = rss_mb() - before
+
+        corpus_vectors = encode(model, corpus_texts)
+        query_vectors = encode(model, query_texts)
+        cosines = np.sum(corpus_vectors * reference_corpus, axis=1)
+        found = top_k(corpus_vectors, query_vectors, k)
+        agreement = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, reference_top)])
+
+        latencies = []
+        for text in query_texts:
+            start = time.perf_counter()
+            model.encode([text])
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        model.encode(corpus_texts, batch_size=32)
+        throughput = len(corpus_texts) / (time.perf_counter() - start)
+
+        result = {
+            "cosine_mean": round(float(cosines.mean()), 5),
+            "cosine_min": round(float(cosines.min()), 5),
+            "topk_agreement": round(float(agreement), 4),
+            "p50_ms": round(percentile_ms(latencies, 50), 3),
+            "p99_ms": round(percentile_ms(latencies, 99), 3),
+            "texts_per_second": round(throughput, 1),
+            "model_bytes": model_bytes(model),
+            "rss_delta_mb": round(rss_delta, 1),
+        }
+        report["results"][backend] = result
+        print(f"{backend:>6}: cosine mean={result['cosine_mean']:.4f} min={result['cosine_min']:.4f} "
+              f"top{k}={result['topk_agreement']:.3f} p50={result['p50_ms']:.2f}ms "
+              f"{result['texts_per_second']:.0f} texts/s {result['model_bytes'] / 2**20:.1f} MiB", file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Model name or local path")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--corpus", type=int, default=500, help="Corpus texts for agreement and throughput")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.model, args.backends, args.corpus, args.queries, args.k)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Local stand-in for the Gemini REST API, for load tests.
+
+Serves generateContent and streamGenerateContent (alt=sse) on
+/v1beta/models/<model>:<method> with latencies drawn from distributions
+shaped like a hosted LLM's:
+
+    time to first token   lognormal around --ttft-median seconds
+    output length         lognormal around --tokens-median tokens
+    token rate            normal around --tokens-per-second, per request
+
+--error-rate answers that fraction of requests with a 503, like an
+overloaded provider. GET /stats returns the request and error counts.
+
+Point the app at it with LLM_BACKEND=rest GEMINI_BASE_URL=http://host:port.
+
+Usage:
+    python -m benchmarks.fake_gemini --port 8089
+    python -m benchmarks.fake_gemini --ttft-median 0.8 --tokens-per-second 40 --error-rate 0.01
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "the answer depends on context retrieved from the course notes which describe how "
+    "each concept relates to the others and why it matters in practice for students"
+).split()
+
+
+@dataclass
+class LatencyModel:
+    ttft_median: float = 0.6
+    ttft_sigma: float = 0.5
+    tokens_median: int = 200
+    tokens_sigma: float = 0.6
+    tokens_per_second: float = 60.0
+    tokens_per_second_sd: float = 15.0
+    max_tokens: int = 2048
+    error_rate: float = 0.0
+
+    def sample(self, rng: random.Random) -> tuple[float, int, float]:
+        """Draw (seconds to first token, output tokens, tokens per second) for one request."""
+        ttft = rng.lognormvariate(0, self.ttft_sigma) * self.ttft_median
+        tokens = int(min(self.max_tokens, max(1, rng.lognormvariate(0, self.tokens_sigma) * self.tokens_median)))
+        rate = max(1.0, rng.gauss(self.tokens_per_second, self.tokens_per_second_sd))
+        return ttft, tokens, rate
+
+
+def response_payload(text: str, finished: bool, prompt_tokens: int, output_tokens: int) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+                          "totalTokenCount": prompt_tokens + output_tokens},
+    }
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many load-test connections arrive at once
+    request_queue_size = 1024
+
+    def __init__(self, address, model: LatencyModel, seed: int | None = None):
+        super().__init__(address, FakeGeminiHandler)
+        self.model = model
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "active": 0, "max_active": 0}
+
+    def sample(self) -> tuple[bool, float, int, float]:
+        with self.lock:
+            failed = self.rng.random() < self.model.error_rate
+            return (failed, *self.model.sample(self.rng))
+
+    def count(self, key: str, delta: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += delta
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        method = path.rsplit(":", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not path.startswith("/v1beta/models/") or method not in ("generateContent", "streamGenerateContent"):
+            self.send_json(404, {"error": {"code": 404, "message": f"Unknown method {path}"}})
+            return
+        try:
+            prompt = "".join(part.get("text", "") for content in json.loads(body).get("contents", [])
+                             for part in content.get("parts", []))
+        except (ValueError, AttributeError):
+            self.send_json(400, {"error": {"code": 400, "message": "Invalid JSON body"}})
+            return
+
+        server = self.server
+        failed, ttft, tokens, rate = server.sample()
+        server.count("requests")
+        server.count("active")
+        try:
+            time.sleep(ttft)
+            if failed:
+                server.count("errors")
+                self.send_json(503, {"error": {"code": 503, "message": "The model is overloaded.",
+                                               "status": "UNAVAILABLE"}})
+                return
+            words = [WORDS[i % len(WORDS)] for i in range(tokens)]
+            prompt_tokens = len(prompt) // 4
+            if method == "generateContent":
+                time.sleep(tokens / rate)
+                self.send_json(200, response_payload(" ".join(words), True, prompt_tokens, tokens))
+            else:
+                self.stream(words, rate, prompt_tokens)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            server.count("active", -1)
+
+    def stream(self, words: list[str], rate: float, prompt_tokens: int) -> None:
+        """Send the words as SSE chunks of a few tokens, paced at ``rate`` tokens per second."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = 8
+        for start in range(0, len(words), step):
+            piece = words[start:start + step]
+            if start:
+                time.sleep(len(piece) / rate)
+            text = " ".join(piece) + (" " if start + step < len(words) else "")
+            finished = start + step >= len(words)
+            event = f"data: {json.dumps(response_payload(text, finished, prompt_tokens, len(piece)))}\r\n\r\n"
+            data = event.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, model: LatencyModel | None = None,
+                 seed: int | None = None) -> FakeGeminiServer:
+    """Start a FakeGeminiServer on a background thread; port 0 picks a free port."""
+    server = FakeGeminiServer((host, port), model or LatencyModel(), seed)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = LatencyModel()
+    parser.add_argument("--ttft-median", type=float, default=defaults.ttft_median,
+                        help="Median seconds to the first token")
+    parser.add_argument("--ttft-sigma", type=float, default=defaults.ttft_sigma,
+                        help="Lognormal sigma of the time to first token")
+    parser.add_argument("--tokens-median", type=int, default=defaults.tokens_median,
+                        help="Median answer length in tokens")
+    parser.add_argument("--tokens-sigma", type=float, default=defaults.tokens_sigma)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--tokens-per-second-sd", type=float, default=defaults.tokens_per_second_sd)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Fraction of requests answered with a 503")
+
+
+def latency_model_from_args(args) -> LatencyModel:
+    return LatencyModel(
+        ttft_median=args.ttft_median, ttft_sigma=args.ttft_sigma,
+        tokens_median=args.tokens_median, tokens_sigma=args.tokens_sigma,
+        tokens_per_second=args.tokens_per_second, tokens_per_second_sd=args.tokens_per_second_sd,
+        error_rate=args.error_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--seed", type=int, default=None)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    server = FakeGeminiServer((args.host, args.port), latency_model_from_args(args), args.seed)
+    print(f"Fake Gemini listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Latency benchmark for "all subjects" retrieval.
+
+Compares three ways of answering a query across S subject indexes of n
+vectors each:
+
+    fanout      search every subject index concurrently and merge top-k
+                (what query_all_subjects does)
+    sequential  search the subject indexes one after another
+    combined    one index over every subject's vectors; a single-subject
+                query on it needs an ID selector filter ("combined_filtered")
+
+and reports p50/p99 per subject count next to a single-subject search, so
+the growth of the all-subjects latency is visible.
+
+Usage:
+    python -m benchmarks.federated_benchmark --n 20000 --subjects 1 2 4 8
+    python -m benchmarks.federated_benchmark --index-type hnsw
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index import INDEX_TYPES, build_index  # noqa: E402
+from benchmarks.ann_benchmark import synthetic_vectors, percentile_ms  # noqa: E402
+
+
+def merge_top_k(results, k: int):
+    """Merge per-subject (distances, ids) into a global top-k of (distance, subject, id)."""
+    hits = [(float(d), subject, int(i)) for subject, (distances, ids) in enumerate(results)
+            for d, i in zip(distances[0], ids[0]) if i >= 0]
+    return sorted(hits)[:k]
+
+
+def time_queries(search, queries: np.ndarray) -> list[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query.reshape(1, -1))
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(n: int, subject_counts, queries: int, k: int, index_type: str, workers: int) -> dict:
+    report = {"n_per_subject": n, "queries": queries, "k": k, "index_type": index_type, "results": {}}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for count in subject_counts:
+        corpora = [synthetic_vectors(n, seed=subject) for subject in range(count)]
+        indexes = [build_index(vectors, index_type) for vectors in corpora]
+        combined = build_index(np.concatenate(corpora), index_type)
+        rng = np.random.default_rng(1)
+        pool = np.concatenate(corpora)
+        query_vectors = pool[rng.integers(0, len(pool), queries)]
+        query_vectors = (query_vectors + 0.05 * rng.standard_normal(query_vectors.shape)).astype(np.float32)
+
+        def fanout(query):
+            return merge_top_k(list(executor.map(lambda index: index.search(query, k), indexes)), k)
+
+        def sequential(query):
+            return merge_top_k([index.search(query, k) for index in indexes], k)
+
+        # Single-subject query against the combined index: restrict to subject 0's id range
+        selector = faiss.IDSelectorRange(0, n)
+        if index_type == "hnsw":
+            filtered_params = faiss.SearchParametersHNSW(sel=selector)
+        elif index_type in ("ivf", "ivfpq"):
+            filtered_params = faiss.SearchParametersIVF(sel=selector)
+        else:
+            filtered_params = faiss.SearchParameters(sel=selector)
+
+        modes = {
+            "single_subject": lambda query: indexes[0].search(query, k),
+            "fanout": fanout,
+            "sequential": sequential,
+            "combined": lambda query: combined.search(query, k),
+            "combined_filtered": lambda query: combined.search(query, k, params=filtered_params),
+        }
+        results = {}
+        for mode, search in modes.items():
+            latencies = time_queries(search, query_vectors)
+            results[mode] = {"p50_ms": round(percentile_ms(latencies, 50), 4),
+                             "p99_ms": round(percentile_ms(latencies, 99), 4)}
+        report["results"][str(count)] = results
+        print(f"{count} subject(s): " + " ".join(f"{mode}={r['p50_ms']:.3f}ms" for mode, r in results.items()),
+              file=sys.stderr)
+    executor.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000, help="Vectors per subject")
+    parser.add_argument("--subjects", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--workers", type=int, default=8, help="Fan-out threads, like FEDERATED_WORKERS")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.n, args.subjects, args.queries, args.k, args.index_type, args.workers)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
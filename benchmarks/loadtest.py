@@ -0,0 +1,526 @@
+"""
+End-to-end load test of the Flask app under gunicorn.
+
+Starts benchmarks/fake_gemini.py and the app with the Procfile's web
+command (workers, threads and timeout as deployed; --workers/--threads
+override them), points the app at the fake with LLM_BACKEND=rest, then
+steps the load up level by level against /query or /query/stream:
+
+    --concurrency 1 2 4 8   closed loop: N clients, each sending its next
+                            request as soon as the previous one returns
+    --rates 1 2 4 8         open loop: Poisson arrivals at N requests/s;
+                            latency counts from the scheduled send time
+
+Each level reports throughput, p50/p95/p99 latency (and time to first
+token for the stream), the error rate with status codes (429/503 are the
+LLM admission limits) and the RSS of every gunicorn worker, sampled
+throughout. The saturation point is the first level where throughput
+stops following the offered load, p95 exceeds --slo-p95-ms or the error
+rate exceeds --max-error-rate; the level before it is the capacity of
+the layout.
+
+Run it from the directory holding faiss_index (the app's working
+directory). The app runs with its semantic answer cache disabled
+(ANSWER_CACHE_SIZE=0), because the generated questions differ only in a
+topic and a number and would mostly be answered from it; pass
+--answer-cache to measure with the cache as configured. --questions
+reads the questions from a file.
+
+Usage:
+    python -m benchmarks.loadtest --concurrency 1 2 4 8 16 32 --duration 30
+    python -m benchmarks.loadtest --rates 0.5 1 2 4 8 --endpoint stream --workers 2 --threads 4
+    python -m benchmarks.loadtest --concurrency 8 --ttft-median 1.5 --output report.json
+"""
+import os
+import sys
+import json
+import time
+import re
+import shlex
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+from benchmarks.ann_benchmark import percentile_ms  # noqa: E402
+from benchmarks.fake_gemini import start_server, add_latency_arguments, latency_model_from_args  # noqa: E402
+
+TOPICS = (
+    "recursion", "entropy", "photosynthesis", "inflation", "derivatives", "osmosis", "sorting", "torque",
+    "mitosis", "supply and demand", "probability", "electric fields", "hashing", "enzymes", "vectors",
+)
+
+
+def procfile_command(path: str, process: str = "web") -> list[str]:
+    """The Procfile command of ``process`` as an argument list."""
+    with open(path) as f:
+        for line in f:
+            name, _, command = line.partition(":")
+            if name.strip() == process:
+                return shlex.split(command.strip())
+    raise ValueError(f"No '{process}' process in {path}")
+
+
+def set_option(command: list[str], flag: str, value) -> list[str]:
+    """Replace the value of ``flag`` in command, or append the flag."""
+    command = list(command)
+    for i, arg in enumerate(command):
+        if arg == flag and i + 1 < len(command):
+            command[i + 1] = str(value)
+            return command
+        if arg.startswith(flag + "="):
+            command[i] = f"{flag}={value}"
+            return command
+    return command + [flag, str(value)]
+
+
+def option_value(command: list[str], flag: str, default=None):
+    for i, arg in enumerate(command):
+        if arg == flag and i + 1 < len(command):
+            return command[i + 1]
+        if arg.startswith(flag + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def expand_variables(arg: str, env: dict) -> str:
+    """Expand $VAR, ${VAR} and ${VAR:-default} the way the Procfile's shell would."""
+    def value(match):
+        name = match.group(1) or match.group(3)
+        return env.get(name) or match.group(2) or ""
+    return re.sub(r"\$\{(\w+)(?::-([^}]*))?\}|\$(\w+)", value, arg)
+
+
+def gunicorn_command(procfile: str, env: dict, workers: int | None, threads: int | None,
+                     extra_args: list[str]) -> list[str]:
+    command = procfile_command(procfile)
+    if command[0] == "gunicorn":
+        # Run the gunicorn of this interpreter rather than whichever is on PATH
+        command = [sys.executable, "-m", "gunicorn"] + command[1:]
+    command = [expand_variables(arg, env) for arg in command]
+    port = env["PORT"]
+    command = set_option(command, "--bind", f"127.0.0.1:{port}")
+    if workers:
+        command = set_option(command, "--workers", workers)
+    if threads:
+        command = set_option(command, "--threads", threads)
+    return command + extra_args
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen | None, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def child_pids(parent: int) -> list[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the fields after it are fixed
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RSSSampler:
+    """Sample the RSS of every gunicorn worker on a background thread."""
+
+    def __init__(self, master_pid: int, interval: float = 0.5):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.samples = []  # (seconds since start, {pid: MB})
+        self.started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "RSSSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = {pid: rss_mb(pid) for pid in child_pids(self.master_pid)}
+            self.samples.append((time.monotonic() - self.started, {p: r for p, r in rss.items() if r is not None}))
+            self._stop.wait(self.interval)
+
+    def summary(self, since: float, until: float) -> dict:
+        """Per-worker mean and max RSS (MB) over the samples taken between since and until."""
+        per_worker = {}
+        for t, rss in self.samples:
+            if since <= t <= until:
+                for pid, mb in rss.items():
+                    per_worker.setdefault(pid, []).append(mb)
+        return {
+            str(pid): {"mean_mb": round(float(np.mean(values)), 1), "max_mb": round(max(values), 1)}
+            for pid, values in sorted(per_worker.items())
+        }
+
+
+class QuestionSource:
+    """Questions to send: from a file, or generated (distinct strings, but semantically close)."""
+
+    def __init__(self, subjects: list[str], path: str | None = None, seed: int = 0):
+        self.subjects = subjects
+        self.questions = None
+        if path:
+            with open(path) as f:
+                self.questions = [line.strip() for line in f if line.strip()]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def next(self) -> tuple[str, str]:
+        with self.lock:
+            self.sent += 1
+            subject = self.rng.choice(self.subjects)
+            if self.questions:
+                return subject, self.rng.choice(self.questions)
+            topic = self.rng.choice(TOPICS)
+            return subject, f"Explain {topic} with example {self.sent} from the notes"
+
+
+def send(session: requests.Session, url: str, endpoint: str, subject: str, question: str,
+         timeout: float) -> dict:
+    """Send one question; returns status, latency and (for the stream) time to first token."""
+    started = time.perf_counter()
+    result = {"status": None, "ttft": None}
+    try:
+        if endpoint == "stream":
+            with session.post(f"{url}/query/stream", json={"subject": subject, "query": question},
+                              stream=True, timeout=timeout) as response:
+                result["status"] = response.status_code
+                if response.status_code == 200:
+                    event = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line.split(":", 1)[1].strip()
+                            if event == "token" and result["ttft"] is None:
+                                result["ttft"] = time.perf_counter() - started
+                            elif event == "error":
+                                result["status"] = "stream_error"
+                        if event == "done":
+                            break
+        else:
+            response = session.post(f"{url}/query", json={"subject": subject, "query": question}, timeout=timeout)
+            result["status"] = response.status_code
+    except requests.Timeout:
+        result["status"] = "timeout"
+    except requests.RequestException:
+        result["status"] = "connection_error"
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def run_closed_loop(url, endpoint, questions, concurrency: int, duration: float, timeout: float) -> list[dict]:
+    results, lock = [], threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            result = send(session, url, endpoint, *questions.next(), timeout)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_open_loop(url, endpoint, questions, rate: float, duration: float, timeout: float,
+                  max_in_flight: int) -> list[dict]:
+    local = threading.local()
+    rng = random.Random(1)
+
+    def scheduled(at: float):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        result = send(local.session, url, endpoint, *questions.next(), timeout)
+        # Count from the scheduled send time so a backed-up client does not hide server delay
+        result["latency"] = time.perf_counter() - at
+        return result
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        start = time.perf_counter()
+        at = start
+        while True:
+            at += rng.expovariate(rate)
+            if at - start >= duration:
+                break
+            time.sleep(max(0.0, at - time.perf_counter()))
+            futures.append(executor.submit(scheduled, at))
+    return [future.result() for future in futures]
+
+
+def summarize(results: list[dict], elapsed: float) -> dict:
+    ok = [r for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        if r["status"] != 200:
+            statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    latencies = [r["latency"] for r in ok]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "errors": statuses,
+        "p50_ms": round(percentile_ms(latencies, 50), 1),
+        "p95_ms": round(percentile_ms(latencies, 95), 1),
+        "p99_ms": round(percentile_ms(latencies, 99), 1),
+    }
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    if ttfts:
+        summary["ttft_p50_ms"] = round(percentile_ms(ttfts, 50), 1)
+        summary["ttft_p95_ms"] = round(percentile_ms(ttfts, 95), 1)
+    return summary
+
+
+def find_saturation(levels: list[dict], mode: str, slo_p95_ms: float, max_error_rate: float,
+                    min_gain: float = 0.1) -> dict:
+    """
+    Find the first level where the app stops keeping up with the offered load.
+
+    Closed loop: throughput grows by less than ``min_gain`` over the best
+    lower level. Open loop: throughput falls more than ``min_gain`` short of
+    the arrival rate. Either way, a p95 above the SLO or an error rate above
+    the limit also counts.
+
+    Returns:
+        dict: saturated_at and reason (None if no level saturated), and the
+            offered load and throughput of the last level before it
+    """
+    best = None
+    for level in levels:
+        reason = None
+        if level["error_rate"] > max_error_rate:
+            reason = f"error rate {level['error_rate']:.1%} > {max_error_rate:.1%}"
+        elif slo_p95_ms and level["p95_ms"] > slo_p95_ms:
+            reason = f"p95 {level['p95_ms']:.0f}ms > {slo_p95_ms:.0f}ms"
+        elif mode == "rate" and level["throughput_rps"] < (1 - min_gain) * level["offered"]:
+            reason = f"throughput {level['throughput_rps']:.2f}/s below arrival rate {level['offered']}/s"
+        elif mode == "concurrency" and best and level["throughput_rps"] < (1 + min_gain) * best["throughput_rps"]:
+            reason = f"throughput {level['throughput_rps']:.2f}/s flat vs {best['throughput_rps']:.2f}/s " \
+                     f"at concurrency {best['offered']}"
+        if reason:
+            return {
+                "saturated_at": level["offered"], "reason": reason,
+                "capacity_offered": best["offered"] if best else None,
+                "capacity_rps": best["throughput_rps"] if best else 0.0,
+            }
+        if best is None or level["throughput_rps"] >= best["throughput_rps"]:
+            best = level
+    return {
+        "saturated_at": None, "reason": None,
+        "capacity_offered": best["offered"] if best else None,
+        "capacity_rps": best["throughput_rps"] if best else 0.0,
+    }
+
+
+def print_level(level: dict, mode: str) -> None:
+    unit = "clients" if mode == "concurrency" else "req/s"
+    workers = level.get("rss_mb", {})
+    rss = ", ".join(f"{w['max_mb']:.0f}" for w in workers.values()) or "-"
+    ttft = f" ttft p50 {level['ttft_p50_ms']:.0f}ms" if "ttft_p50_ms" in level else ""
+    print(f"{level['offered']:>6} {unit}: {level['throughput_rps']:6.2f} ok/s  "
+          f"p50 {level['p50_ms']:7.0f}ms  p95 {level['p95_ms']:7.0f}ms  p99 {level['p99_ms']:7.0f}ms{ttft}  "
+          f"errors {level['error_rate']:.1%} {level['errors'] or ''}  worker RSS max MB [{rss}]",
+          file=sys.stderr)
+
+
+def run(args) -> dict:
+    fake = None
+    llm_url = args.llm_url
+    if not llm_url:
+        fake = start_server(model=latency_model_from_args(args), seed=args.seed)
+        llm_url = fake.url
+
+    process, log = None, None
+    url = args.app_url
+    command = None
+    if not url:
+        port = args.port or free_port()
+        env = {**os.environ, "PORT": str(port), "LLM_BACKEND": "rest", "GEMINI_BASE_URL": llm_url}
+        if args.threads:
+            env["WEB_THREADS"] = str(args.threads)
+        if not args.answer_cache:
+            # Measure the LLM path rather than semantic cache hits
+            env["ANSWER_CACHE_SIZE"] = "0"
+            env.pop("ANSWER_CACHE_PATH", None)
+        command = gunicorn_command(args.procfile, env, args.workers, args.threads, shlex.split(args.gunicorn_args))
+        log = open(args.log, "w") if args.log else tempfile.NamedTemporaryFile("w", prefix="loadtest-", suffix=".log",
+                                                                               delete=False)
+        print(f"Starting {' '.join(command)} (log: {log.name})", file=sys.stderr)
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+        url = f"http://127.0.0.1:{port}"
+
+    try:
+        wait_ready(url, process, args.startup_timeout)
+        sampler = RSSSampler(process.pid, args.rss_interval).start() if process else None
+        subjects = args.subject or requests.get(f"{url}/subjects", timeout=10).json()
+        if not subjects:
+            raise RuntimeError("The app has no subjects; run preprocess.py first")
+        questions = QuestionSource(subjects, args.questions, args.seed or 0)
+
+        workers = int(option_value(command, "--workers", 1)) if command else None
+        threads = int(option_value(command, "--threads", 1)) if command else None
+        # Load every subject in every worker before measuring
+        warmup = max(len(subjects), (workers or 1) * (threads or 1))
+        run_closed_loop(url, args.endpoint, questions, warmup, args.warmup, args.timeout)
+
+        mode = "concurrency" if args.concurrency else "rate"
+        levels = []
+        for offered in args.concurrency or args.rates:
+            since = time.monotonic() - sampler.started if sampler else 0.0
+            started = time.perf_counter()
+            if mode == "concurrency":
+                results = run_closed_loop(url, args.endpoint, questions, int(offered), args.duration, args.timeout)
+            else:
+                results = run_open_loop(url, args.endpoint, questions, offered, args.duration, args.timeout,
+                                        args.max_in_flight)
+            # Requests sent near the end of the level finish after it; count them over the real time
+            elapsed = time.perf_counter() - started
+            level = {"offered": offered, **summarize(results, elapsed)}
+            if sampler:
+                level["rss_mb"] = sampler.summary(since, time.monotonic() - sampler.started)
+            levels.append(level)
+            print_level(level, mode)
+            if not args.keep_going and find_saturation(levels, mode, args.slo_p95_ms, args.max_error_rate,
+                                                       args.min_gain)["saturated_at"] is not None:
+                break
+
+        report = {
+            "endpoint": "/query/stream" if args.endpoint == "stream" else "/query",
+            "mode": mode,
+            "duration_s": args.duration,
+            "workers": workers,
+            "threads": threads,
+            "command": command,
+            "subjects": subjects,
+            "llm": vars(latency_model_from_args(args)) if fake else {"url": llm_url},
+            "levels": levels,
+            "saturation": find_saturation(levels, mode, args.slo_p95_ms, args.max_error_rate, args.min_gain),
+        }
+        if fake:
+            with fake.lock:
+                report["llm_calls"] = dict(fake.stats)
+        if sampler:
+            sampler.stop()
+            report["rss_timeline"] = [
+                {"t": round(t, 2), **{str(pid): round(mb, 1) for pid, mb in rss.items()}} for t, rss in sampler.samples
+            ]
+        saturation = report["saturation"]
+        if saturation["saturated_at"] is not None:
+            print(f"Saturated at {saturation['saturated_at']} ({saturation['reason']}); capacity "
+                  f"{saturation['capacity_rps']:.2f} req/s at {saturation['capacity_offered']}", file=sys.stderr)
+        else:
+            print(f"No saturation up to {levels[-1]['offered'] if levels else '-'}", file=sys.stderr)
+        return report
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log:
+            log.close()
+        if fake:
+            fake.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, nargs="+", help="Closed-loop client counts to step through")
+    load.add_argument("--rates", type=float, nargs="+", help="Open-loop arrival rates (req/s) to step through")
+    parser.add_argument("--endpoint", choices=("query", "stream"), default="query")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the first level")
+    parser.add_argument("--timeout", type=float, default=130.0, help="Client timeout per request")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Open-loop client threads")
+    parser.add_argument("--slo-p95-ms", type=float, default=0.0, help="p95 above this saturates (0: no SLO)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-gain", type=float, default=0.1,
+                        help="Relative throughput gain below which a level counts as saturated")
+    parser.add_argument("--keep-going", action="store_true", help="Run every level even after saturation")
+    parser.add_argument("--subject", action="append", help="Subject to query (default: all of /subjects)")
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Keep the app's answer cache enabled (disabled by default)")
+    parser.add_argument("--seed", type=int, default=None)
+    app = parser.add_argument_group("app")
+    app.add_argument("--procfile", default=os.path.join(REPO_ROOT, "Procfile"))
+    app.add_argument("--workers", type=int, help="Override the Procfile's --workers")
+    app.add_argument("--threads", type=int, help="Override the Procfile's --threads")
+    app.add_argument("--port", type=int, default=0)
+    app.add_argument("--gunicorn-args", default="", help="Extra gunicorn arguments, e.g. '-c gunicorn.conf.py'")
+    app.add_argument("--app-url", help="Test an already running app instead (no RSS sampling)")
+    app.add_argument("--startup-timeout", type=float, default=180.0)
+    app.add_argument("--rss-interval", type=float, default=0.5)
+    app.add_argument("--log", help="gunicorn log file (default: a temporary file)")
+    llm = parser.add_argument_group("fake Gemini")
+    llm.add_argument("--llm-url", help="Use a running Gemini-compatible service instead of the built-in fake")
+    add_latency_arguments(llm)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    if not args.concurrency and not args.rates:
+        args.concurrency = [1, 2, 4, 8, 16, 32]
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Memory/recall report for quantized vector storage.
+
+Builds each storage type from ann_index on the same vectors and reports
+bytes per vector held in memory, index load time, recall@k against exact
+float32 search and p50 single-query latency. Types listed with --rerank
+are also measured with exact re-ranking of rerank * k candidates against
+memory-mapped float32 vectors, which live on disk (4 * d bytes per vector)
+rather than in the index.
+
+Usage:
+    python -m benchmarks.quantization --n 50000 --k 5
+    python -m benchmarks.quantization --index faiss_index/computer_network_latest
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index import QUANTIZED_TYPES, build_index, search_reranked  # noqa: E402
+from benchmarks.ann_benchmark import synthetic_vectors, load_index_vectors, percentile_ms, recall_at_k  # noqa: E402
+
+STORAGE_TYPES = ("flat",) + QUANTIZED_TYPES
+
+
+def time_load(path: str, repeat: int = 5) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        faiss.read_index(path)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def search_all(index, queries: np.ndarray, k: int, vectors=None, rerank: int = 0):
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = search_reranked(index, query.reshape(1, -1), k, vectors, rerank)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return np.array(found), latencies
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, k: int, index_types, rerank: int, workdir: str) -> dict:
+    n, d = vectors.shape
+    vectors_path = os.path.join(workdir, "vectors.npy")
+    np.save(vectors_path, vectors)
+    rerank_vectors = np.load(vectors_path, mmap_mode="r")
+    report = {"n": int(n), "d": int(d), "queries": int(len(queries)), "k": k, "rerank": rerank, "results": {}}
+
+    truth = None
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        index = build_index(vectors, index_type)
+        path = os.path.join(workdir, f"{index_type}.faiss")
+        faiss.write_index(index, path)
+        variants = [(index_type, 0)]
+        if rerank > 1 and index_type != "flat":
+            variants.append((f"{index_type}+rerank{rerank}", rerank))
+        for name, factor in variants:
+            found, latencies = search_all(index, queries, k, rerank_vectors if factor else None, factor)
+            if truth is None:
+                truth = found
+            result = {
+                "bytes_per_vector": round(os.path.getsize(path) / n, 2),
+                "load_ms": round(time_load(path) * 1000, 3),
+                "recall_at_k": round(recall_at_k(truth, found), 4),
+                "p50_ms": round(percentile_ms(latencies, 50), 4),
+            }
+            if factor:
+                result["disk_bytes_per_vector"] = 4 * d
+            report["results"][name] = result
+            print(f"{name:>14}: {result['bytes_per_vector']:.1f} B/vec recall@{k}={result['recall_at_k']:.3f} "
+                  f"load={result['load_ms']:.2f}ms p50={result['p50_ms']:.3f}ms", file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Use the vectors of an existing index directory or subject")
+    parser.add_argument("--n", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", choices=STORAGE_TYPES, default=list(STORAGE_TYPES))
+    parser.add_argument("--rerank", type=int, default=4, help="Re-ranking factor to report (0 to skip)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors = load_index_vectors(args.index).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.n)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = (queries + 0.05 * rng.standard_normal(queries.shape)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory(prefix="quantization-") as workdir:
+        report = run(vectors, queries, args.k, args.types, args.rerank, workdir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
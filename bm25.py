@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+POSTINGS_FILE = "bm25.npz"
+VOCAB_FILE = "bm25_vocab.json"
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a compact, array-backed inverted index.
+
+    Postings are stored term-major in flat numpy arrays: the postings of
+    term ``t`` are ``doc_ids[offsets[t]:offsets[t + 1]]`` with matching
+    term frequencies in ``tfs``. Document ids are positions in the FAISS
+    index built from the same chunks, so results can be fused directly.
+    """
+
+    def __init__(self, vocab: dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = max(float(doc_lengths.mean()), 1.0) if len(doc_lengths) else 1.0
+
+    @classmethod
+    def build(cls, texts) -> "BM25Index":
+        """
+        Build an index over texts; the i-th text gets document id i.
+
+        Args:
+            texts: Iterable of chunk texts in FAISS position order
+
+        Returns:
+            BM25Index
+        """
+        vocab = {}
+        term_ids, doc_ids, tfs, doc_lengths = [], [], [], []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        # Stable sort keeps each term's postings in ascending document order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+        return cls(
+            vocab,
+            offsets,
+            np.asarray(doc_ids, dtype=np.int32)[order],
+            np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)[order],
+            np.asarray(doc_lengths, dtype=np.int32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate footprint: postings arrays plus vocabulary strings."""
+        arrays = self.offsets.nbytes + self.doc_ids.nbytes + self.tfs.nbytes + self.doc_lengths.nbytes
+        return arrays + sum(len(term) + 8 for term in self.vocab)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[int, float]]:
+        """
+        Score all documents containing any query term.
+
+        Args:
+            query: Query text
+            k: Number of results
+
+        Returns:
+            list: (document id, score) pairs, best first
+        """
+        n = len(self.doc_lengths)
+        if n == 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in matched]
+
+    def save(self, directory: str) -> None:
+        np.savez(os.path.join(directory, POSTINGS_FILE), offsets=self.offsets, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_lengths=self.doc_lengths)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(directory, VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "terms": terms}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index | None":
+        """Load the index saved in directory, or None if there is none."""
+        postings_path = os.path.join(directory, POSTINGS_FILE)
+        vocab_path = os.path.join(directory, VOCAB_FILE)
+        if not (os.path.exists(postings_path) and os.path.exists(vocab_path)):
+            return None
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(postings_path) as arrays:
+            return cls(
+                {term: i for i, term in enumerate(meta["terms"])},
+                arrays["offsets"], arrays["doc_ids"], arrays["tfs"], arrays["doc_lengths"],
+                k1=meta["k1"], b=meta["b"],
+            )
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list[tuple[int, float]]:
+    """
+    Merge ranked lists of ids by reciprocal rank fusion.
+
+    Args:
+        rankings: Iterable of id lists, best first
+        k: RRF damping constant
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda pair: (-pair[1], pair[0]))
+
+
+if __name__ == "__main__":
+    # Build the keyword index for indexes created before preprocess.py wrote one:
+    #   python bm25.py <subject or index directory> [...]
+    import sys
+    from index_registry import resolve_index_dir
+    from chunk_store import open_docstore
+
+    for path in sys.argv[1:]:
+        if not os.path.exists(os.path.join(path, "index.faiss")):
+            path = resolve_index_dir(path) or path
+        docstore, index_to_docstore_id = open_docstore(path)
+        index = BM25Index.build(
+            docstore.search(index_to_docstore_id[i]).page_content for i in range(len(index_to_docstore_id))
+        )
+        index.save(path)
+        print(f"{path}: {len(index.vocab)} terms, {len(index.doc_ids)} postings, {index.nbytes / 1024:.0f} KiB")
@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import mmap
+import uuid
+import pickle
+from collections.abc import Mapping
+import numpy as np
+
+# On-disk layout of a chunk store named <prefix> (all files side by side):
+#   <prefix>.json          header: format version, count, metadata columns and
+#                          the <data> name of the files below, <prefix>.<token>
+#   <data>.blob            chunk texts, UTF-8, concatenated
+#   <data>.offsets.npy     int64[count + 1], byte offset of each text in the blob
+#   <data>.ids.npy         chunk ids in row order (fixed-width bytes)
+#   <data>.sorted_ids.npy, <data>.order.npy
+#                          ids sorted, and their rows, for lookup by id
+#   <data>.meta.npy        int64[count, columns], one cell per metadata value
+# Everything except the header is memory-mapped, so opening a store costs
+# the same for ten chunks or a million and a lookup touches a few pages.
+# Each write uses a new token and data files are never modified, so
+# replacing the header swaps the whole store at once. Version 1 stores
+# (no token; data files named <prefix>.blob etc.) are still readable.
+CHUNK_STORE_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+DEFAULT_PREFIX = "chunks"
+ARRAY_SUFFIXES = ("offsets", "ids", "sorted_ids", "order", "meta")
+# Integer cell meaning "this chunk has no value for the column"
+MISSING = np.iinfo(np.int64).min
+
+
+class ReadOnlyDocstoreError(TypeError):
+    """Raised on attempts to modify a ChunkDocstore; chunk stores are rewritten, never edited."""
+
+
+def _path(directory: str, prefix: str, suffix: str) -> str:
+    return os.path.join(directory, f"{prefix}.{suffix}")
+
+
+def has_chunk_store(directory: str, prefix: str = DEFAULT_PREFIX) -> bool:
+    return os.path.exists(_path(directory, prefix, "json"))
+
+
+def _read_header(directory: str, prefix: str) -> dict | None:
+    try:
+        with open(_path(directory, prefix, "json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _data_files(data: str) -> tuple[str, ...]:
+    return (f"{data}.blob",) + tuple(f"{data}.{suffix}.npy" for suffix in ARRAY_SUFFIXES)
+
+
+def remove_stale_files(directory: str, prefix: str = DEFAULT_PREFIX) -> list[str]:
+    """
+    Delete data files of earlier writes of a chunk store.
+
+    Files still mapped by an open ChunkStore cannot be deleted on Windows;
+    those are left for the next call.
+
+    Returns:
+        list: Names of the deleted files
+    """
+    header = _read_header(directory, prefix)
+    if header is None:
+        return []
+    current = set(_data_files(header.get("data", prefix)))
+    pattern = re.compile(rf"{re.escape(prefix)}(\.[0-9a-f]{{32}})?\.(blob|({'|'.join(ARRAY_SUFFIXES)})\.npy)")
+    deleted = []
+    for name in os.listdir(directory):
+        if name not in current and pattern.fullmatch(name):
+            try:
+                os.remove(os.path.join(directory, name))
+                deleted.append(name)
+            except OSError:
+                pass
+    return deleted
+
+
+def _encode_columns(metadatas: list[dict]) -> tuple[list[dict], np.ndarray]:
+    """
+    Encode metadata dicts as a table.
+
+    Integer columns (page, start_index) are stored inline; any other
+    column is dictionary-encoded, storing each distinct JSON value once
+    (a source path shared by hundreds of chunks costs one string).
+    """
+    names = []
+    for metadata in metadatas:
+        for name in metadata:
+            if name not in names:
+                names.append(name)
+    columns = []
+    table = np.full((len(metadatas), len(names)), MISSING, dtype=np.int64)
+    for c, name in enumerate(names):
+        present = [(row, metadata[name]) for row, metadata in enumerate(metadatas) if name in metadata]
+        if all(isinstance(value, int) and not isinstance(value, bool) and value != MISSING for _, value in present):
+            columns.append({"name": name, "kind": "int"})
+            for row, value in present:
+                table[row, c] = value
+        else:
+            values, codes = [], {}
+            for row, value in present:
+                key = json.dumps(value, sort_keys=True)
+                if key not in codes:
+                    codes[key] = len(values)
+                    values.append(value)
+                table[row, c] = codes[key]
+            columns.append({"name": name, "kind": "values", "values": values})
+    return columns, table
+
+
+def write_chunk_store(directory: str, ids, texts, metadatas, prefix: str = DEFAULT_PREFIX) -> int:
+    """
+    Write chunks as a chunk store.
+
+    The data files get names of their own for this write and the header
+    naming them is renamed into place last, so a reader opens either the
+    previous store or the new one, never a mix. Data files of earlier
+    writes are then deleted where possible (see remove_stale_files).
+
+    Args:
+        directory: Destination directory
+        ids: Chunk ids, in row (FAISS position) order
+        texts: Chunk texts, same order
+        metadatas: Chunk metadata dicts, same order
+        prefix: File name prefix
+
+    Returns:
+        int: Number of chunks written
+    """
+    os.makedirs(directory, exist_ok=True)
+    ids = [str(chunk_id) for chunk_id in ids]
+    metadatas = [dict(metadata or {}) for metadata in metadatas]
+    data_name = f"{prefix}.{uuid.uuid4().hex}"
+
+    offsets = [0]
+    with open(_path(directory, data_name, "blob"), "wb") as f:
+        for text in texts:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    if len(offsets) - 1 != len(ids) or len(ids) != len(metadatas):
+        os.remove(_path(directory, data_name, "blob"))
+        raise ValueError("ids, texts and metadatas must have the same length")
+
+    encoded_ids = np.array([chunk_id.encode("utf-8") for chunk_id in ids],
+                           dtype=f"S{max([len(i.encode('utf-8')) for i in ids] + [1])}")
+    order = np.argsort(encoded_ids, kind="stable").astype(np.int64)
+    columns, table = _encode_columns(metadatas)
+    arrays = {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "ids": encoded_ids,
+        "sorted_ids": encoded_ids[order],
+        "order": order,
+        "meta": table,
+    }
+    for suffix, array in arrays.items():
+        with open(_path(directory, data_name, suffix + ".npy"), "wb") as f:
+            np.save(f, array)
+
+    header = {"version": CHUNK_STORE_VERSION, "count": len(ids), "columns": columns, "data": data_name}
+    tmp = _path(directory, prefix, "json") + f".tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(tmp, _path(directory, prefix, "json"))
+    remove_stale_files(directory, prefix)
+    return len(ids)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a chunk store written by write_chunk_store.
+
+    Texts and metadata are decoded per chunk on access; nothing is loaded
+    up front beyond the JSON header.
+    """
+
+    def __init__(self, directory: str, prefix: str = DEFAULT_PREFIX):
+        self.directory = directory
+        self.prefix = prefix
+        for attempt in range(3):
+            header = _read_header(directory, prefix)
+            if header is None:
+                raise FileNotFoundError(_path(directory, prefix, "json"))
+            try:
+                self._open(header)
+                return
+            except FileNotFoundError:
+                # A writer replaced the store and deleted these files after we read the header
+                if attempt == 2:
+                    raise
+
+    def _open(self, header: dict) -> None:
+        if header.get("version") not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported chunk store version {header.get('version')} in {self.directory}")
+        directory, data = self.directory, header.get("data", self.prefix)
+        self.count = header["count"]
+        self.columns = header["columns"]
+        arrays = {suffix: np.load(_path(directory, data, f"{suffix}.npy"), mmap_mode="r")
+                  for suffix in ARRAY_SUFFIXES}
+        self.offsets = arrays["offsets"]
+        self.ids = arrays["ids"]
+        self.sorted_ids = arrays["sorted_ids"]
+        self.order = arrays["order"]
+        self.meta = arrays["meta"]
+        with open(_path(directory, data, "blob"), "rb") as f:
+            # mmap cannot map an empty file
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        # Size of the mapped files, recorded now so it stays readable after close()
+        self.nbytes = len(self.blob) + sum(array.nbytes for array in arrays.values())
+
+    def close(self) -> None:
+        """Release the memory maps, e.g. before the files are replaced (required on Windows)."""
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.blob = b""
+        self.offsets = self.ids = self.sorted_ids = self.order = self.meta = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def text(self, row: int) -> str:
+        return self.blob[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+
+    def metadata(self, row: int) -> dict:
+        metadata = {}
+        for c, column in enumerate(self.columns):
+            cell = int(self.meta[row, c])
+            if cell == MISSING:
+                continue
+            metadata[column["name"]] = cell if column["kind"] == "int" else column["values"][cell]
+        return metadata
+
+    def id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def row_of(self, chunk_id: str) -> int | None:
+        """Row of a chunk id by binary search over the sorted ids, or None."""
+        key = np.array(chunk_id.encode("utf-8"), dtype=self.sorted_ids.dtype)
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < self.count and self.sorted_ids[i] == chunk_id.encode("utf-8"):
+            return int(self.order[i])
+        return None
+
+    def document(self, row: int):
+        from langchain_core.documents import Document
+        return Document(page_content=self.text(row), metadata=self.metadata(row), id=self.id(row))
+
+
+class ChunkDocstore:
+    """
+    LangChain docstore backed by a ChunkStore; rows are FAISS positions.
+
+    Only search() is supported: stores are written once by preprocess.py
+    and never modified in place.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def search(self, search: str):
+        row = self.store.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.store.document(row)
+
+    def document_at(self, position: int):
+        """Document at a FAISS position, without the id lookup."""
+        return self.store.document(position)
+
+    def add(self, texts: dict) -> None:
+        raise ReadOnlyDocstoreError("ChunkDocstore is read-only; rebuild the index with preprocess.py")
+
+    def delete(self, ids: list) -> None:
+        raise ReadOnlyDocstoreError("ChunkDocstore is read-only; rebuild the index with preprocess.py")
+
+
+class ChunkIdMap(Mapping):
+    """FAISS position -> chunk id, read lazily from a ChunkStore (LangChain's index_to_docstore_id)."""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self.store):
+            raise KeyError(position)
+        return self.store.id(position)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(range(len(self.store)))
+
+
+def open_docstore(directory: str):
+    """
+    Open the docstore of an index directory.
+
+    Reads the chunk store if there is one and falls back to a pickled
+    LangChain docstore (index.pkl) for indexes not yet converted.
+
+    Returns:
+        tuple: (docstore, index_to_docstore_id)
+    """
+    if has_chunk_store(directory):
+        store = ChunkStore(directory)
+        return ChunkDocstore(store), ChunkIdMap(store)
+    with open(os.path.join(directory, "index.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+def write_docstore(directory: str, docstore, index_to_docstore_id) -> int:
+    """Write a LangChain docstore as a chunk store, rows in FAISS position order."""
+    ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+    documents = [docstore.search(chunk_id) for chunk_id in ids]
+    return write_chunk_store(directory, ids, (doc.page_content for doc in documents),
+                             [doc.metadata for doc in documents])
+
+
+def convert_index_dir(directory: str, remove_pickle: bool = False) -> bool:
+    """
+    Convert an index directory from index.pkl to a chunk store.
+
+    Args:
+        directory: Directory containing index.pkl
+        remove_pickle: Delete index.pkl once the chunk store is written and verified
+            (also for directories converted earlier)
+
+    Returns:
+        bool: True if a chunk store was written
+    """
+    pickle_path = os.path.join(directory, "index.pkl")
+    if not os.path.exists(pickle_path):
+        return False
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    written = not has_chunk_store(directory)
+    if written:
+        write_docstore(directory, docstore, index_to_docstore_id)
+    store = ChunkStore(directory)
+    if len(store) != len(index_to_docstore_id):
+        raise ValueError(f"Chunk store in {directory} has {len(store)} chunks, index.pkl {len(index_to_docstore_id)}")
+    for position in range(len(store)):
+        expected = docstore.search(index_to_docstore_id[position])
+        if store.id(position) != index_to_docstore_id[position] or store.text(position) != expected.page_content \
+                or store.metadata(position) != expected.metadata:
+            raise ValueError(f"Chunk store in {directory} does not match index.pkl at position {position}")
+    if remove_pickle:
+        os.remove(pickle_path)
+    return written
+
+
+def convert_texts_pickle(texts_path: str, directory: str, prefix: str, remove_pickle: bool = False) -> bool:
+    """Convert a VectorStore texts pickle (a list of strings) to a chunk store."""
+    if not os.path.exists(texts_path):
+        return False
+    written = not has_chunk_store(directory, prefix)
+    if written:
+        with open(texts_path, "rb") as f:
+            texts = pickle.load(f)
+        write_chunk_store(directory, [str(i) for i in range(len(texts))], texts, [{}] * len(texts), prefix)
+    if remove_pickle:
+        os.remove(texts_path)
+    return written
+
+
+if __name__ == "__main__":
+    # Migrate existing indexes to chunk stores:
+    #   python chunk_store.py [faiss_index] [--vector-store-dir data/indices] [--remove-pickles]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert index.pkl docstores and VectorStore text pickles to chunk stores.")
+    parser.add_argument("index_dir", nargs="?", default="faiss_index")
+    parser.add_argument("--vector-store-dir", default="data/indices",
+                        help="Directory of src VectorStore indexes (<subject>_texts.pkl)")
+    parser.add_argument("--remove-pickles", action="store_true",
+                        help="Delete each pickle once its chunk store is written and verified")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.index_dir):
+        for name in sorted(os.listdir(args.index_dir)):
+            path = os.path.join(args.index_dir, name)
+            if os.path.isdir(path) and convert_index_dir(path, args.remove_pickles):
+                print(f"Converted {path}: {len(ChunkStore(path))} chunks")
+    if os.path.isdir(args.vector_store_dir):
+        for name in sorted(os.listdir(args.vector_store_dir)):
+            if name.endswith("_texts.pkl"):
+                subject = name[:-len("_texts.pkl")]
+                if convert_texts_pickle(os.path.join(args.vector_store_dir, name), args.vector_store_dir,
+                                        f"{subject}.chunks", args.remove_pickles):
+                    print(f"Converted {os.path.join(args.vector_store_dir, name)}")
@@ -0,0 +1,125 @@
+from typing import Iterator
+
+# A sentence (or paragraph) ends where one of these is found; str.find/rfind
+# over a small window beats scanning the whole text with a regex
+SENTENCE_ENDS = (". ", ".\n", "? ", "?\n", "! ", "!\n", "\n\n")
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+
+def _skip_space(text: str, pos: int, end: int) -> int:
+    while pos < end and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _trim_space(text: str, start: int, end: int) -> int:
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return end
+
+
+def _last_sentence_start(text: str, low: int, high: int) -> int:
+    """Offset just after the last sentence end in text[low:high], or -1."""
+    best = -1
+    for separator in SENTENCE_ENDS:
+        i = text.rfind(separator, low, high)
+        if i >= 0 and i + len(separator) > best:
+            best = i + len(separator)
+    return best
+
+
+def _first_sentence_start(text: str, low: int, high: int) -> int:
+    """Offset just after the first sentence end in text[low:high], or -1."""
+    best = -1
+    for separator in SENTENCE_ENDS:
+        i = text.find(separator, low, high)
+        if i >= 0 and (best < 0 or i + len(separator) < best):
+            best = i + len(separator)
+    return best
+
+
+def iter_chunks(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+                start: int = 0, end: int | None = None) -> Iterator[tuple[int, int]]:
+    """
+    Yield (start, end) offsets of overlapping chunks of text[start:end].
+
+    Chunks are at most chunk_size characters and end at the last sentence
+    boundary that leaves the chunk at least half full, else at the last
+    space, else mid-word. Each chunk after the first starts at the first
+    sentence within chunk_overlap characters of the previous chunk's end
+    (else at a word), so overlaps never begin mid-sentence when avoidable.
+    Only offsets are produced; the text is never copied.
+
+    Args:
+        text: Source text
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Target overlap between consecutive chunks in characters
+        start: Offset where chunking starts (e.g. a page start)
+        end: Offset where chunking stops (default: end of text)
+
+    Yields:
+        tuple: (start, end) offsets into text, with surrounding whitespace excluded
+    """
+    end = len(text) if end is None else end
+    min_length = chunk_size // 2
+    pos = _skip_space(text, start, end)
+    while pos < end:
+        limit = pos + chunk_size
+        if limit >= end:
+            cut = end
+        else:
+            cut = _last_sentence_start(text, pos + min_length, limit)
+            if cut < 0:
+                space = max(text.rfind(" ", pos + min_length, limit), text.rfind("\n", pos + min_length, limit))
+                cut = space + 1 if space >= 0 else limit
+
+        chunk_end = _trim_space(text, pos, cut)
+        if chunk_end > pos:
+            yield pos, chunk_end
+        if cut >= end:
+            break
+
+        target = max(pos + 1, chunk_end - chunk_overlap)
+        next_pos = cut
+        if chunk_overlap > 0:
+            # Search only the chunk's own text: a sentence end in the trailing
+            # whitespace (e.g. before a paragraph break) would give no overlap
+            next_pos = _first_sentence_start(text, target, chunk_end)
+            if next_pos < 0 or next_pos >= chunk_end:
+                space = text.find(" ", target, chunk_end)
+                next_pos = space + 1 if space >= 0 else target
+        pos = _skip_space(text, next_pos, end)
+
+
+def split_text(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> list[str]:
+    """Split text into chunk strings with iter_chunks."""
+    return [text[start:end] for start, end in iter_chunks(text, chunk_size, chunk_overlap)]
+
+
+def split_documents(documents, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> list:
+    """
+    Split LangChain documents into chunk documents.
+
+    Chunks never span documents, so loaders that return one document per
+    page get page-aligned chunks. Each chunk keeps its document's metadata
+    (including "page") and records its offset in it as "start_index".
+
+    Args:
+        documents: Documents to split
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Target overlap between consecutive chunks in characters
+
+    Returns:
+        list: Chunk documents, in order
+    """
+    from langchain_core.documents import Document
+    chunks = []
+    for document in documents:
+        text = document.page_content
+        for start, end in iter_chunks(text, chunk_size, chunk_overlap):
+            chunks.append(Document(page_content=text[start:end], metadata={**document.metadata, "start_index": start}))
+    return chunks
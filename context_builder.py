@@ -0,0 +1,166 @@
+import math
+import numpy as np
+
+SEPARATOR = "\n\n"
+# Overlaps shorter than this are treated as coincidence when chunks carry no offsets
+MIN_TEXT_OVERLAP = 50
+MAX_TEXT_OVERLAP = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English prose (~4 characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def mmr(query_vector, vectors: np.ndarray, k: int, lambda_mult: float = 0.5) -> list[int]:
+    """
+    Select k rows by maximal marginal relevance.
+
+    Each step picks the candidate maximizing
+    ``lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, selected)``,
+    trading relevance for novelty.
+
+    Args:
+        query_vector: Query embedding
+        vectors: Candidate embeddings, one per row
+        k: Number of rows to select
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        list: Selected row indices, in selection order
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = vectors @ query
+    selected = [int(np.argmax(relevance))]
+    redundancy = vectors @ vectors[selected[0]]
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return selected
+
+
+def text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if under MIN_TEXT_OVERLAP)."""
+    for size in range(min(len(first), len(second), MAX_TEXT_OVERLAP), MIN_TEXT_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def merge_overlapping(docs) -> list[tuple[str, list[int]]]:
+    """
+    Merge chunks of the same source whose text overlaps.
+
+    Chunks with a ``start_index`` (preprocess.py records it) are merged by
+    offset; older chunks without one are merged when one ends with the
+    start of the other.
+
+    Args:
+        docs: Documents in relevance order
+
+    Returns:
+        list: (text, indices into docs) pieces, ordered by their best-ranked chunk
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("subject"), doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append(rank)
+
+    pieces = []
+    for ranks in groups.values():
+        with_offsets = sorted((r for r in ranks if docs[r].metadata.get("start_index") is not None),
+                              key=lambda r: docs[r].metadata["start_index"])
+        current = None  # [text, start, end, ranks]
+        for rank in with_offsets:
+            text, start = docs[rank].page_content, docs[rank].metadata["start_index"]
+            if current is not None and start <= current[2]:
+                current[0] += text[current[2] - start:]
+                current[2] = max(current[2], start + len(text))
+                current[3].append(rank)
+            else:
+                if current is not None:
+                    pieces.append((current[0], current[3]))
+                current = [text, start, start + len(text), [rank]]
+        if current is not None:
+            pieces.append((current[0], current[3]))
+
+        # Chunks without offsets only merge with each other, and only within this group
+        legacy = []
+        for rank in (r for r in ranks if docs[r].metadata.get("start_index") is None):
+            text = docs[rank].page_content
+            for i, (piece, piece_ranks) in enumerate(legacy):
+                if (size := text_overlap(piece, text)):
+                    legacy[i] = (piece + text[size:], piece_ranks + [rank])
+                    break
+                if (size := text_overlap(text, piece)):
+                    legacy[i] = (text + piece[size:], piece_ranks + [rank])
+                    break
+            else:
+                legacy.append((text, [rank]))
+        pieces.extend(legacy)
+    return sorted(pieces, key=lambda piece: min(piece[1]))
+
+
+def pack(pieces: list[str], budget_tokens: int) -> list[str]:
+    """
+    Keep pieces, in order, that fit within a token budget.
+
+    Pieces that do not fit are skipped so smaller later ones can still be
+    used; if not even the first fits, it is truncated to the budget.
+    """
+    packed, used = [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece) + (estimate_tokens(SEPARATOR) if packed else 0)
+        if used + tokens <= budget_tokens:
+            packed.append(piece)
+            used += tokens
+        elif not packed:
+            packed.append(piece[:budget_tokens * 4])
+            used = budget_tokens
+    return packed
+
+
+def assemble_context(query_vector, candidates, k: int = 5, lambda_mult: float = 0.5,
+                     budget_tokens: int = 1500) -> tuple[list, str, dict]:
+    """
+    Turn retrieval candidates into a de-duplicated, budgeted prompt context.
+
+    Args:
+        query_vector: Query embedding
+        candidates: (document, score, vector or None) triples in relevance order
+        k: Chunks to select with MMR
+        lambda_mult: MMR relevance/diversity trade-off
+        budget_tokens: Maximum estimated tokens of context
+
+    Returns:
+        tuple: (selected documents in relevance order, context text, stats)
+    """
+    vectors = [vector for _, _, vector in candidates]
+    if all(vector is not None for vector in vectors):
+        order = mmr(query_vector, np.vstack(vectors), k, lambda_mult)
+        # Present the chosen chunks in retrieval order
+        selected = [candidates[i][0] for i in sorted(order)]
+    else:
+        # Without vectors (e.g. IVF indexes without a direct map) keep the top k
+        selected = [doc for doc, _, _ in candidates[:k]]
+
+    pieces = merge_overlapping(selected)
+    packed = pack([text for text, _ in pieces], budget_tokens)
+    context = SEPARATOR.join(packed)
+    stats = {
+        "candidates": len(candidates),
+        "selected": len(selected),
+        "pieces": len(pieces),
+        "packed": len(packed),
+        "tokens": estimate_tokens(context),
+    }
+    return selected, context, stats
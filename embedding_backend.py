@@ -0,0 +1,86 @@
+import os
+
+EMBEDDING_BACKENDS = ("torch", "int8")
+
+
+def get_backend() -> str:
+    """
+    Return the configured embedding backend.
+
+    EMBEDDING_BACKEND selects "torch" (fp32, the default) or "int8", which
+    applies PyTorch dynamic int8 quantization to the model's Linear layers
+    for faster CPU inference.
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return backend
+
+
+def configure_threads() -> None:
+    """Pin torch's intra-op thread pool to EMBEDDING_THREADS, if set."""
+    threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def quantize_model(model):
+    """
+    Apply dynamic int8 quantization to the Linear layers of a SentenceTransformer, in place.
+
+    Weights are stored as int8 and activations are quantized on the fly, so
+    no calibration data is needed. Only CPU inference is supported.
+
+    Args:
+        model: SentenceTransformer (or any torch module)
+
+    Returns:
+        The quantized model
+    """
+    import torch
+    model.to("cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def apply_backend(model, backend: str | None = None):
+    """Configure threads and apply the given (default: configured) backend to a SentenceTransformer."""
+    backend = backend or get_backend()
+    configure_threads()
+    if backend == "int8":
+        quantize_model(model)
+    return model
+
+
+def load_sentence_transformer(model_name: str, backend: str | None = None):
+    """
+    Load a SentenceTransformer with the configured backend applied.
+
+    Args:
+        model_name: Model name or local path
+        backend: Override for EMBEDDING_BACKEND
+
+    Returns:
+        SentenceTransformer
+    """
+    from sentence_transformers import SentenceTransformer
+    return apply_backend(SentenceTransformer(model_name, device="cpu"), backend)
+
+
+def load_embeddings(model_name: str, backend: str | None = None):
+    """
+    Load LangChain HuggingFaceEmbeddings with the configured backend applied.
+
+    Args:
+        model_name: Model name or local path
+        backend: Override for EMBEDDING_BACKEND
+
+    Returns:
+        HuggingFaceEmbeddings
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    # The wrapped SentenceTransformer is "_client" in recent langchain-huggingface, "client" before
+    client = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+    apply_backend(client, backend)
+    return embeddings
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# With PRELOAD_INDEXES=1 the app (and therefore query.warmup) is imported in
+# the master process before forking, so every worker shares the embedding
+# model and the memory-mapped FAISS indexes instead of loading its own copy.
+preload_app = os.getenv("PRELOAD_INDEXES", "0") == "1"
+
+
+def post_fork(server, worker):
+    # The LLM wait queue is sized from the request threads (admission.limiter_settings)
+    os.environ["WEB_THREADS"] = str(server.cfg.threads)
+    query = sys.modules.get("query")
+    if query is not None:
+        # Preloaded, so the limiter was built before --threads was known
+        from admission import limiter_settings
+        settings = limiter_settings(server.cfg.threads)
+        query.llm_limiter.max_concurrent = max(1, settings["max_concurrent"])
+        query.llm_limiter.max_queue = settings["max_queue"]
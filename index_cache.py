@@ -0,0 +1,175 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from admission import SingleFlight
+from metrics import histogram, counter, gauge
+
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+cache_hits = counter("index_cache_requests_total", "load_faiss_database calls", {"result": "hit"})
+cache_misses = counter("index_cache_requests_total", "load_faiss_database calls", {"result": "miss"})
+cache_evictions = counter("index_cache_evictions_total", "Subject indexes evicted to stay within the memory budget")
+index_loads = counter("index_loads_total", "FAISS indexes read from disk", {"result": "loaded"})
+load_seconds = histogram("index_load_seconds", "Time to read a subject index from disk", LOAD_BUCKETS)
+resident_bytes = gauge("index_cache_bytes", "Estimated footprint of the cached subject indexes")
+resident_subjects = gauge("index_cache_subjects", "Subject indexes in the cache")
+
+
+class IndexCache:
+    """
+    Least-recently-used cache of loaded subject indexes under a byte budget.
+
+    Each entry records the footprint its loader reported (vectors, chunk
+    store, BM25 postings). Loaders estimate it from file and array sizes,
+    so the budget is approximate rather than a measured RSS. When an insert takes the total over ``max_bytes``
+    the least recently used subjects are evicted; the newest entry is always
+    kept, even if it alone exceeds the budget. Requests still holding an
+    evicted store finish with it; it is freed when they let go.
+
+    Concurrent misses for the same subject and generation share one load.
+
+    Args:
+        max_bytes: Budget for the summed footprints; 0 disables eviction
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self._entries = OrderedDict()  # subject -> (generation, store, nbytes)
+        self._lock = threading.Lock()
+        self._flights = SingleFlight("index_load")
+
+    def get(self, subject: str, generation: str):
+        """Return the cached store of this generation (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                cache_misses.inc()
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+        cache_hits.inc()
+        return entry[1]
+
+    def peek(self, subject: str):
+        """Return the cached store of any generation, without touching the LRU order or stats."""
+        with self._lock:
+            entry = self._entries.get(subject)
+        return entry[1] if entry is not None else None
+
+    def get_or_load(self, subject: str, generation: str, load):
+        """
+        Return the cached store, loading it once on a miss.
+
+        Args:
+            subject: Name of the subject
+            generation: Current index generation of the subject
+            load: Callable returning (store, footprint in bytes), or None if
+                the index cannot be loaded (nothing is cached then)
+
+        Returns:
+            The store, or None if it is not cached and could not be loaded
+        """
+        store = self.get(subject, generation)
+        if store is None:
+            store, _ = self._flights.do((subject, generation), lambda: self._load(subject, generation, load))
+        return store
+
+    def _load(self, subject: str, generation: str, load):
+        # A load for this generation may have finished between the miss and this flight
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry[0] == generation:
+                return entry[1]
+        start = time.perf_counter()
+        loaded = load()
+        if loaded is None:
+            return None
+        elapsed = time.perf_counter() - start
+        store, nbytes = loaded
+        load_seconds.observe(elapsed)
+        index_loads.inc()
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+        self.put(subject, generation, store, nbytes)
+        return store
+
+    def put(self, subject: str, generation: str, store, nbytes: int) -> None:
+        """Insert or replace a subject's store, then evict down to the budget."""
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(subject, None)
+            if previous is not None:
+                self.nbytes -= previous[2]
+            self._entries[subject] = (generation, store, nbytes)
+            self.nbytes += nbytes
+            while self.max_bytes and self.nbytes > self.max_bytes and len(self._entries) > 1:
+                victim, (_, _, victim_bytes) = self._entries.popitem(last=False)
+                self.nbytes -= victim_bytes
+                self.evictions += 1
+                evicted.append((victim, victim_bytes))
+            self._update_gauges()
+        for victim, victim_bytes in evicted:
+            cache_evictions.inc()
+            print(f"Evicted FAISS database for subject {victim} ({victim_bytes / 2**20:.1f} MiB) "
+                  f"to stay within the {self.max_bytes / 2**20:.1f} MiB index cache budget")
+
+    def pop(self, subject: str, default=None):
+        """Drop a subject from the cache, returning its store."""
+        with self._lock:
+            entry = self._entries.pop(subject, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+            self._update_gauges()
+        return entry[1] if entry is not None else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self._update_gauges()
+
+    def full(self) -> bool:
+        """True once the budget is used up (never without a budget)."""
+        return bool(self.max_bytes) and self.nbytes >= self.max_bytes
+
+    def __contains__(self, subject: str) -> bool:
+        return subject in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subjects": {subject: nbytes for subject, (_, _, nbytes) in self._entries.items()},
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "load_seconds": round(self.load_seconds, 3),
+            }
+
+    def _update_gauges(self) -> None:
+        resident_bytes.set(self.nbytes)
+        resident_subjects.set(len(self._entries))
+
+
+def cache_from_env() -> IndexCache:
+    """
+    IndexCache with a budget of INDEX_CACHE_MAX_MB MiB (default 256; 0 for no limit).
+
+    The budget is checked against estimated footprints (see query.store_nbytes),
+    so actual memory use can differ somewhat from it.
+    """
+    return IndexCache(int(float(os.getenv("INDEX_CACHE_MAX_MB", "256")) * 2**20))
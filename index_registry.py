@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import time
+import shutil
+
+# Each subject's published index is named by a pointer file inside
+# "<subject>_latest". Publishing writes a new "<subject>_v<hash>" directory
+# and then atomically replaces the pointer, so readers either see the old
+# version or the new one, never a half-copied directory.
+POINTER_FILE = "CURRENT.json"
+LEGACY_FILES = ("index.faiss", "index.pkl", "manifest.json")
+
+
+def latest_dir(subject: str, index_dir: str = "faiss_index") -> str:
+    return os.path.join(index_dir, f"{subject}_latest")
+
+
+def read_pointer(subject: str, index_dir: str = "faiss_index") -> dict | None:
+    """
+    Read the pointer naming the subject's current index version.
+
+    Args:
+        subject: Name of the subject
+        index_dir: Directory where indices are stored
+
+    Returns:
+        dict: Pointer with "version", "generation" and "published_at", or None
+    """
+    pointer_path = os.path.join(latest_dir(subject, index_dir), POINTER_FILE)
+    try:
+        with open(pointer_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Could not read index pointer {pointer_path}: {str(e)}")
+        return None
+
+
+def resolve_index_dir(subject: str, index_dir: str = "faiss_index") -> str | None:
+    """
+    Return the directory holding the subject's current index files.
+
+    Falls back to the pre-pointer layout where the index files were copied
+    straight into "<subject>_latest".
+
+    Args:
+        subject: Name of the subject
+        index_dir: Directory where indices are stored
+
+    Returns:
+        str: Index directory, or None if the subject has no published index
+    """
+    pointer = read_pointer(subject, index_dir)
+    if pointer is not None:
+        version_dir = os.path.join(index_dir, pointer["version"])
+        if os.path.isdir(version_dir):
+            return version_dir
+    legacy_dir = latest_dir(subject, index_dir)
+    if os.path.exists(os.path.join(legacy_dir, "index.faiss")):
+        return legacy_dir
+    return None
+
+
+def get_generation(subject: str, index_dir: str = "faiss_index") -> str:
+    """
+    Return a token that changes whenever the subject's index is republished.
+
+    This is a single stat() of the pointer file, cheap enough to call on
+    every request. os.replace() gives the pointer a new inode on each
+    publish, so the token changes even within the mtime resolution.
+
+    Args:
+        subject: Name of the subject
+        index_dir: Directory where indices are stored
+
+    Returns:
+        str: Generation token, empty if the index does not exist
+    """
+    subject_dir = latest_dir(subject, index_dir)
+    for name in (POINTER_FILE, "index.faiss"):
+        try:
+            stat = os.stat(os.path.join(subject_dir, name))
+            return f"{stat.st_ino}:{stat.st_mtime_ns}"
+        except OSError:
+            continue
+    return ""
+
+
+def publish_version(subject: str, version: str, index_dir: str = "faiss_index") -> dict:
+    """
+    Atomically make an index version the subject's current one.
+
+    Args:
+        subject: Name of the subject
+        version: Name of the version directory inside index_dir
+        index_dir: Directory where indices are stored
+
+    Returns:
+        dict: The new pointer
+    """
+    subject_dir = latest_dir(subject, index_dir)
+    os.makedirs(subject_dir, exist_ok=True)
+    previous = read_pointer(subject, index_dir)
+    pointer = {
+        "version": version,
+        "generation": (previous["generation"] + 1) if previous else 1,
+        "published_at": time.time(),
+    }
+
+    pointer_path = os.path.join(subject_dir, POINTER_FILE)
+    tmp_path = f"{pointer_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_path)
+
+    # Index files copied here by older versions of preprocess.py are now shadowed by the pointer
+    for name in LEGACY_FILES:
+        legacy_path = os.path.join(subject_dir, name)
+        if os.path.exists(legacy_path):
+            try:
+                os.remove(legacy_path)
+            except OSError as e:
+                print(f"Warning: Could not remove legacy file {legacy_path}: {str(e)}")
+    return pointer
+
+
+def published_versions(index_dir: str = "faiss_index") -> set[str]:
+    """Return the version directories some subject's pointer currently names."""
+    versions = set()
+    for name in os.listdir(index_dir):
+        if name.endswith("_latest"):
+            pointer = read_pointer(name[:-len("_latest")], index_dir)
+            if pointer and pointer.get("version"):
+                versions.add(pointer["version"])
+    return versions
+
+
+def is_version_of(subject: str, name: str) -> bool:
+    """
+    True if ``name`` is a version directory of exactly this subject.
+
+    Versions are "<subject>_v<md5>", plus "_<index type>" for non-flat
+    indexes, so "computer" does not claim "computer_vision_v...".
+    """
+    return re.fullmatch(rf"{re.escape(subject)}_v[0-9a-f]{{32}}(_[a-z0-9]+)?", name) is not None
+
+
+def gc_versions(subject: str, keep: int = 2, index_dir: str = "faiss_index") -> list[str]:
+    """
+    Delete old index versions of a subject.
+
+    The current version is always kept, along with the newest versions up to
+    ``keep`` in total, so processes still serving the previous version can
+    finish loading it. Directories named by any subject's pointer are never
+    deleted.
+
+    Args:
+        subject: Name of the subject
+        keep: Number of versions to retain, including the current one
+        index_dir: Directory where indices are stored
+
+    Returns:
+        list: Names of the deleted version directories
+    """
+    pointer = read_pointer(subject, index_dir)
+    current = pointer["version"] if pointer else None
+    published = published_versions(index_dir)
+    versions = [
+        name for name in os.listdir(index_dir)
+        if is_version_of(subject, name) and os.path.isdir(os.path.join(index_dir, name))
+    ]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(index_dir, name)), reverse=True)
+
+    retained = [current] if current in versions else []
+    for name in versions:
+        if len(retained) >= max(keep, 1):
+            break
+        if name not in retained:
+            retained.append(name)
+
+    deleted = []
+    for name in versions:
+        if name in retained or name in published:
+            continue
+        try:
+            shutil.rmtree(os.path.join(index_dir, name))
+            deleted.append(name)
+        except OSError as e:
+            # e.g. files still memory-mapped on Windows; retried on the next run
+            print(f"Warning: Could not delete old index {name}: {str(e)}")
+    return deleted
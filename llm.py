@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import random
+import asyncio
+
+
+class GeminiClient:
+    """
+    LLM client backed by the Gemini SDK.
+
+    Args:
+        model_factory: Callable returning a configured genai.GenerativeModel
+    """
+
+    def __init__(self, model_factory):
+        self.model_factory = model_factory
+
+    @staticmethod
+    def _request_options(timeout: float | None) -> dict:
+        return {"timeout": timeout} if timeout else {}
+
+    def generate(self, prompt: str, timeout: float | None = None) -> str:
+        response = self.model_factory().generate_content(prompt, request_options=self._request_options(timeout))
+        return response.text
+
+    async def agenerate(self, prompt: str, timeout: float | None = None) -> str:
+        response = await self.model_factory().generate_content_async(
+            prompt, request_options=self._request_options(timeout)
+        )
+        return response.text
+
+    def stream(self, prompt: str, timeout: float | None = None):
+        """Yield the answer text piece by piece as Gemini produces it."""
+        response = self.model_factory().generate_content(
+            prompt, stream=True, request_options=self._request_options(timeout)
+        )
+        for chunk in response:
+            text = getattr(chunk, "text", "")
+            if text:
+                yield text
+
+
+class GeminiRESTClient:
+    """
+    LLM client speaking the Gemini REST API directly over HTTP.
+
+    Lets the app be pointed at any service that implements generateContent
+    and streamGenerateContent, such as benchmarks/fake_gemini.py in load tests.
+
+    Args:
+        base_url: Service root, e.g. https://generativelanguage.googleapis.com
+        model: Model name used in the request path
+        api_key: Sent as the ``key`` query parameter when set
+    """
+
+    def __init__(self, base_url: str, model: str = "gemini-2.0-flash", api_key: str | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self._session = None
+
+    def _post(self, method: str, prompt: str, timeout: float | None, stream: bool = False, **params):
+        # requests comes in with LangChain; imported here so llm.py stays cheap to import
+        import requests
+        if self._session is None:
+            self._session = requests.Session()
+        if self.api_key:
+            params["key"] = self.api_key
+        try:
+            response = self._session.post(
+                f"{self.base_url}/v1beta/models/{self.model}:{method}",
+                params=params,
+                json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+                timeout=timeout,
+                stream=stream,
+            )
+        except requests.Timeout as e:
+            raise TimeoutError(f"Gemini request exceeded {timeout}s") from e
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _text(payload: dict) -> str:
+        candidates = payload.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    def generate(self, prompt: str, timeout: float | None = None) -> str:
+        return self._text(self._post("generateContent", prompt, timeout).json())
+
+    async def agenerate(self, prompt: str, timeout: float | None = None) -> str:
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def stream(self, prompt: str, timeout: float | None = None):
+        """Yield the answer text from the server-sent events of streamGenerateContent."""
+        response = self._post("streamGenerateContent", prompt, timeout, stream=True, alt="sse")
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    text = self._text(json.loads(line[len("data:"):]))
+                    if text:
+                        yield text
+
+
+class FakeLLMClient:
+    """
+    Local stand-in for Gemini, for tests and load experiments.
+
+    Waits ``latency`` seconds (with +/- ``jitter`` spread) before the first
+    token, then emits the answer word by word at ``tokens_per_second``.
+
+    Args:
+        latency: Seconds until the first token
+        tokens_per_second: Streaming rate after the first token
+        jitter: Relative spread applied to the latency, e.g. 0.2 for +/-20%
+        answer: Fixed answer text; defaults to one that echoes the prompt size
+    """
+
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 50.0,
+                 jitter: float = 0.0, answer: str | None = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.answer = answer
+
+    def generate(self, prompt: str, timeout: float | None = None) -> str:
+        return "".join(self.stream(prompt, timeout))
+
+    async def agenerate(self, prompt: str, timeout: float | None = None) -> str:
+        words = self._answer(prompt).split(" ")
+        duration = self._first_token_delay()
+        if self.tokens_per_second > 0:
+            duration += (len(words) - 1) / self.tokens_per_second
+        if timeout and duration > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"Fake LLM call exceeded {timeout}s")
+        await asyncio.sleep(duration)
+        return " ".join(words)
+
+    def stream(self, prompt: str, timeout: float | None = None):
+        """Like GeminiClient.stream; timeout bounds the wait for the first token."""
+        words = self._answer(prompt).split(" ")
+        delay = self._first_token_delay()
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake LLM call exceeded {timeout}s")
+        time.sleep(delay)
+        for i, word in enumerate(words):
+            if i and self.tokens_per_second > 0:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if i == len(words) - 1 else word + " "
+
+    def _answer(self, prompt: str) -> str:
+        return self.answer or (
+            f"This is a **fake answer** generated locally for a prompt of {len(prompt)} characters."
+        )
+
+    def _first_token_delay(self) -> float:
+        return max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+def fake_client_from_env() -> FakeLLMClient:
+    return FakeLLMClient(
+        latency=float(os.getenv("FAKE_LLM_LATENCY", "0.5")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+        jitter=float(os.getenv("FAKE_LLM_JITTER", "0.0")),
+    )
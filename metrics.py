@@ -0,0 +1,234 @@
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket upper bounds."""
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS, labels: dict | None = None):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.labels = _label_key(labels)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+    def samples(self) -> list[str]:
+        """Prometheus text exposition lines for this histogram."""
+        snapshot = self.snapshot()
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labels, (('le', _format_value(bound)),))} {count}"
+            for bound, count in snapshot["buckets"]
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {_format_value(snapshot['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {snapshot['count']}")
+        return lines
+
+
+class Counter:
+    """Thread-safe monotonically increasing counter."""
+
+    def __init__(self, name: str, description: str, labels: dict | None = None):
+        self.name = name
+        self.description = description
+        self.labels = _label_key(labels)
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self._value)}"]
+
+
+class Gauge:
+    """Thread-safe value that can go up and down."""
+
+    def __init__(self, name: str, description: str, labels: dict | None = None):
+        self.name = name
+        self.description = description
+        self.labels = _label_key(labels)
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self._value)}"]
+
+
+# Metrics are keyed by (name, labels); series sharing a name form one Prometheus family
+histograms = {}
+counters = {}
+gauges = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, description: str, buckets=DEFAULT_BUCKETS, labels: dict | None = None) -> Histogram:
+    """Return the histogram registered under name and labels, creating it on first use."""
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        if key not in histograms:
+            histograms[key] = Histogram(name, description, buckets, labels)
+        return histograms[key]
+
+
+def counter(name: str, description: str, labels: dict | None = None) -> Counter:
+    """Return the counter registered under name and labels, creating it on first use."""
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        if key not in counters:
+            counters[key] = Counter(name, description, labels)
+        return counters[key]
+
+
+def gauge(name: str, description: str, labels: dict | None = None) -> Gauge:
+    """Return the gauge registered under name and labels, creating it on first use."""
+    key = (name, _label_key(labels))
+    with _registry_lock:
+        if key not in gauges:
+            gauges[key] = Gauge(name, description, labels)
+        return gauges[key]
+
+
+def render_prometheus() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Metrics live in process memory, so with several gunicorn workers each
+    scrape sees the worker that served it.
+
+    Returns:
+        str: Exposition text for a /metrics endpoint
+    """
+    with _registry_lock:
+        families = {}
+        for kind, registry in (("histogram", histograms), ("counter", counters), ("gauge", gauges)):
+            for (name, _), metric in sorted(registry.items()):
+                families.setdefault(name, (kind, metric.description, []))[2].append(metric)
+    lines = []
+    for name, (kind, description, metrics) in families.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for metric in metrics:
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# Stage timings of the request being served, for its Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> list:
+    """Start collecting stage timings for the current request (thread or task) and return the list."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a block (or, as a decorator, a function) as one request stage.
+
+    The duration is recorded in the stage_seconds histogram under the
+    stage label and, if the current request collects timings, appended to
+    them for its Server-Timing header.
+
+    Args:
+        stage: Stage name, e.g. "embed" or "generate"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram("stage_seconds", "Time spent in each request stage", labels={"stage": stage}).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings) -> str:
+    """Format (stage, seconds) pairs as a Server-Timing header value."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings)
+
+
+class StartupTimer:
+    """
+    Measure the phases of a module's start-up for a one-line boot log.
+
+    Args:
+        name: What is starting, e.g. "app"
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase: str) -> None:
+        """Close the phase that ran since the previous mark."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+        return f"{self.name} started in {(self._last - self.started) * 1000:.0f} ms ({phases})"
@@ -0,0 +1,108 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from metrics import histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item calls into batched calls.
+
+    The first item to arrive opens a window of ``max_wait_ms``; everything
+    submitted before the window closes (or until ``max_batch_size`` items
+    are queued) is passed to ``encode_batch`` in one call, and each caller
+    gets its own row back. Batch sizes and per-item queue waits are recorded
+    in histograms named after ``name`` so the window can be tuned.
+
+    Args:
+        encode_batch: Callable mapping a list of items to a same-length sequence of results
+        max_batch_size: Largest batch handed to encode_batch
+        max_wait_ms: How long the first item of a batch waits for company
+        name: Metric name prefix
+    """
+
+    def __init__(self, encode_batch, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 name: str = "embedding"):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = histogram(
+            f"{name}_batch_size", f"Items per {name} micro-batch", BATCH_SIZE_BUCKETS
+        )
+        self.queue_waits = histogram(
+            f"{name}_queue_wait_seconds", f"Time items wait for a {name} micro-batch", QUEUE_WAIT_BUCKETS
+        )
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def encode(self, item):
+        """Encode a single item, blocking until its batch has been processed."""
+        return self.submit(item).result()
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork, so a batcher created in the gunicorn
+        # master starts its own worker thread in each forked process.
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_waits.observe(started - enqueued)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                results = self.encode_batch([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+def batcher_from_env(encode_batch, name: str = "embedding") -> MicroBatcher | None:
+    """
+    Build a MicroBatcher configured by EMBED_BATCH_WINDOW_MS and EMBED_MAX_BATCH_SIZE.
+
+    Returns:
+        MicroBatcher, or None when EMBED_BATCH_WINDOW_MS is 0 (the default)
+    """
+    window_ms = float(os.getenv("EMBED_BATCH_WINDOW_MS", "0"))
+    if window_ms <= 0:
+        return None
+    return MicroBatcher(
+        encode_batch,
+        max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=window_ms,
+        name=name,
+    )
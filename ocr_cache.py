@@ -0,0 +1,59 @@
+import os
+import json
+import hashlib
+
+
+class OCRPageCache:
+    """
+    Content-addressed on-disk cache of OCR text, one file per page.
+
+    Entries are keyed by the PDF's content hash, the page number and the
+    OCR settings (resolution, language, Tesseract version, ...), so renamed
+    or moved files still hit, and changing any setting never serves stale
+    text. Files are written atomically, so concurrent preprocessing runs or
+    worker processes can share one cache directory.
+    """
+
+    def __init__(self, directory: str = "ocr_cache"):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def settings_key(settings: dict) -> str:
+        """Stable digest of an OCR settings mapping."""
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _path(self, pdf_hash: str, page: int, settings_key: str) -> str:
+        key = hashlib.sha256(f"{pdf_hash}\0{page}\0{settings_key}".encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, pdf_hash: str, page: int, settings_key: str) -> str | None:
+        """
+        Return the cached text of a page.
+
+        Args:
+            pdf_hash: Content hash of the PDF
+            page: 1-based page number
+            settings_key: Digest from settings_key()
+
+        Returns:
+            str: OCR text (possibly empty), or None on a miss
+        """
+        try:
+            with open(self._path(pdf_hash, page, settings_key), "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, pdf_hash: str, page: int, settings_key: str, text: str) -> None:
+        """Store the OCR text of a page."""
+        path = self._path(pdf_hash, page, settings_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}.{id(text)}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pdf_hash": pdf_hash, "page": page, "settings": settings_key, "text": text}, f)
+        os.replace(tmp_path, path)
@@ -1,21 +1,47 @@
 import os
+import sys
 import glob
-from pathlib import Path
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import UnstructuredPowerPointLoader
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.docstore.document import Document
-from pdf2image import convert_from_path
+from langchain_core.documents import Document
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 import hashlib
+import json
+import time
+import gc
 import pdfplumber
 import shutil
+import faiss
+from index_registry import resolve_index_dir, publish_version, gc_versions
+from ann_index import (
+    INDEX_TYPES, VECTORS_FILE, build_index, to_flat, save_index_params, load_index_params,
+)
+from bm25 import BM25Index
+from ocr_cache import OCRPageCache
+from chunker import split_documents
+from chunk_store import ChunkDocstore, open_docstore, write_docstore
+import numpy as np
 
 # Load environment variables
 load_dotenv()
 
+# Per-index manifest mapping each source file to its hash and chunk ids
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Chunk length and overlap in characters; chunks record their "start_index"
+# so the query side can merge overlapping ones
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
 # Configure Tesseract OCR path (update for your system)
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
@@ -41,121 +67,553 @@ def is_pdf_image_based(pdf_path: str, check_pages: int = 3) -> bool:
         print(f"Warning: Could not analyze {pdf_path}. Assuming image-based. Error: {str(e)}")
         return True
 
-def extract_text_from_image_pdf(pdf_path: str) -> str | None:
+def get_ocr_settings() -> dict:
     """
-    Extract text from image-based PDF using OCR.
+    OCR settings that affect the extracted text, used in page cache keys.
+
+    OCR_DPI (default 300), OCR_LANG (default "eng") and OCR_CONFIG (extra
+    Tesseract flags) are read from the environment; the Tesseract version
+    is included so an upgrade re-OCRs pages.
+    """
+    try:
+        tesseract_version = str(pytesseract.get_tesseract_version())
+    except Exception:
+        tesseract_version = "unknown"
+    return {
+        "dpi": int(os.getenv("OCR_DPI", "300")),
+        "lang": os.getenv("OCR_LANG", "eng"),
+        "config": os.getenv("OCR_CONFIG", ""),
+        "tesseract": tesseract_version,
+    }
+
+def ocr_page(pdf_path: str, page: int, settings: dict) -> str:
+    """
+    Rasterize and OCR a single page, so only one page image is in memory per call.
 
     Args:
         pdf_path: Path to the PDF file
+        page: 1-based page number
+        settings: OCR settings from get_ocr_settings()
 
     Returns:
-        str: Extracted text or None if OCR fails
+        str: Extracted text
     """
+    images = convert_from_path(pdf_path, dpi=settings["dpi"], first_page=page, last_page=page)
     try:
-        images = convert_from_path(pdf_path, dpi=300)
-        full_text = ""
-        for i, image in enumerate(images):
-            text = pytesseract.image_to_string(image)
-            full_text += f"Page {i+1}:\n{text}\n\n"
-        return full_text.strip() if full_text.strip() else None
+        return "".join(
+            pytesseract.image_to_string(image, lang=settings["lang"], config=settings["config"])
+            for image in images
+        )
+    finally:
+        for image in images:
+            image.close()
+
+def extract_pages_from_image_pdf(pdf_path: str, workers: int | None = None,
+                                 cache: OCRPageCache | None = None) -> list[tuple[int, str]] | None:
+    """
+    Extract text from an image-based PDF using OCR, page by page.
+
+    Pages are rasterized one at a time and OCRed on a thread pool (the work
+    happens in the pdftoppm and tesseract subprocesses, so threads run in
+    parallel). Results are kept in a content-addressed page cache, so
+    re-running preprocessing never re-OCRs an unchanged page.
+
+    Args:
+        pdf_path: Path to the PDF file
+        workers: OCR threads (default: OCR_WORKERS, or up to 4 by CPU count)
+        cache: Page cache (default: OCR_CACHE_DIR, "ocr_cache")
+
+    Returns:
+        list: (1-based page number, text) for each page with text (empty if no
+            page has text), or None if OCR fails
+    """
+    try:
+        page_count = int(pdfinfo_from_path(pdf_path)["Pages"])
+        settings = get_ocr_settings()
+        settings_key = OCRPageCache.settings_key(settings)
+        pdf_hash = hash_file(pdf_path)
+        cache = cache or OCRPageCache(os.getenv("OCR_CACHE_DIR", "ocr_cache"))
+        workers = workers or int(os.getenv("OCR_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+        recognized = []
+
+        def page_text(page: int) -> str:
+            text = cache.get(pdf_hash, page, settings_key)
+            if text is None:
+                text = ocr_page(pdf_path, page, settings)
+                cache.put(pdf_hash, page, settings_key, text)
+                recognized.append(page)
+            return text
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+            texts = list(pool.map(page_text, range(1, page_count + 1)))
+        print(f"OCR of {os.path.basename(pdf_path)}: {page_count} pages, "
+              f"{page_count - len(recognized)} from cache, {len(recognized)} recognized")
+        pages = [(page, text.strip()) for page, text in enumerate(texts, start=1) if text.strip()]
+        return pages
     except Exception as e:
         print(f"OCR failed for {pdf_path}: {str(e)}")
         return None
 
-def get_content_hash(folder_path: str) -> str:
+def extract_text_from_image_pdf(pdf_path: str) -> str | None:
+    """
+    Extract text from image-based PDF using OCR.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        str: Extracted text or None if OCR fails
+    """
+    pages = extract_pages_from_image_pdf(pdf_path)
+    if not pages:
+        return None
+    return "\n\n".join(f"Page {page}:\n{text}" for page, text in pages)
+
+def hash_file(file_path: str) -> str:
     """
-    Generate a hash of all file contents in a folder to detect changes.
+    Generate an MD5 hash of a single file's contents.
 
     Args:
-        folder_path: Path to the folder containing documents
+        file_path: Path to the file
 
     Returns:
-        str: MD5 hash of all file contents
+        str: MD5 hash of the file contents
     """
     hasher = hashlib.md5()
-    for file_path in Path(folder_path).glob("*.*"):
-        if file_path.is_file():
-            hasher.update(file_path.name.encode())
-            # Add file content to hash calculation
-            try:
-                with open(file_path, 'rb') as f:
-                    # Read in chunks to handle large files
-                    for chunk in iter(lambda: f.read(4096), b''):
-                        hasher.update(chunk)
-            except Exception as e:
-                print(f"Warning: Could not read file {file_path}: {str(e)}")
+    with open(file_path, 'rb') as f:
+        # Read in chunks to handle large files
+        for chunk in iter(lambda: f.read(4096), b''):
+            hasher.update(chunk)
     return hasher.hexdigest()
 
-def load_subject_documents(subject_path: str) -> list[Document]:
+def get_file_hashes(subject_path: str) -> dict[str, str]:
     """
-    Load and process all documents for a subject.
+    Hash every document of a subject.
 
     Args:
         subject_path: Path to the subject folder
 
     Returns:
-        list: List of processed Document objects
+        dict: Mapping of file name to MD5 hash, in processing order
     """
-    documents = []
+    file_hashes = {}
+    for file_path in list_subject_files(subject_path):
+        try:
+            file_hashes[os.path.basename(file_path)] = hash_file(file_path)
+        except Exception as e:
+            print(f"Warning: Could not read file {file_path}: {str(e)}")
+    return file_hashes
+
+def get_content_hash(file_hashes: dict[str, str]) -> str:
+    """
+    Combine per-file hashes into a hash of the whole subject to detect changes.
+
+    Args:
+        file_hashes: Mapping of file name to MD5 hash
 
-    # Process PDF files
-    for pdf_file in glob.glob(os.path.join(subject_path, "*.pdf")):
-        filename = os.path.basename(pdf_file)
+    Returns:
+        str: MD5 hash of all file names and contents
+    """
+    hasher = hashlib.md5()
+    for name in sorted(file_hashes):
+        hasher.update(name.encode())
+        hasher.update(file_hashes[name].encode())
+    return hasher.hexdigest()
+
+def load_manifest(index_path: str) -> dict | None:
+    """
+    Load the manifest describing which files an index was built from.
+
+    Args:
+        index_path: Directory containing the index
+
+    Returns:
+        dict: Manifest, or None if missing or unreadable
+    """
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print(f"Ignoring manifest with unsupported version in {index_path}")
+            return None
+        return manifest
+    except Exception as e:
+        print(f"Warning: Could not read manifest {manifest_path}: {str(e)}")
+        return None
+
+def save_manifest(index_path: str, content_hash: str, files: dict[str, dict]):
+    """
+    Write the manifest for an index.
+
+    Args:
+        index_path: Directory containing the index
+        content_hash: Hash of the whole subject
+        files: Mapping of file name to {"hash": ..., "ids": [...]}
+    """
+    manifest = {"version": MANIFEST_VERSION, "content_hash": content_hash, "files": files}
+    with open(os.path.join(index_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+def list_subject_files(subject_path: str) -> list[str]:
+    """
+    List the documents of a subject in a stable processing order.
+
+    Args:
+        subject_path: Path to the subject folder
+
+    Returns:
+        list: Sorted PDF paths followed by sorted PowerPoint paths
+    """
+    pdf_files = sorted(glob.glob(os.path.join(subject_path, "*.pdf")))
+    ppt_files = sorted(glob.glob(os.path.join(subject_path, "*.ppt*")))
+    return pdf_files + ppt_files
+
+def load_document(file_path: str) -> list[Document] | None:
+    """
+    Load and process a single PDF or PowerPoint file.
+
+    Errors are reported and swallowed so one bad file cannot abort a run.
+
+    Args:
+        file_path: Path to the document
+
+    Returns:
+        list: Processed Document objects (empty if the file has no text),
+            or None if extraction failed
+    """
+    filename = os.path.basename(file_path)
+
+    if file_path.lower().endswith(".pdf"):
         try:
-            if is_pdf_image_based(pdf_file):
+            if is_pdf_image_based(file_path):
                 print(f"Processing image-based PDF: {filename}")
-                ocr_text = extract_text_from_image_pdf(pdf_file)
-                if ocr_text:
-                    documents.append(Document(
-                        page_content=ocr_text,
-                        metadata={"source": pdf_file, "type": "ocr_pdf"}
-                    ))
-                else:
-                    print(f"Failed to extract text from: {filename}")
+                ocr_pages = extract_pages_from_image_pdf(file_path)
+                if ocr_pages is None:
+                    return None
+                if ocr_pages:
+                    # One document per page, so chunks can cite their page
+                    return [
+                        Document(
+                            page_content=text,
+                            metadata={"source": file_path, "type": "ocr_pdf", "page": page}
+                        )
+                        for page, text in ocr_pages
+                    ]
+                print(f"No text recognized in: {filename}")
             else:
                 print(f"Processing text-based PDF: {filename}")
-                with pdfplumber.open(pdf_file) as pdf:
-                    full_text = ""
-                    for page in pdf.pages:
+                with pdfplumber.open(file_path) as pdf:
+                    # One document per page, so chunks stay within a page and can cite it
+                    pages = []
+                    for page_number, page in enumerate(pdf.pages, start=1):
                         text = page.extract_text()
-                        if text:
-                            full_text += text + "\n"
-                    if full_text.strip():
-                        documents.append(Document(
-                            page_content=full_text.strip(),
-                            metadata={"source": pdf_file, "type": "text_pdf"}
-                        ))
-                    else:
-                        print(f"No text extracted from: {filename}")
+                        if text and text.strip():
+                            pages.append(Document(
+                                page_content=text.strip(),
+                                metadata={"source": file_path, "type": "text_pdf", "page": page_number}
+                            ))
+                    if pages:
+                        return pages
+                    print(f"No text extracted from: {filename}")
         except Exception as e:
             print(f"Error processing {filename}: {str(e)}")
+            return None
+        return []
 
-    # Process PowerPoint files
-    for ppt_file in glob.glob(os.path.join(subject_path, "*.ppt*")):
-        try:
-            print(f"Processing PowerPoint: {os.path.basename(ppt_file)}")
-            loader = UnstructuredPowerPointLoader(ppt_file)
-            docs = loader.load()
-            documents.extend(docs)
-        except Exception as e:
-            print(f"Error processing PowerPoint {ppt_file}: {str(e)}")
+    try:
+        print(f"Processing PowerPoint: {filename}")
+        loader = UnstructuredPowerPointLoader(file_path)
+        return loader.load()
+    except Exception as e:
+        print(f"Error processing PowerPoint {file_path}: {str(e)}")
+        return None
+
+def iter_documents_parallel(file_paths: list[str], workers: int, window: int | None = None):
+    """
+    Extract documents in a process pool, yielding results in file order.
+
+    At most ``window`` files are submitted ahead of the consumer, so only
+    those files' documents are held in memory while the consumer embeds
+    earlier ones. A worker that dies (e.g. a crash inside a native PDF or
+    OCR library) breaks the whole pool: the file being waited on is then
+    retried alone in a fresh single-worker pool, the other in-flight files
+    are resubmitted to a new pool, and only a file that keeps crashing is
+    dropped.
 
+    Args:
+        file_paths: Documents to extract
+        workers: Number of worker processes
+        window: Files extracted ahead of the consumer (default: 2 * workers)
+
+    Yields:
+        tuple: (file path, extracted Document objects, or None if extraction failed)
+    """
+    window = max(window or 2 * workers, 1)
+    pending = deque(file_paths)
+    in_flight = deque()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < window:
+                path = pending.popleft()
+                in_flight.append((path, pool.submit(load_document, path)))
+            path, future = in_flight.popleft()
+            try:
+                documents = future.result()
+            except BrokenProcessPool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pending.extendleft(reversed([queued for queued, _ in in_flight]))
+                in_flight.clear()
+                pool = ProcessPoolExecutor(max_workers=workers)
+                documents = load_document_isolated(path)
+            except Exception as e:
+                print(f"Error processing {os.path.basename(path)}: {str(e)}")
+                documents = None
+            yield path, documents
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def load_document_isolated(file_path: str) -> list[Document] | None:
+    """Run load_document in a fresh single-worker pool, so a crash cannot take other files down."""
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            return pool.submit(load_document, file_path).result()
+    except Exception as e:
+        print(f"Worker crashed while processing {os.path.basename(file_path)}. Skipping. Error: {str(e)}")
+        return None
+
+def load_documents_parallel(file_paths: list[str], workers: int) -> dict[str, list[Document] | None]:
+    """
+    Extract documents in a process pool (see iter_documents_parallel).
+
+    Args:
+        file_paths: Documents to extract
+        workers: Number of worker processes
+
+    Returns:
+        dict: Mapping of file path to its extracted Document objects (None
+            for files whose extraction failed)
+    """
+    return dict(iter_documents_parallel(file_paths, workers))
+
+def load_subject_documents(subject_path: str, workers: int = 1) -> list[Document]:
+    """
+    Load and process all documents for a subject.
+
+    Args:
+        subject_path: Path to the subject folder
+        workers: Number of worker processes (1 processes files serially)
+
+    Returns:
+        list: List of processed Document objects
+    """
+    file_paths = list_subject_files(subject_path)
+    if workers > 1:
+        loaded = load_documents_parallel(file_paths, workers)
+    else:
+        loaded = {path: load_document(path) for path in file_paths}
+    return merge_documents(file_paths, loaded)
+
+def merge_documents(file_paths: list[str], loaded: dict[str, list[Document] | None]) -> list[Document]:
+    """
+    Merge per-file extraction results in file order.
+
+    Metadata strings are interned so that documents returned by worker
+    processes share string objects exactly like serially loaded ones,
+    rather than every chunk holding its own copy of its source path.
+
+    Args:
+        file_paths: Documents in processing order
+        loaded: Mapping of file path to its extracted Document objects (None
+            for files whose extraction failed)
+
+    Returns:
+        list: Merged Document objects
+    """
+    documents = []
+    for path in file_paths:
+        for doc in loaded.get(path) or []:
+            doc.metadata = {
+                sys.intern(key): sys.intern(value) if isinstance(value, str) else value
+                for key, value in doc.metadata.items()
+            }
+            documents.append(doc)
     return documents
 
-def process_subjects(base_folder: str):
+def get_chunk_ids(chunks: list[Document]) -> list[str]:
+    """
+    Derive deterministic docstore ids for chunks.
+
+    Random ids would make every build differ; ids derived from the chunk's
+    source, ordinal within that source and content keep rebuilds of the
+    same inputs byte-identical.
+
+    Args:
+        chunks: Chunks in index order
+
+    Returns:
+        list: One id per chunk
+    """
+    ids = []
+    ordinals = {}
+    for chunk in chunks:
+        source = str(chunk.metadata.get("source", ""))
+        ordinal = ordinals.get(source, 0)
+        ordinals[source] = ordinal + 1
+        hasher = hashlib.md5(f"{source}\0{ordinal}\0".encode())
+        hasher.update(chunk.page_content.encode())
+        ids.append(hasher.hexdigest())
+    return ids
+
+def plan_subject_update(subject_path: str, current_path: str | None) -> dict:
+    """
+    Compare a subject folder against the manifest of its current index.
+
+    Args:
+        subject_path: Path to the subject folder
+        current_path: Directory of the subject's current index, if any
+
+    Returns:
+        dict: Plan with the current file hashes, the content hash, the
+        previous manifest (None forces a full rebuild), the files to
+        extract and the docstore ids to delete
+    """
+    file_hashes = get_file_hashes(subject_path)
+    manifest = load_manifest(current_path) if current_path else None
+    if manifest is not None and not os.path.exists(os.path.join(current_path, "index.faiss")):
+        manifest = None
+    previous = manifest["files"] if manifest else {}
+
+    changed = [name for name, digest in file_hashes.items()
+               if previous.get(name, {}).get("hash") != digest]
+    stale = [name for name in previous
+             if name not in file_hashes or name in changed]
+
+    return {
+        "file_hashes": file_hashes,
+        "content_hash": get_content_hash(file_hashes),
+        "manifest": manifest,
+        "current_path": current_path,
+        "extract": [os.path.join(subject_path, name) for name in changed],
+        "delete_ids": [doc_id for name in stale for doc_id in previous[name]["ids"]],
+        "removed": [name for name in previous if name not in file_hashes],
+    }
+
+def get_rss_mb() -> float:
+    """
+    Return the current resident set size of this process.
+
+    Returns:
+        float: RSS in MB, or 0.0 if it cannot be determined on this platform
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, but still bounds the pipeline on macOS/BSD
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+    except ImportError:
+        return 0.0
+
+def add_chunks_streaming(vector_db, file_chunks, embedding_model, batch_size: int = 64,
+                         max_rss_mb: float | None = None):
+    """
+    Embed chunks in fixed-size batches and add them to a FAISS store.
+
+    Only one batch of texts and vectors is held at a time. When RSS exceeds
+    ``max_rss_mb`` after a batch, garbage is collected and, if that is not
+    enough, the batch size is halved for the remaining chunks.
+
+    Args:
+        vector_db: Existing FAISS store, or None to create one from the first batch
+        file_chunks: Iterable of (chunks, ids) pairs, typically one per file
+        embedding_model: Embedding model used for the chunks
+        batch_size: Number of chunks embedded per call
+        max_rss_mb: Optional peak-memory ceiling in MB
+
+    Returns:
+        tuple: The FAISS store (None if no chunks were added) and a stats
+        dict with chunks, seconds, chunks_per_sec, peak_rss_mb and batch_size
+    """
+    stats = {"chunks": 0, "seconds": 0.0, "chunks_per_sec": 0.0,
+             "peak_rss_mb": get_rss_mb(), "batch_size": batch_size}
+    start = time.perf_counter()
+    texts, metadatas, ids = [], [], []
+
+    def flush():
+        nonlocal vector_db, texts, metadatas, ids
+        vectors = embedding_model.embed_documents(texts)
+        if vector_db is None:
+            vector_db = FAISS.from_embeddings(
+                list(zip(texts, vectors)), embedding_model, metadatas=metadatas, ids=ids
+            )
+        else:
+            vector_db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        stats["chunks"] += len(texts)
+        texts, metadatas, ids = [], [], []
+
+        rss = get_rss_mb()
+        if max_rss_mb and rss > max_rss_mb:
+            gc.collect()
+            rss = get_rss_mb()
+            if rss > max_rss_mb and stats["batch_size"] > 1:
+                stats["batch_size"] = max(1, stats["batch_size"] // 2)
+                print(f"RSS {rss:.0f} MB exceeds {max_rss_mb:.0f} MB; "
+                      f"reducing batch size to {stats['batch_size']}")
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], rss)
+
+    for chunks, chunk_ids in file_chunks:
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            texts.append(chunk.page_content)
+            metadatas.append(chunk.metadata)
+            ids.append(chunk_id)
+            if len(texts) >= stats["batch_size"]:
+                flush()
+    if texts:
+        flush()
+
+    stats["seconds"] = time.perf_counter() - start
+    if stats["seconds"] > 0:
+        stats["chunks_per_sec"] = stats["chunks"] / stats["seconds"]
+    return vector_db, stats
+
+def is_up_to_date(plan: dict, index_type: str) -> bool:
+    """Return True if the current index was built from the same files as the given type."""
+    manifest = plan["manifest"]
+    if not manifest or manifest["content_hash"] != plan["content_hash"]:
+        return False
+    return load_index_params(plan["current_path"]).get("index_type", "flat") == index_type
+
+def process_subjects(base_folder: str, workers: int = 1, batch_size: int = 64,
+                     max_rss_mb: float | None = None, keep_versions: int = 2,
+                     index_type: str = "flat", index_params: dict | None = None, rerank: int = 0):
     """
     Main function to process all subjects in the base folder.
 
+    Each index carries a manifest of its files' hashes and the docstore ids
+    of their chunks, so a run only extracts and embeds added or changed
+    files and removes the vectors of deleted ones from the existing index.
+
     Args:
         base_folder: Root directory containing subject folders
+        workers: Number of worker processes used for document extraction
+        batch_size: Number of chunks embedded and added to the index per batch
+        max_rss_mb: Optional peak-memory ceiling in MB for the embedding pipeline
+        keep_versions: Index versions to retain per subject, including the current one
+        index_type: FAISS index type, one of ann_index.INDEX_TYPES
+        index_params: Build and search parameters for the index type (nlist, nprobe, efSearch, ...)
+        rerank: For non-flat types, re-rank rerank * k candidates by exact distance
+            against the saved float32 vectors at query time (0 disables)
     """
-    # Initialize text splitter and embedding model
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
-
+    # Initialize embedding model
     embedding_model = HuggingFaceEmbeddings(
         model_name="sentence-transformers/all-MiniLM-L6-v2"
     )
@@ -163,56 +621,191 @@ def process_subjects(base_folder: str):
     # Create output directory if it doesn't exist
     os.makedirs("faiss_index", exist_ok=True)
 
+    subjects = [
+        subject for subject in sorted(os.listdir(base_folder))
+        if os.path.isdir(os.path.join(base_folder, subject))
+    ]
+
+    plans = {}
+    for subject in subjects:
+        safe_subject = subject.replace(" ", "_").replace("(", "").replace(")", "").replace("&", "and")
+        plans[subject] = plan_subject_update(
+            os.path.join(base_folder, subject), resolve_index_dir(safe_subject, "faiss_index")
+        )
+
     # Process each subject folder
-    for subject in os.listdir(base_folder):
+    for subject in subjects:
         subject_path = os.path.join(base_folder, subject)
-        if not os.path.isdir(subject_path):
-            continue
+        plan = plans[subject]
+        manifest = plan["manifest"]
 
         print(f"\n{'='*40}")
         print(f"Processing subject: {subject}")
         print(f"{'='*40}")
 
-        # Get content hash to detect changes
-        content_hash = get_content_hash(subject_path)
         safe_subject = subject.replace(" ", "_").replace("(", "").replace(")", "").replace("&", "and")
-        index_path = f"faiss_index/{safe_subject}_v{content_hash}"
 
-        # Skip if index already exists
-        if os.path.exists(f"{index_path}.index"):
-            print(f"Index already exists for {subject}. Skipping...")
+        # Skip if the latest index was built from exactly these files
+        if is_up_to_date(plan, index_type):
+            print(f"Index already up to date for {subject}. Skipping...")
             continue
 
-        # Load and process documents
-        documents = load_subject_documents(subject_path)
-        if not documents:
+        if not plan["file_hashes"]:
             print(f"No valid documents found in {subject}")
             continue
 
-        # Split documents into chunks
-        chunks = text_splitter.split_documents(documents)
-        print(f"Created {len(chunks)} text chunks")
+        if manifest:
+            print(f"Updating index: {len(plan['extract'])} added/changed, "
+                  f"{len(plan['removed'])} removed file(s)")
+        else:
+            print("No manifest found. Building index from scratch.")
 
-        # Create and save FAISS index
         try:
-            os.makedirs(index_path, exist_ok=True)
-            vector_db = FAISS.from_documents(chunks, embedding_model)
-            vector_db.save_local(index_path)
-            print(f"Saved FAISS index to {index_path}")
-
-            # Create copy to latest version (Windows compatible)
-            latest_path = f"faiss_index/{safe_subject}_latest"
-            if os.path.exists(latest_path):
-                shutil.rmtree(latest_path)
-            os.makedirs(latest_path, exist_ok=True)
-            shutil.copy(f"{index_path}/index.faiss", f"{latest_path}/index.faiss")
-            shutil.copy(f"{index_path}/index.pkl", f"{latest_path}/index.pkl")
-            print(f"Created copy: {latest_path}")
+            # Start from the existing index so unchanged files are not re-embedded
+            vector_db = None
+            files = {}
+            if manifest:
+                docstore, index_to_docstore_id = open_docstore(plan["current_path"])
+                if isinstance(docstore, ChunkDocstore):
+                    # Chunk stores are read-only; edit an in-memory copy
+                    docstore = InMemoryDocstore({
+                        index_to_docstore_id[i]: docstore.document_at(i) for i in range(len(index_to_docstore_id))
+                    })
+                vector_db = FAISS(
+                    embedding_model, faiss.read_index(os.path.join(plan["current_path"], "index.faiss")),
+                    docstore, dict(index_to_docstore_id),
+                )
+                # Deletes and appends happen on an exact flat index, rebuilt
+                # from the saved original vectors when the current one is ANN
+                vectors_path = os.path.join(plan["current_path"], VECTORS_FILE)
+                vectors = np.load(vectors_path) if os.path.exists(vectors_path) else None
+                vector_db.index = to_flat(vector_db.index, vectors)
+                if plan["delete_ids"]:
+                    vector_db.delete(plan["delete_ids"])
+                files = {name: entry for name, entry in manifest["files"].items()
+                         if name in plan["file_hashes"]}
+
+            def file_chunks():
+                # Load and split one added or changed file at a time; with
+                # several workers only a bounded window of files is extracted
+                # ahead of the embedding, so memory does not grow with the corpus
+                if workers > 1:
+                    print(f"Extracting {len(plan['extract'])} files with {workers} workers...")
+                    documents = iter_documents_parallel(plan["extract"], workers)
+                else:
+                    documents = ((path, load_document(path)) for path in plan["extract"])
+                for file_path, file_documents in documents:
+                    name = os.path.basename(file_path)
+                    loaded = {file_path: file_documents}
+                    if loaded[file_path] is None:
+                        # Left out of the manifest (its old chunks are already
+                        # deleted), so the next run retries it
+                        files.pop(name, None)
+                        print(f"Extraction of {name} failed; it will be retried on the next run")
+                        continue
+                    chunks = split_documents(merge_documents([file_path], loaded), CHUNK_SIZE, CHUNK_OVERLAP)
+                    ids = get_chunk_ids(chunks)
+                    # Files without text are recorded too, so they are retried only when they change
+                    files[name] = {"hash": plan["file_hashes"][name], "ids": ids}
+                    print(f"Created {len(chunks)} text chunks from {name}")
+                    yield chunks, ids
+
+            vector_db, stats = add_chunks_streaming(
+                vector_db, file_chunks(), embedding_model,
+                batch_size=batch_size, max_rss_mb=max_rss_mb,
+            )
+            if stats["chunks"]:
+                print(f"Embedded {stats['chunks']} chunks in {stats['seconds']:.1f}s "
+                      f"({stats['chunks_per_sec']:.1f} chunks/sec), "
+                      f"peak RSS {stats['peak_rss_mb']:.0f} MB")
+
+            if vector_db is None or vector_db.index.ntotal == 0:
+                print(f"No valid documents found in {subject}")
+                continue
+
+            # Hash only the recorded files: a run that skipped a failed file
+            # must not look up to date to the next one
+            content_hash = get_content_hash({name: entry["hash"] for name, entry in files.items()})
+            if is_up_to_date({**plan, "content_hash": content_hash}, index_type):
+                print(f"No file could be extracted; keeping the current index for {subject}")
+                continue
+            version = f"{safe_subject}_v{content_hash}"
+            if index_type != "flat":
+                version += f"_{index_type}"
+            index_path = f"faiss_index/{version}"
+
+            # Write the new version next to the live one, then swap it in
+            # atomically so loaders never observe a half-written index
+            tmp_path = f"{index_path}.tmp{os.getpid()}"
+            os.makedirs(tmp_path, exist_ok=True)
+            if index_type != "flat":
+                vectors = vector_db.index.reconstruct_n(0, vector_db.index.ntotal)
+                vector_db.index = build_index(vectors, index_type, index_params)
+                # Keep the exact vectors so later incremental runs can rebuild losslessly
+                np.save(os.path.join(tmp_path, VECTORS_FILE), vectors)
+            faiss.write_index(vector_db.index, os.path.join(tmp_path, "index.faiss"))
+            # Chunks go to a memory-mapped chunk store rather than a pickled docstore
+            write_docstore(tmp_path, vector_db.docstore, vector_db.index_to_docstore_id)
+            save_index_params(tmp_path, vector_db.index, rerank=rerank if index_type != "flat" else 0)
+
+            # Keyword index over the same chunks, keyed by FAISS position
+            bm25 = BM25Index.build(
+                vector_db.docstore.search(vector_db.index_to_docstore_id[i]).page_content
+                for i in range(vector_db.index.ntotal)
+            )
+            bm25.save(tmp_path)
+            print(f"Built BM25 index: {len(bm25.vocab)} terms, {len(bm25.doc_ids)} postings, "
+                  f"{bm25.nbytes / 1024:.0f} KiB")
+            save_manifest(tmp_path, content_hash, files)
+            if os.path.exists(index_path):
+                shutil.rmtree(index_path)
+            os.rename(tmp_path, index_path)
+            index_bytes = os.path.getsize(os.path.join(index_path, "index.faiss"))
+            print(f"Saved {index_type} FAISS index to {index_path} ({vector_db.index.ntotal} vectors, "
+                  f"{index_bytes / max(vector_db.index.ntotal, 1):.0f} bytes/vector)")
+
+            pointer = publish_version(safe_subject, version, "faiss_index")
+            print(f"Published {version} as {safe_subject}_latest (generation {pointer['generation']})")
+
+            deleted = gc_versions(safe_subject, keep=keep_versions, index_dir="faiss_index")
+            if deleted:
+                print(f"Removed old index versions: {', '.join(deleted)}")
         except Exception as e:
             print(f"Error creating FAISS index: {str(e)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build FAISS indices from subject PDFs and PowerPoints.")
+    parser.add_argument("base_folder", nargs="?", default="educational_pdfs",
+                        help="Root directory containing subject folders")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for document extraction (default: 1, serial)")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="Chunks embedded and added to the index per batch (default: 64)")
+    parser.add_argument("--max-rss-mb", type=float, default=None,
+                        help="Shrink embedding batches when RSS exceeds this many MB")
+    parser.add_argument("--keep-versions", type=int, default=2,
+                        help="Index versions to keep per subject, including the current one (default: 2)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS index type (default: flat, exact search; fp16, sq8 and pq "
+                             "store compressed vectors)")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per search")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW neighbours per node")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search beam width")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ/IVF-PQ sub-quantizers (must divide 384)")
+    parser.add_argument("--rerank", type=int, default=0,
+                        help="Re-rank RERANK*k candidates of a non-flat index by exact distance (default: 0, off)")
+    args = parser.parse_args()
+
+    index_params = {
+        key: value for key, value in {
+            "nlist": args.nlist, "nprobe": args.nprobe, "hnsw_m": args.hnsw_m,
+            "efSearch": args.ef_search, "pq_m": args.pq_m,
+        }.items() if value is not None
+    }
+
     print("Starting PDF processing pipeline...")
-    PDF_BASE_PATH = "educational_pdfs"
-    process_subjects(PDF_BASE_PATH)
+    process_subjects(args.base_folder, workers=args.workers, batch_size=args.batch_size,
+                     max_rss_mb=args.max_rss_mb, keep_versions=args.keep_versions,
+                     index_type=args.index_type, index_params=index_params, rerank=args.rerank)
     print("Processing complete! FAISS indices saved in 'faiss_index' folder.")
@@ -1,9 +1,29 @@
 import os
 import gc
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-import google.generativeai as genai
+import hashlib
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
+from embedding_backend import load_embeddings, get_backend
+from index_registry import resolve_index_dir, get_generation
+from llm import GeminiClient, GeminiRESTClient, fake_client_from_env
+from micro_batcher import batcher_from_env
+from bm25 import BM25Index, reciprocal_rank_fusion
+from context_builder import assemble_context, estimate_tokens
+from chunk_store import ChunkDocstore, open_docstore, has_chunk_store
+from index_cache import cache_from_env
+from admission import (
+    ConcurrencyLimiter, AsyncConcurrencyLimiter, SingleFlight, AsyncSingleFlight, StreamSingleFlight,
+    normalize_query, limiter_settings, web_threads,
+)
+# faiss, LangChain and the Gemini SDK take seconds to import, so they are
+# imported on first use; /health and the template routes never pay for them.
+from metrics import histogram, counter, timed
 
 # Load environment variables
 load_dotenv()
@@ -11,21 +31,141 @@ load_dotenv()
 # Global variables for lazy loading
 embedding_model = None
 gemini_model = None
-faiss_cache = {}  # Cache for FAISS databases per subject
+llm_client = None
+query_batcher = None
+query_batcher_configured = False
+query_batcher_lock = threading.Lock()
+# Loaded FAISS databases per subject, least recently used evicted past INDEX_CACHE_MAX_MB
+# (an estimated footprint, see store_nbytes)
+faiss_cache = cache_from_env()
+warmup_state = "idle"  # "idle" (lazy loading) or "ready" (indexes preloaded)
+
+logger = logging.getLogger(__name__)
+
+# Pseudo-subject that searches every published index (see query_all_subjects)
+ALL_SUBJECTS = "all"
+
+# Keyword search runs here, concurrently with the FAISS search on the request thread
+retrieval_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+# Per-subject searches of an "all subjects" query; separate from retrieval_executor
+# because each task may itself wait on a BM25 search there
+federated_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FEDERATED_WORKERS", "8")), thread_name_prefix="federated"
+)
+federated_search_seconds = histogram("federated_search_seconds", "Latency of all-subjects retrieval")
+bm25_search_seconds = histogram("bm25_search_seconds", "BM25 keyword search latency")
+hybrid_added_seconds = histogram(
+    "hybrid_added_latency_seconds",
+    "Wall time hybrid retrieval adds after the dense search finishes (waiting on BM25 plus fusion)",
+)
+embedding_cache_hits = counter("embedding_cache_requests_total", "Query embedding cache lookups", {"result": "hit"})
+embedding_cache_misses = counter("embedding_cache_requests_total", "Query embedding cache lookups", {"result": "miss"})
+index_load_failures = counter("index_loads_total", "FAISS indexes read from disk", {"result": "failed"})
+llm_errors = counter("llm_errors_total", "Failed LLM calls")
+llm_timeouts = counter("llm_timeouts_total", "LLM calls that exceeded LLM_TIMEOUT")
+# Bounded LLM concurrency with a capped queue (see admission.py); the async
+# pair serves the FastAPI app, the threaded pair Flask
+llm_limiter = ConcurrencyLimiter(**limiter_settings(web_threads()))
+async_llm_limiter = AsyncConcurrencyLimiter(**limiter_settings(), name="llm_async")
+answer_flights = SingleFlight()
+async_answer_flights = AsyncSingleFlight(name="llm_async")
+answer_streams = StreamSingleFlight()
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+context_tokens = histogram("context_tokens", "Estimated tokens of assembled prompt context", TOKEN_BUCKETS)
+prompt_tokens = histogram("prompt_tokens", "Estimated tokens of each LLM prompt", TOKEN_BUCKETS)
+
+
+class EmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of query embeddings.
+
+    Keys are normalized query strings (admission.normalize_query, the same
+    form the LLM call coalescing uses), so "What is TCP?" and "  what is
+    tcp " share one entry and only the first one pays for the model
+    forward pass.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return normalize_query(text)
+
+    def get(self, text: str):
+        key = self.normalize(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                embedding_cache_misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        embedding_cache_hits.inc()
+        return list(vector)
+
+    def put(self, text: str, vector) -> None:
+        if self.max_size <= 0:
+            return
+        key = self.normalize(text)
+        with self._lock:
+            self._entries[key] = tuple(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+embedding_cache = EmbeddingCache(int(os.getenv("EMBEDDING_CACHE_SIZE", "256")))
 
 def get_embedding_model():
     global embedding_model
     if embedding_model is None:
         try:
             print("Loading embedding model...")
-            embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            print("Embedding model loaded successfully.")
+            embedding_model = load_embeddings("sentence-transformers/all-MiniLM-L6-v2")
+            print(f"Embedding model loaded successfully ({get_backend()} backend).")
             gc.collect()
         except Exception as e:
             print(f"Error loading embedding model: {e}")
             raise
     return embedding_model
 
+def get_query_batcher():
+    """
+    Return the micro-batcher for query embeddings, or None if batching is off.
+
+    Enabled by EMBED_BATCH_WINDOW_MS (e.g. 5); concurrent queries arriving
+    within the window share one encode call of up to EMBED_MAX_BATCH_SIZE.
+    """
+    global query_batcher, query_batcher_configured
+    if not query_batcher_configured:
+        # Concurrent first requests must share one batcher and its worker thread
+        with query_batcher_lock:
+            if not query_batcher_configured:
+                query_batcher = batcher_from_env(lambda texts: get_embedding_model().embed_documents(texts))
+                query_batcher_configured = True
+    return query_batcher
+
 def get_gemini_model():
     global gemini_model
     if gemini_model is None:
@@ -34,6 +174,7 @@ def get_gemini_model():
             api_key = os.getenv("GEMINI_API_KEY")
             if not api_key:
                 raise ValueError("GEMINI_API_KEY not found in environment variables")
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
             gemini_model = genai.GenerativeModel("gemini-2.0-flash")
             print("Gemini model configured successfully.")
@@ -42,39 +183,309 @@ def get_gemini_model():
             raise
     return gemini_model
 
-def load_faiss_database(subject: str, index_dir: str = "faiss_index"):
+def get_llm_client():
+    """
+    Return the LLM client used to generate answers.
+
+    LLM_BACKEND=fake selects a local fake generator (see llm.FakeLLMClient),
+    LLM_BACKEND=rest calls the Gemini REST API at GEMINI_BASE_URL (e.g. the
+    fake service in benchmarks/fake_gemini.py); anything else uses the Gemini SDK.
+    """
+    global llm_client
+    if llm_client is None:
+        backend = os.getenv("LLM_BACKEND", "gemini")
+        if backend == "fake":
+            llm_client = fake_client_from_env()
+        elif backend == "rest":
+            llm_client = GeminiRESTClient(
+                os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"),
+                os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+                os.getenv("GEMINI_API_KEY"),
+            )
+        else:
+            llm_client = GeminiClient(get_gemini_model)
+    return llm_client
+
+def set_llm_client(client) -> None:
+    """Replace the LLM client, e.g. with a FakeLLMClient in tests."""
+    global llm_client
+    llm_client = client
+
+def list_subjects(index_dir: str = "faiss_index") -> list[str]:
+    """
+    List the subjects that have a published index.
+
+    Args:
+        index_dir: Directory where indices are stored
+
+    Returns:
+        list: Subject names
+    """
+    subjects = []
+    if os.path.exists(index_dir):
+        for item in os.listdir(index_dir):
+            if item.endswith("_latest"):
+                subject = item.replace("_latest", "")
+                subjects.append(subject)
+    return subjects
+
+def attach_index_extras(faiss_db, subject_index_dir: str):
+    """
+    Apply the files preprocess.py saves next to an index.
+
+    Applies saved nprobe/efSearch settings, attaches the BM25 keyword
+    index as ``faiss_db.bm25`` (None for indexes built without one) and,
+    for quantized indexes built with --rerank, memory-maps the original
+    vectors as ``faiss_db.rerank_vectors`` for exact re-ranking.
+    """
+    from ann_index import load_index_params, apply_search_params, load_rerank_vectors
+    params = load_index_params(subject_index_dir)
+    if params:
+        apply_search_params(faiss_db.index, params)
+    faiss_db.rerank = int(params.get("rerank", 0))
+    faiss_db.rerank_vectors = load_rerank_vectors(subject_index_dir) if faiss_db.rerank > 1 else None
+    faiss_db.bm25 = BM25Index.load(subject_index_dir)
+    if faiss_db.bm25 is not None:
+        print(f"BM25 index loaded: {len(faiss_db.bm25.vocab)} terms, {faiss_db.bm25.nbytes / 1024:.0f} KiB")
+    return faiss_db
+
+def open_faiss_store(subject_index_dir: str, mmap: bool = False):
+    """
+    Open a saved FAISS vector store.
+
+    Chunks are read lazily from the memory-mapped chunk store (or, for
+    indexes not yet converted with chunk_store.py, unpickled from
+    index.pkl). With ``mmap`` the index is opened read-only with FAISS
+    memory-mapped I/O too, so its vectors live in the page cache instead of
+    the heap and are shared between processes (e.g. gunicorn workers
+    forked after a preload).
+
+    Args:
+        subject_index_dir: Directory containing index.faiss and the chunk store
+        mmap: Memory-map the index instead of reading it into memory
+
+    Returns:
+        FAISS vector store
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    index_file = os.path.join(subject_index_dir, "index.faiss")
+    if not mmap:
+        index = faiss.read_index(index_file)
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            index = faiss.read_index(index_file, flags)
+        except RuntimeError as e:
+            # Not every index type supports mmap; fall back to a regular read
+            print(f"Memory-mapping {index_file} failed, reading it instead: {e}")
+            index = faiss.read_index(index_file)
+    docstore, index_to_docstore_id = open_docstore(subject_index_dir)
+    faiss_db = FAISS(get_embedding_model(), index, docstore, index_to_docstore_id)
+    return attach_index_extras(faiss_db, subject_index_dir)
+
+def store_nbytes(faiss_db, subject_index_dir: str) -> int:
+    """
+    Estimate the memory a loaded FAISS database can occupy.
+
+    Counts the index (its file size, which mirrors the in-memory layout),
+    the chunk store, the BM25 postings and the re-ranking vectors. Memory-
+    mapped parts are counted in full, as they become resident once searched.
+    This is an estimate, not a measurement: Python object overhead and the
+    per-document cost of pickled docstores are approximated, so the
+    INDEX_CACHE_MAX_MB budget it is checked against is approximate too.
+
+    Args:
+        faiss_db: FAISS vector store from open_faiss_store
+        subject_index_dir: Directory the store was opened from
+
+    Returns:
+        int: Footprint in bytes
+    """
+    nbytes = os.path.getsize(os.path.join(subject_index_dir, "index.faiss"))
+    docstore = faiss_db.docstore
+    if isinstance(docstore, ChunkDocstore):
+        nbytes += docstore.store.nbytes
+    else:
+        # Unpickled InMemoryDocstore: the text plus a rough per-document overhead
+        nbytes += sum(len(doc.page_content) + 500 for doc in getattr(docstore, "_dict", {}).values())
+    if getattr(faiss_db, "bm25", None) is not None:
+        nbytes += faiss_db.bm25.nbytes
+    if getattr(faiss_db, "rerank_vectors", None) is not None:
+        nbytes += faiss_db.rerank_vectors.nbytes
+    return nbytes
+
+@timed("load_index")
+def load_faiss_database(subject: str, index_dir: str = "faiss_index", mmap: bool | None = None):
     """
     Load the FAISS index for a given subject.
 
+    The cached store is keyed by the index generation, which costs one
+    stat() per call. When preprocess.py publishes a new version the store is
+    reloaded and swapped in; requests already holding the old store finish
+    with it undisturbed. Concurrent requests for a subject that is not
+    loaded share one load, and least recently used subjects are evicted
+    once the cache exceeds INDEX_CACHE_MAX_MB (see index_cache.IndexCache).
+
     Args:
         subject: Name of the subject
         index_dir: Directory where indices are stored
+        mmap: Memory-map the index (defaults to the FAISS_MMAP environment
+            variable, or on when the indexes were preloaded)
 
     Returns:
         FAISS vector store or None if not found
     """
-    if subject in faiss_cache:
-        return faiss_cache[subject]
+    generation = get_index_generation(subject, index_dir)
+    if mmap is None:
+        mmap = os.getenv("FAISS_MMAP", "0") == "1" or warmup_state != "idle"
 
-    subject_index_dir = os.path.join(index_dir, f"{subject}_latest")
-    if os.path.exists(os.path.join(subject_index_dir, "index.faiss")) and os.path.exists(os.path.join(subject_index_dir, "index.pkl")):
+    def load():
+        subject_index_dir = resolve_index_dir(subject, index_dir)
+        if not index_exists(subject_index_dir):
+            return None
         try:
             print(f"Loading FAISS database for subject: {subject}")
-            faiss_db = FAISS.load_local(subject_index_dir, get_embedding_model(), allow_dangerous_deserialization=True)
-            faiss_cache[subject] = faiss_db
-            print(f"FAISS database loaded and cached for subject: {subject}")
+            faiss_db = open_faiss_store(subject_index_dir, mmap=mmap)
+            nbytes = store_nbytes(faiss_db, subject_index_dir)
+            print(f"FAISS database loaded and cached for subject: {subject} ({nbytes / 2**20:.1f} MiB)")
             gc.collect()
-            return faiss_db
-        except Exception as e:
-            print(f"Error loading FAISS database for {subject}: {e}")
+            return faiss_db, nbytes
+        except Exception:
+            index_load_failures.inc()
+            logger.exception("Error loading FAISS database for %s", subject)
             return None
-    else:
-        return None
+
+    faiss_db = faiss_cache.get_or_load(subject, generation, load)
+    if faiss_db is None:
+        if not index_exists(resolve_index_dir(subject, index_dir)):
+            # The subject's index was removed; stop serving the cached copy
+            faiss_cache.pop(subject)
+            return None
+        # Keep serving the previous version if the new one cannot be read
+        faiss_db = faiss_cache.peek(subject)
+    return faiss_db
+
+def index_exists(subject_index_dir: str | None) -> bool:
+    """Return True if the directory holds a FAISS index and its chunks."""
+    return bool(subject_index_dir) and os.path.exists(os.path.join(subject_index_dir, "index.faiss")) and (
+        has_chunk_store(subject_index_dir) or os.path.exists(os.path.join(subject_index_dir, "index.pkl")))
+
+def warmup(index_dir: str = "faiss_index") -> None:
+    """
+    Load the embedding model and memory-map every published index.
+
+    Meant to run in the gunicorn master before workers fork (see
+    gunicorn.conf.py), so the model weights and index pages are shared
+    copy-on-write instead of being loaded once per worker on first request.
+
+    Args:
+        index_dir: Directory where indices are stored
+    """
+    global warmup_state
+    start = time.perf_counter()
+    # Only load the weights here: running inference before fork would start
+    # torch's thread pools, which are not fork-safe.
+    get_embedding_model()
+    subjects = list_subjects(index_dir)
+    loaded = 0
+    for subject in subjects:
+        if faiss_cache.full():
+            # The rest load on first use, evicting the least recently used
+            print(f"Index cache budget reached; not preloading {len(subjects) - loaded} more subject(s)")
+            break
+        load_faiss_database(subject, index_dir, mmap=True)
+        loaded += 1
+    warmup_state = "ready"
+    print(f"Warmup complete: {loaded} subject index(es) in {time.perf_counter() - start:.1f}s")
+
+def get_index_generation(subject: str, index_dir: str = "faiss_index") -> str:
+    """
+    Return a token that changes whenever the subject's latest index is republished.
+
+    Args:
+        subject: Name of the subject
+        index_dir: Directory where indices are stored
+
+    Returns:
+        str: Generation token, empty if the index does not exist
+    """
+    if subject == ALL_SUBJECTS:
+        return ",".join(f"{s}={get_generation(s, index_dir)}" for s in sorted(list_subjects(index_dir)))
+    return get_generation(subject, index_dir)
+
+def document_ids(docs) -> list[str]:
+    """
+    Return stable ids for retrieved documents, in rank order.
+
+    Args:
+        docs: Documents returned by the vector store
+
+    Returns:
+        list: Docstore ids, or content hashes for documents without one
+    """
+    return [doc.id or hashlib.md5(doc.page_content.encode()).hexdigest() for doc in docs]
+
+@timed("embed")
+def embed_query(query: str) -> list[float]:
+    """
+    Embed a query, reusing the cached vector for repeated questions.
+
+    Args:
+        query: User's query
+
+    Returns:
+        Query embedding as a list of floats
+    """
+    vector = embedding_cache.get(query)
+    if vector is None:
+        batcher = get_query_batcher()
+        if batcher is not None:
+            vector = batcher.encode(query)
+        else:
+            vector = get_embedding_model().embed_query(query)
+        embedding_cache.put(query, vector)
+    return vector
+
+def search_by_vector(faiss_db, vector, k: int) -> list[tuple[int, float]]:
+    """
+    Search the raw FAISS index.
+
+    Args:
+        faiss_db: FAISS vector store
+        vector: Query embedding
+        k: Number of neighbours
+
+    Returns:
+        list: (index position, L2 distance) pairs, nearest first
+    """
+    from ann_index import search_reranked
+    distances, positions = search_reranked(
+        faiss_db.index, np.asarray([vector], dtype=np.float32), k,
+        getattr(faiss_db, "rerank_vectors", None), getattr(faiss_db, "rerank", 0),
+    )
+    return [(int(p), float(d)) for p, d in zip(positions[0], distances[0]) if p >= 0]
+
+def documents_at(faiss_db, positions) -> list:
+    """Return the stored documents for FAISS index positions."""
+    if isinstance(faiss_db.docstore, ChunkDocstore):
+        return [faiss_db.docstore.document_at(p) for p in positions]
+    return [faiss_db.docstore.search(faiss_db.index_to_docstore_id[p]) for p in positions]
+
+def timed_bm25_search(bm25, query: str, k: int) -> list[tuple[int, float]]:
+    start = time.perf_counter()
+    results = bm25.search(query, k)
+    bm25_search_seconds.observe(time.perf_counter() - start)
+    return results
 
 def query_faiss(query: str, faiss_db, k: int = 1):
     """
     Perform similarity search on the FAISS database.
 
+    When the index has a BM25 keyword index, dense and keyword search run
+    in parallel over HYBRID_CANDIDATES candidates each and are merged by
+    reciprocal rank fusion, so exact syllabus terms are not lost.
+
     Args:
         query: User's query
         faiss_db: FAISS vector store
@@ -83,22 +494,219 @@ def query_faiss(query: str, faiss_db, k: int = 1):
     Returns:
         List of similar documents
     """
-    similar_docs = faiss_db.similarity_search(query, k=k)
-    return similar_docs
+    return [doc for doc, _ in query_faiss_scored(query, faiss_db, k)]
+
+def similarity(distance: float) -> float:
+    """Cosine similarity for an L2 distance between unit vectors (MiniLM embeddings are normalized)."""
+    return 1.0 - distance / 2.0
 
-def generate_answer(query: str, context: str) -> str:
+def vectors_at(faiss_db, positions) -> np.ndarray | None:
     """
-    Generate an answer using Gemini based on the context.
+    Return the stored vectors for FAISS index positions.
+
+    Uses the full-precision re-ranking vectors when the index has them and
+    reconstructs from the index otherwise.
+
+    Returns:
+        np.ndarray: One row per position, or None if the index cannot
+        reconstruct (IVF indexes without a direct map)
+    """
+    vectors = getattr(faiss_db, "rerank_vectors", None)
+    if vectors is not None:
+        return np.asarray(vectors[np.asarray(positions, dtype=np.int64)], dtype=np.float32)
+    try:
+        return np.vstack([faiss_db.index.reconstruct(int(p)) for p in positions]).astype(np.float32)
+    except RuntimeError:
+        return None
+
+@timed("search")
+def search_ranked(query: str, faiss_db, k: int = 1) -> list[tuple[int, float]]:
+    """
+    Rank index positions for a query by dense or hybrid retrieval.
+
+    Scores are cosine similarities, comparable across subjects. Keyword-only
+    hits from hybrid retrieval are scored exactly when the index can
+    reconstruct their vector, and otherwise get the lowest dense
+    candidate's score.
+
+    Returns:
+        list: (index position, similarity) pairs, in rank order
+    """
+    query_vector = embed_query(query)
+    bm25 = getattr(faiss_db, "bm25", None)
+    if bm25 is None or os.getenv("HYBRID_RETRIEVAL", "1") != "1":
+        return [(position, similarity(distance)) for position, distance in search_by_vector(faiss_db, query_vector, k)]
+
+    candidates = max(k, int(os.getenv("HYBRID_CANDIDATES", "20")))
+    keyword_future = retrieval_executor.submit(timed_bm25_search, bm25, query, candidates)
+    dense = search_by_vector(faiss_db, query_vector, candidates)
+    dense_done = time.perf_counter()
+    keyword = keyword_future.result()
+    fused = reciprocal_rank_fusion([
+        [position for position, _ in dense],
+        [position for position, _ in keyword],
+    ])
+    positions = [position for position, _ in fused[:k]]
+    distances = dict(dense)
+    missing = [position for position in positions if position not in distances]
+    if missing:
+        vectors = vectors_at(faiss_db, missing)
+        floor = max(distances.values(), default=4.0)
+        for i, position in enumerate(missing):
+            if vectors is None:
+                distances[position] = floor
+            else:
+                distances[position] = float(np.sum((vectors[i] - np.asarray(query_vector, dtype=np.float32)) ** 2))
+    hybrid_added_seconds.observe(time.perf_counter() - dense_done)
+    return [(position, similarity(distances[position])) for position in positions]
+
+def query_faiss_scored(query: str, faiss_db, k: int = 1) -> list[tuple]:
+    """
+    Like query_faiss, but also return each document's cosine similarity to the query.
+
+    Returns:
+        list: (document, similarity) pairs, in rank order
+    """
+    ranked = search_ranked(query, faiss_db, k)
+    docs = documents_at(faiss_db, [position for position, _ in ranked])
+    return [(doc, score) for doc, (_, score) in zip(docs, ranked)]
+
+def query_faiss_candidates(query: str, faiss_db, k: int) -> list[tuple]:
+    """
+    Like query_faiss_scored, but also return each document's vector for context assembly.
+
+    Returns:
+        list: (document, similarity, vector or None) triples, in rank order
+    """
+    ranked = search_ranked(query, faiss_db, k)
+    positions = [position for position, _ in ranked]
+    docs = documents_at(faiss_db, positions)
+    vectors = vectors_at(faiss_db, positions) if positions else None
+    return [(doc, score, None if vectors is None else vectors[i]) for i, (doc, (_, score)) in enumerate(zip(docs, ranked))]
+
+def search_all_subjects(query: str, k: int, index_dir: str = "faiss_index", with_vectors: bool = False) -> list[tuple]:
+    """
+    Search every subject index concurrently and merge the hits by similarity.
+
+    Each subject is searched on federated_executor with the same retrieval
+    as query_faiss, so latency tracks the slowest subject rather than the
+    sum of them. Returned documents are copies whose metadata carries a
+    "subject" key.
+
+    Args:
+        query: User's query
+        k: Number of hits to return across all subjects
+        index_dir: Directory where indices are stored
+        with_vectors: Return (document, similarity, vector) triples instead of pairs
+
+    Returns:
+        list: Hits sorted by similarity, best first; empty if no subject has an index
+    """
+    from langchain_core.documents import Document
+    start = time.perf_counter()
+    embed_query(query)  # embed once up front; the subject searches hit the cache
+    search = query_faiss_candidates if with_vectors else query_faiss_scored
+    futures = {}
+    for subject in sorted(list_subjects(index_dir)):
+        faiss_db = load_faiss_database(subject, index_dir)
+        if faiss_db:
+            futures[subject] = federated_executor.submit(search, query, faiss_db, k)
+
+    hits = []
+    for subject, future in futures.items():
+        for doc, score, *vector in future.result():
+            tagged = Document(page_content=doc.page_content, metadata={**doc.metadata, "subject": subject}, id=doc.id)
+            hits.append((score, subject, (tagged, score, *vector)))
+    hits.sort(key=lambda hit: (-hit[0], hit[1]))
+    federated_search_seconds.observe(time.perf_counter() - start)
+    return [hit for _, _, hit in hits[:k]]
+
+def query_all_subjects(query: str, k: int = 3, index_dir: str = "faiss_index") -> list:
+    """
+    Search every subject index (see search_all_subjects).
+
+    Returns:
+        list: Documents sorted by similarity, best first; empty if no subject has an index
+    """
+    return [doc for doc, _ in search_all_subjects(query, k, index_dir)]
+
+def retrieve_documents(subject: str, query: str, k: int = 1, index_dir: str = "faiss_index"):
+    """
+    Retrieve context documents for a subject, or across all subjects for ALL_SUBJECTS.
+
+    Args:
+        subject: Subject name or ALL_SUBJECTS
+        query: User's query
+        k: Number of documents for a single subject; "all" uses FEDERATED_TOP_K
+        index_dir: Directory where indices are stored
+
+    Returns:
+        list: Similar documents, or None if there is no index to search
+    """
+    if subject == ALL_SUBJECTS:
+        return query_all_subjects(query, int(os.getenv("FEDERATED_TOP_K", "3")), index_dir) or None
+    faiss_db = load_faiss_database(subject, index_dir)
+    if not faiss_db:
+        return None
+    return query_faiss(query, faiss_db, k)
+
+def retrieve_context(subject: str, query: str, index_dir: str = "faiss_index"):
+    """
+    Retrieve documents for a question and assemble them into prompt context.
+
+    Fetches CONTEXT_CANDIDATES candidates, picks CONTEXT_K of them by
+    maximal marginal relevance (CONTEXT_MMR_LAMBDA) using their stored
+    vectors, merges chunks that overlap in their source and packs the
+    result into CONTEXT_TOKEN_BUDGET estimated tokens. CONTEXT_ASSEMBLY=0
+    restores the plain top-k join of retrieve_documents.
+
+    Args:
+        subject: Subject name or ALL_SUBJECTS
+        query: User's query
+        index_dir: Directory where indices are stored
+
+    Returns:
+        tuple: (documents used, context text), or None if there is no index to search
+    """
+    if os.getenv("CONTEXT_ASSEMBLY", "1") != "1":
+        docs = retrieve_documents(subject, query, index_dir=index_dir)
+        return (docs, "\n\n".join(doc.page_content for doc in docs)) if docs else None
+
+    candidate_count = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+    if subject == ALL_SUBJECTS:
+        candidates = search_all_subjects(query, candidate_count, index_dir, with_vectors=True)
+    else:
+        faiss_db = load_faiss_database(subject, index_dir)
+        if not faiss_db:
+            return None
+        candidates = query_faiss_candidates(query, faiss_db, candidate_count)
+    if not candidates:
+        return None
+
+    with timed("context"):
+        docs, context, stats = assemble_context(
+            embed_query(query), candidates,
+            k=int(os.getenv("CONTEXT_K", "5")),
+            lambda_mult=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.5")),
+            budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+        )
+    context_tokens.observe(stats["tokens"])
+    logger.info("Context for %s: %d candidates, %d selected, %d merged pieces, %d packed, ~%d tokens",
+                subject, stats["candidates"], stats["selected"], stats["pieces"], stats["packed"], stats["tokens"])
+    return docs, context
+
+def build_prompt(query: str, context: str) -> str:
+    """
+    Build the Gemini prompt for a question and its retrieved context.
 
     Args:
         query: User's query
         context: Retrieved context from documents
 
     Returns:
-        Generated answer
+        Prompt text
     """
-    try:
-        prompt = f"""
+    return f"""
         You are an expert educational assistant specializing in the subject matter provided. Your role is to help students understand concepts clearly and accurately based on the reference material.
 
         Instructions:
@@ -118,10 +726,149 @@ def generate_answer(query: str, context: str) -> str:
 
         Answer:
         """
-        gemini_model = get_gemini_model()
-        response = gemini_model.generate_content(prompt)
-        return response.text
+
+def log_prompt(query: str, context: str) -> str:
+    """Build the prompt and record its estimated size."""
+    prompt = build_prompt(query, context)
+    tokens = estimate_tokens(prompt)
+    prompt_tokens.observe(tokens)
+    logger.info("Prompt: %d characters, ~%d tokens (context ~%d tokens)", len(prompt), tokens, estimate_tokens(context))
+    return prompt
+
+def llm_timeout() -> float | None:
+    """Per-call LLM timeout in seconds from LLM_TIMEOUT (default 30; 0 disables)."""
+    return float(os.getenv("LLM_TIMEOUT", "30")) or None
+
+def is_timeout(error: Exception) -> bool:
+    # The Gemini SDK raises google.api_core DeadlineExceeded rather than TimeoutError
+    return isinstance(error, TimeoutError) or type(error).__name__ == "DeadlineExceeded"
+
+class AnswerError(Exception):
+    """A failed LLM call; str() is the message from answer_error to show the user."""
+
+def answer_error(error: Exception, timeout: float | None) -> str:
+    llm_errors.inc()
+    if is_timeout(error):
+        llm_timeouts.inc()
+        if timeout is None:
+            # LLM_TIMEOUT=0: the client's own (e.g. socket) timeout fired
+            logger.warning("LLM call timed out: %s", error)
+            return "Error generating answer: the model did not respond in time. Please try again."
+        logger.warning("LLM call timed out after %ss", timeout)
+        return f"Error generating answer: the model did not respond within {timeout:g} seconds. Please try again."
+    logger.exception("Error generating answer")
+    return f"Error generating answer: {str(error)}. Please check your GEMINI_API_KEY in .env file."
+
+def generate_answer(query: str, context: str, timeout: float | None = None) -> str:
+    """
+    Generate an answer using Gemini based on the context.
+
+    Args:
+        query: User's query
+        context: Retrieved context from documents
+        timeout: Seconds to wait for the LLM (default: LLM_TIMEOUT)
+
+    Returns:
+        Generated answer, or a message starting "Error generating answer" on failure or timeout
+    """
+    timeout = timeout or llm_timeout()
+    try:
+        with timed("generate"):
+            return get_llm_client().generate(log_prompt(query, context), timeout=timeout)
     except Exception as e:
-        return f"Error generating answer: {str(e)}. Please check your GEMINI_API_KEY in .env file."
+        return answer_error(e, timeout)
 
+async def generate_answer_async(query: str, context: str, timeout: float | None = None) -> str:
+    """
+    Generate an answer like generate_answer without blocking the event loop.
+
+    Args:
+        query: User's query
+        context: Retrieved context from documents
+        timeout: Seconds to wait for the LLM (default: LLM_TIMEOUT)
 
+    Returns:
+        Generated answer
+    """
+    timeout = timeout or llm_timeout()
+    try:
+        with timed("generate"):
+            return await asyncio.wait_for(
+                get_llm_client().agenerate(log_prompt(query, context), timeout=timeout), timeout
+            )
+    except Exception as e:
+        return answer_error(e, timeout)
+
+def coalesce_key(subject: str, query: str, chunk_ids) -> tuple:
+    return subject, normalize_query(query), tuple(chunk_ids)
+
+def answer_once(subject: str, query: str, context: str, chunk_ids) -> tuple[str, bool]:
+    """
+    Generate an answer, sharing one LLM call among identical in-flight requests.
+
+    Requests with the same subject, normalized question and retrieved
+    chunks wait for the first one's answer instead of calling the LLM
+    themselves. The call itself runs under llm_limiter.
+
+    Returns:
+        tuple: (answer, leader), leader being True for the request that called the LLM
+
+    Raises:
+        Overloaded: The LLM queue is full or the wait for a slot timed out
+    """
+    def generate():
+        with llm_limiter.slot():
+            return generate_answer(query, context)
+    return answer_flights.do(coalesce_key(subject, query, chunk_ids), generate)
+
+async def answer_once_async(subject: str, query: str, context: str, chunk_ids) -> tuple[str, bool]:
+    """answer_once for the event loop, limited by async_llm_limiter."""
+    async def generate():
+        async with async_llm_limiter.slot():
+            return await generate_answer_async(query, context)
+    return await async_answer_flights.do(coalesce_key(subject, query, chunk_ids), generate)
+
+def stream_answer(query: str, context: str):
+    """
+    Generate an answer like generate_answer, yielding text as it arrives.
+
+    The caller is expected to hold an llm_limiter slot for the whole stream.
+
+    Args:
+        query: User's query
+        context: Retrieved context from documents
+
+    Yields:
+        Pieces of the generated answer
+
+    Raises:
+        AnswerError: The LLM call failed or timed out; it is counted and
+            logged like in generate_answer, and carries the same message
+    """
+    timeout = llm_timeout()
+    try:
+        yield from get_llm_client().stream(log_prompt(query, context), timeout=timeout)
+    except Exception as e:
+        raise AnswerError(answer_error(e, timeout)) from e
+
+def stream_answer_once(subject: str, query: str, context: str, chunk_ids) -> tuple:
+    """
+    Stream an answer, sharing one LLM stream among identical in-flight requests.
+
+    The streaming counterpart of answer_once: requests with the same key
+    as a stream in progress replay its pieces so far and then follow it,
+    instead of calling the LLM themselves. The stream holds an llm_limiter
+    slot until it ends, or until every reader has closed its subscriber.
+
+    Returns:
+        tuple: (subscriber, leader); iterate the subscriber for the pieces
+        (it raises AnswerError like stream_answer) and close() it when done
+
+    Raises:
+        Overloaded: The LLM queue is full or the wait for a slot timed out
+    """
+    def start():
+        llm_limiter.acquire()
+        acquired = time.perf_counter()
+        return stream_answer(query, context), lambda: llm_limiter.release(time.perf_counter() - acquired)
+    return answer_streams.open(coalesce_key(subject, query, chunk_ids), start)
@@ -1,13 +1,40 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import Request
 from pydantic import BaseModel
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import logging
 import os
+import threading
 from ..services.preprocessing import preprocess_all_subjects
 from ..services.vector_store import VectorStore
 from ..services.embeddings import generate_embeddings
+from query import (
+    retrieve_context, answer_once_async,
+    embed_query, document_ids, get_index_generation,
+)
+from answer_cache import answer_cache
+from metrics import counter, timed, render_prometheus, CONTENT_TYPE
+from admission import Overloaded
 import numpy as np
 
 router = APIRouter()
+query_router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# CPU-bound embedding and FAISS work runs here so the event loop stays free
+# to hold many requests that are only waiting on the LLM.
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QUERY_EXECUTOR_WORKERS", "4")),
+    thread_name_prefix="query",
+)
+
+# Subject stores stay resident instead of being read from disk per request
+vector_stores = {}
+vector_stores_lock = threading.Lock()
 
 class ChatRequest(BaseModel):
     question: str
@@ -17,6 +44,34 @@ class ChatResponse(BaseModel):
     answer: str
     context: str
 
+async def run_blocking(func, *args):
+    # Run in a copy of the caller's context so stage timings reach this request's Server-Timing header
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, func, *args)
+
+def get_vector_store(subject: str) -> VectorStore:
+    # Called from the executor threads; the lock keeps concurrent first requests
+    # for a subject from loading it more than once
+    vector_store = vector_stores.get(subject)
+    if vector_store is None:
+        with vector_stores_lock:
+            vector_store = vector_stores.get(subject)
+            if vector_store is None:
+                vector_store = vector_stores[subject] = VectorStore(subject)
+    return vector_store
+
+def search_vector_store(subject: str, question: str, k: int):
+    vector_store = get_vector_store(subject)
+    query_embedding = generate_embeddings([question])
+    return vector_store.search(query_embedding, k=k)
+
+def retrieve(subject: str, user_query: str):
+    retrieved = retrieve_context(subject, user_query)
+    if not retrieved:
+        return None
+    similar_docs, context = retrieved
+    return embed_query(user_query), similar_docs, context
+
 @router.get("/subjects", response_model=List[str])
 async def list_subjects():
     pdf_dir = "../educational_pdf"
@@ -28,9 +83,7 @@ async def list_subjects():
 @router.post("/chat", response_model=ChatResponse)
 async def query_chatbot(chat_request: ChatRequest):
     try:
-        vector_store = VectorStore(chat_request.subject)
-        query_embedding = generate_embeddings([chat_request.question])[0]
-        results = vector_store.search(query_embedding, k=3)
+        results = await run_blocking(search_vector_store, chat_request.subject, chat_request.question, 3)
         context = " ".join([res[0] for res in results])
         # Placeholder answer; in a real app, use an LLM to generate based on context
         answer = f"Based on the retrieved context: {context[:500]}..."
@@ -42,3 +95,45 @@ async def query_chatbot(chat_request: ChatRequest):
 async def reindex_subjects(background_tasks: BackgroundTasks):
     background_tasks.add_task(preprocess_all_subjects)
     return {"message": "Reindexing started in background."}
+
+@query_router.post("/query")
+async def query(request: Request):
+    """Async equivalent of the Flask /query endpoint, with the same request and response shape."""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        data = data if isinstance(data, dict) else {}
+        subject = data.get('subject')
+        user_query = data.get('query')
+
+        if not subject or not user_query:
+            return JSONResponse({"error": "Subject and query are required"}, status_code=400)
+
+        retrieved = await run_blocking(retrieve, subject, user_query)
+        if retrieved is None:
+            return JSONResponse({"error": f"No data found for subject '{subject}'"}, status_code=404)
+        query_vector, similar_docs, context = retrieved
+        chunk_ids = document_ids(similar_docs)
+        generation = get_index_generation(subject)
+
+        with timed("answer_cache"):
+            answer = answer_cache.lookup(subject, generation, query_vector, chunk_ids)
+        if answer is None:
+            # Identical questions in flight share one LLM call
+            answer, leader = await answer_once_async(subject, user_query, context, chunk_ids)
+            if leader and not answer.startswith("Error generating answer"):
+                answer_cache.store(subject, generation, query_vector, chunk_ids, answer)
+        return {"answer": answer}
+    except Overloaded as e:
+        return JSONResponse({"error": "The answer service is busy. Please retry shortly."},
+                            status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+    except Exception:
+        counter("request_errors_total", "Requests that failed with an internal error", {"endpoint": "/query"}).inc()
+        logger.exception("Error handling /query")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+@query_router.get("/metrics")
+async def metrics():
+    return Response(render_prometheus(), media_type=CONTENT_TYPE)
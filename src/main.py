@@ -1,9 +1,14 @@
+from metrics import start_request_timings, server_timing_header, StartupTimer
+startup = StartupTimer("api")
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from starlette.requests import Request
+import os
+import time
+startup.mark("fastapi")
 
 app = FastAPI()
 
@@ -16,6 +21,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in: add a Server-Timing header with per-stage durations to every response
+if os.getenv("SERVER_TIMING", "0") == "1":
+    @app.middleware("http")
+    async def add_server_timing(request: Request, call_next):
+        started = time.perf_counter()
+        timings = start_request_timings()
+        response = await call_next(request)
+        response.headers["Server-Timing"] = server_timing_header(timings + [("total", time.perf_counter() - started)])
+        return response
+
 # Static files and templates
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 templates = Jinja2Templates(directory="src/templates")
@@ -25,5 +40,8 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 # Include API routes
-from .api.chatbot import router as chatbot_router
+from .api.chatbot import router as chatbot_router, query_router
 app.include_router(chatbot_router, prefix="/api", tags=["chatbot"])
+app.include_router(query_router, tags=["query"])
+startup.mark("routes")
+print(startup.summary())
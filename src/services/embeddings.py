@@ -1,6 +1,25 @@
-from sentence_transformers import SentenceTransformer
+import threading
+import numpy as np
+from micro_batcher import batcher_from_env
+from embedding_backend import load_sentence_transformer
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first use so importing the API does not pay for torch and the weights.
+# EMBEDDING_BACKEND=int8 quantizes the model for CPU inference; EMBEDDING_THREADS pins torch threads
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                model = load_sentence_transformer('all-MiniLM-L6-v2')
+    return model
+
+# Single-text calls from concurrent requests are coalesced when EMBED_BATCH_WINDOW_MS is set
+batcher = batcher_from_env(lambda texts: get_model().encode(texts), name="service_embedding")
 
 def generate_embeddings(texts):
-    return model.encode(texts)
\ No newline at end of file
+    if batcher is not None and len(texts) == 1:
+        return np.asarray([batcher.encode(texts[0])])
+    return get_model().encode(texts)
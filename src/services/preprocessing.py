@@ -3,56 +3,61 @@ from PyPDF2 import PdfReader
 from .embeddings import generate_embeddings
 from .vector_store import VectorStore
 import numpy as np
+from chunker import iter_chunks, split_text
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extract text from a PDF file."""
+    return "\n".join(extract_pages_from_pdf(pdf_path)) + "\n"
+
+def extract_pages_from_pdf(pdf_path: str) -> list[str]:
+    """Extract the text of each page of a PDF file."""
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+    return [page.extract_text() or "" for page in reader.pages]
+
+def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 0) -> list[str]:
+    """Split text into chunks of at most chunk_size characters, at sentence boundaries where possible."""
+    return split_text(text, chunk_size, chunk_overlap)
+
+def iter_subject_chunks(subject_dir: str):
+    """Yield (text, metadata) for the chunks of every PDF in a subject directory, one page at a time."""
+    for pdf_file in sorted(os.listdir(subject_dir)):
+        if pdf_file.endswith('.pdf'):
+            pdf_path = os.path.join(subject_dir, pdf_file)
+            print(f"Processing {pdf_path}")
+            for page, page_text in enumerate(extract_pages_from_pdf(pdf_path), start=1):
+                for start, end in iter_chunks(page_text, 500, 0):
+                    yield page_text[start:end], {"source": pdf_file, "page": page, "start_index": start}
 
-def chunk_text(text: str, chunk_size: int = 500) -> list[str]:
-    """Split text into chunks of approximately chunk_size characters."""
-    words = text.split()
-    chunks = []
-    current_chunk = ""
-    for word in words:
-        if len(current_chunk) + len(word) + 1 > chunk_size:
-            chunks.append(current_chunk.strip())
-            current_chunk = word
-        else:
-            current_chunk += " " + word
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
+def iter_batches(items, batch_size: int):
+    """Group an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def preprocess_subject(subject: str, pdf_dir: str = "educational_pdf"):
-    """Preprocess all PDFs for a given subject."""
+def preprocess_subject(subject: str, pdf_dir: str = "educational_pdf", batch_size: int = 64):
+    """Preprocess all PDFs for a given subject, embedding chunks in fixed-size batches."""
     subject_dir = os.path.join(pdf_dir, subject)
     if not os.path.exists(subject_dir):
         print(f"Subject directory {subject_dir} not found.")
         return
 
     vector_store = VectorStore(subject)
-    all_texts = []
-    all_embeddings = []
-
-    for pdf_file in os.listdir(subject_dir):
-        if pdf_file.endswith('.pdf'):
-            pdf_path = os.path.join(subject_dir, pdf_file)
-            print(f"Processing {pdf_path}")
-            text = extract_text_from_pdf(pdf_path)
-            chunks = chunk_text(text)
-            if chunks:
-                embeddings = generate_embeddings(chunks)
-                all_texts.extend(chunks)
-                all_embeddings.extend(embeddings)
+    added = 0
+    for batch in iter_batches(iter_subject_chunks(subject_dir), batch_size):
+        texts = [text for text, _ in batch]
+        embeddings = np.asarray(generate_embeddings(texts), dtype=np.float32)
+        vector_store.update_index(embeddings, texts, save=False, new_metadatas=[metadata for _, metadata in batch])
+        added += len(batch)
 
-    if all_embeddings:
-        embeddings_array = np.array(all_embeddings)
-        vector_store.update_index(embeddings_array, all_texts)
-        print(f"Updated index for subject: {subject}")
+    if added:
+        vector_store.save_index()
+        vector_store.save_texts()
+        print(f"Updated index for subject: {subject} ({added} chunks)")
 
 def preprocess_all_subjects(pdf_dir: str = "educational_pdf"):
     """Preprocess all subjects."""
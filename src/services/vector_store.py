@@ -3,46 +3,121 @@ import faiss
 import numpy as np
 import pickle
 import os
+from ann_index import (
+    INDEX_TYPES, build_index, index_type_of, apply_search_params, save_index_params, load_index_params,
+    load_rerank_vectors, search_reranked,
+)
+from chunk_store import ChunkStore, has_chunk_store, write_chunk_store, remove_stale_files
 
 class VectorStore:
-    def __init__(self, subject: str, data_dir: str = "data/indices"):
+    def __init__(self, subject: str, data_dir: str = "data/indices", index_type: str | None = None,
+                 index_params: dict | None = None):
         self.subject = subject
         self.index_path = os.path.join(data_dir, f"{subject}.index")
+        # Legacy pickled list of texts, read until the first save_texts()
         self.texts_path = os.path.join(data_dir, f"{subject}_texts.pkl")
+        self.chunks_prefix = f"{subject}.chunks"
+        self.params_file = f"{subject}.params.json"
+        self.vectors_file = f"{subject}.vectors.npy"
+        self.data_dir = data_dir
+        saved_params = load_index_params(data_dir, self.params_file)
+        # Flat by default; "ivf", "hnsw" or "ivfpq" trade exactness for search speed,
+        # "fp16", "sq8" and "pq" store compressed vectors to save memory
+        self.index_type = index_type or os.getenv("VECTOR_INDEX_TYPE") or saved_params.get("index_type", "flat")
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}'. Expected one of {', '.join(INDEX_TYPES)}")
+        self.index_params = {**saved_params, **(index_params or {})}
+        # index_params["rerank"] > 1 re-ranks rerank * k candidates against the exact
+        # float32 vectors, kept memory-mapped in {subject}.vectors.npy
+        self.rerank = int(self.index_params.get("rerank", 0))
         self.index = self.load_or_create_index()
-        self.texts = self.load_or_create_texts()
+        self.chunks = self.load_chunks()
+        # Chunks added since the store was last written: (text, metadata)
+        self._new_chunks = [] if self.chunks is not None else [(text, {}) for text in self.load_legacy_texts()]
+        self.rerank_vectors = load_rerank_vectors(data_dir, self.vectors_file) if self.rerank > 1 else None
+        self._pending_vectors = []
 
     def load_or_create_index(self) -> faiss.Index:
         if os.path.exists(self.index_path):
-            return faiss.read_index(self.index_path)
+            index = faiss.read_index(self.index_path)
+            apply_search_params(index, self.index_params)
+            return index
         else:
-            # Create a new FAISS index (Flat L2 for simplicity, can be optimized later)
+            # Vectors are staged in a flat index; save_index converts it to
+            # index_type once all of them are known, so training sees the full set
             dimension = 384  # Dimension for 'all-MiniLM-L6-v2' embeddings
             return faiss.IndexFlatL2(dimension)
 
-    def load_or_create_texts(self) -> List[str]:
+    def load_chunks(self) -> ChunkStore | None:
+        if has_chunk_store(self.data_dir, self.chunks_prefix):
+            return ChunkStore(self.data_dir, self.chunks_prefix)
+        return None
+
+    def load_legacy_texts(self) -> List[str]:
         if os.path.exists(self.texts_path):
             with open(self.texts_path, 'rb') as f:
                 return pickle.load(f)
-        else:
-            return []
+        return []
+
+    def __len__(self) -> int:
+        return (len(self.chunks) if self.chunks is not None else 0) + len(self._new_chunks)
+
+    def get_text(self, i: int) -> str:
+        stored = len(self.chunks) if self.chunks is not None else 0
+        return self.chunks.text(i) if i < stored else self._new_chunks[i - stored][0]
+
+    def get_metadata(self, i: int) -> dict:
+        stored = len(self.chunks) if self.chunks is not None else 0
+        return self.chunks.metadata(i) if i < stored else self._new_chunks[i - stored][1]
 
     def search(self, query_vector: np.ndarray, k: int = 5) -> List[Any]:
-        D, I = self.index.search(query_vector, k)
-        results = [(self.texts[i], D[0][j]) for j, i in enumerate(I[0]) if i < len(self.texts)]
+        D, I = search_reranked(self.index, query_vector, k, self.rerank_vectors, self.rerank)
+        results = [(self.get_text(i), D[0][j]) for j, i in enumerate(I[0]) if 0 <= i < len(self)]
         return results
 
-    def update_index(self, new_vectors: np.ndarray, new_texts: List[str]):
-        current_size = self.index.ntotal
+    def update_index(self, new_vectors: np.ndarray, new_texts: List[str], save: bool = True,
+                     new_metadatas: List[dict] | None = None):
+        if self.rerank > 1 and index_type_of(self.index) != "flat":
+            # A trained index cannot give the exact vectors back; keep them for vectors.npy
+            self._pending_vectors.append(np.asarray(new_vectors, dtype=np.float32))
         self.index.add(new_vectors)
-        self.texts.extend(new_texts)
-        self.save_index()
-        self.save_texts()
+        self._new_chunks.extend(zip(new_texts, new_metadatas or [{}] * len(new_texts)))
+        if save:
+            self.save_index()
+            self.save_texts()
 
     def save_index(self):
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        vectors = None
+        if self.index_type != "flat" and index_type_of(self.index) == "flat" and self.index.ntotal:
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            self.index = build_index(vectors, self.index_type, self.index_params)
+        elif self._pending_vectors:
+            vectors = np.concatenate(
+                ([np.asarray(self.rerank_vectors)] if self.rerank_vectors is not None else []) + self._pending_vectors
+            )
         faiss.write_index(self.index, self.index_path)
+        rerank = self.rerank if self.index_type != "flat" else 0
+        if rerank > 1 and vectors is not None:
+            vectors_path = os.path.join(self.data_dir, self.vectors_file)
+            np.save(vectors_path + ".tmp.npy", vectors)
+            os.replace(vectors_path + ".tmp.npy", vectors_path)
+            self.rerank_vectors = load_rerank_vectors(self.data_dir, self.vectors_file)
+            self._pending_vectors = []
+        save_index_params(self.data_dir, self.index, self.params_file, rerank=rerank)
 
     def save_texts(self):
-        with open(self.texts_path, 'wb') as f:
-            pickle.dump(self.texts, f)
\ No newline at end of file
+        """Write all chunks to the memory-mapped chunk store ({subject}.chunks.*)."""
+        count = len(self)
+        write_chunk_store(
+            self.data_dir, [str(i) for i in range(count)],
+            (self.get_text(i) for i in range(count)),
+            [self.get_metadata(i) for i in range(count)],
+            self.chunks_prefix,
+        )
+        # The old files could not be deleted while mapped on Windows; unmap, then retry
+        if self.chunks is not None:
+            self.chunks.close()
+            remove_stale_files(self.data_dir, self.chunks_prefix)
+        self.chunks = ChunkStore(self.data_dir, self.chunks_prefix)
+        self._new_chunks = []
@@ -0,0 +1,263 @@
+import time
+import asyncio
+import threading
+import pytest
+from admission import (
+    Overloaded, ConcurrencyLimiter, AsyncConcurrencyLimiter, SingleFlight, AsyncSingleFlight, StreamSingleFlight,
+    limiter_settings,
+)
+
+
+def hold_slots(limiter: ConcurrencyLimiter, count: int) -> threading.Event:
+    """Occupy ``count`` slots from background threads until the returned event is set."""
+    release = threading.Event()
+    held = threading.Barrier(count + 1)
+
+    def holder():
+        with limiter.slot():
+            held.wait()
+            release.wait()
+
+    for _ in range(count):
+        threading.Thread(target=holder, daemon=True).start()
+    held.wait()
+    return release
+
+
+def test_limiter_refuses_when_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=5, name="test_full")
+    release = hold_slots(limiter, 1)
+    try:
+        with pytest.raises(Overloaded) as refused:
+            limiter.acquire()
+        assert refused.value.reason == "queue_full"
+        assert refused.value.status_code == 429
+        assert 1 <= refused.value.retry_after <= 60
+    finally:
+        release.set()
+
+
+def test_limiter_times_out_waiting_for_a_slot():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.05, name="test_timeout")
+    release = hold_slots(limiter, 1)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(Overloaded) as refused:
+            limiter.acquire()
+        assert time.perf_counter() - start >= 0.05
+        assert refused.value.reason == "queue_timeout"
+        assert refused.value.status_code == 503
+    finally:
+        release.set()
+    assert limiter.waiting == 0
+
+
+def test_limiter_retry_after_grows_with_the_queue():
+    limiter = ConcurrencyLimiter(max_concurrent=2, max_queue=10, name="test_retry")
+    limiter.average_hold = 3.0
+    assert limiter.retry_after() == 3
+    limiter.waiting = 4
+    assert limiter.retry_after() == 9
+
+
+def test_async_limiter_refuses_and_times_out():
+    async def scenario():
+        limiter = AsyncConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.05, name="test_async")
+        release = asyncio.Event()
+        held = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot():
+                held.set()
+                await release.wait()
+
+        async def acquire():
+            async with limiter.slot():
+                pass
+
+        holding = asyncio.create_task(holder())
+        await held.wait()
+        waiter = asyncio.create_task(acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await acquire()
+        with pytest.raises(Overloaded) as timed_out:
+            await waiter
+        release.set()
+        await holding
+        return full.value, timed_out.value
+
+    full, timed_out = asyncio.run(scenario())
+    assert (full.reason, full.status_code) == ("queue_full", 429)
+    assert (timed_out.reason, timed_out.status_code) == ("queue_timeout", 503)
+    assert full.retry_after >= 1
+
+
+def test_single_flight_runs_one_call_for_identical_keys():
+    flights = SingleFlight(name="test_flight")
+    calls = []
+    started = threading.Event()
+    finish = threading.Event()
+
+    def answer():
+        calls.append(1)
+        started.set()
+        finish.wait()
+        return "answer"
+
+    results = []
+    lock = threading.Lock()
+
+    def ask():
+        result = flights.do("same question", answer)
+        with lock:
+            results.append(result)
+
+    leader = threading.Thread(target=ask)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=ask) for _ in range(7)]
+    for thread in followers:
+        thread.start()
+    # Followers block on the leader's future; give them time to join the flight
+    while flights.coalesced.value < 7:
+        time.sleep(0.01)
+    finish.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] * 7 + [("answer", True)]
+    # The key is forgotten once the call finished
+    assert flights.do("same question", lambda: "again") == ("again", True)
+
+
+def test_single_flight_shares_exceptions():
+    flights = SingleFlight(name="test_flight_error")
+    with pytest.raises(ValueError):
+        flights.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flights.do("key", lambda: 1) == (1, True)
+
+
+def test_async_single_flight_runs_one_call_for_identical_keys():
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def scenario():
+        flights = AsyncSingleFlight(name="test_async_flight")
+        return await asyncio.gather(*(flights.do("same question", answer) for _ in range(8)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] * 7 + [("answer", True)]
+
+
+def test_limiter_settings_leave_room_for_the_queue_to_fill(monkeypatch):
+    monkeypatch.delenv("LLM_MAX_QUEUE", raising=False)
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "4")
+    settings = limiter_settings(threads=8)
+    assert settings["max_concurrent"] + settings["max_queue"] < 8
+    assert limiter_settings()["max_queue"] == 16
+
+    monkeypatch.setenv("LLM_MAX_QUEUE", "16")
+    assert limiter_settings(threads=8)["max_queue"] == 3
+    monkeypatch.setenv("LLM_MAX_QUEUE", "1")
+    assert limiter_settings(threads=8)["max_queue"] == 1
+
+
+class RecordingSource:
+    def __init__(self, items, error=None):
+        self.items = list(items)
+        self.error = error
+        self.pulled = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pulled < len(self.items):
+            self.pulled += 1
+            return self.items[self.pulled - 1]
+        if self.error is not None:
+            raise self.error
+        raise StopIteration
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_flight_replays_and_shares_one_source():
+    flights = StreamSingleFlight(name="test_stream")
+    source = RecordingSource(["a", "b", "c"])
+    closed = []
+    leader, is_leader = flights.open("key", lambda: (source, lambda: closed.append(1)))
+    assert is_leader and next(leader) == "a"
+
+    follower, is_leader = flights.open("key", lambda: pytest.fail("second start"))
+    assert not is_leader
+    # The first subscriber leaves; the follower replays "a" and pulls the rest itself
+    leader.close()
+    assert list(follower) == ["a", "b", "c"]
+    follower.close()
+    assert source.pulled == 3 and closed == [1]
+    # The key is forgotten once the stream ended
+    fresh, is_leader = flights.open("key", lambda: (RecordingSource(["x"]), None))
+    assert is_leader and list(fresh) == ["x"]
+
+
+def test_stream_flight_closes_an_abandoned_source_once():
+    flights = StreamSingleFlight(name="test_stream_abandon")
+    source = RecordingSource(["a", "b", "c"])
+    closed = []
+    first, _ = flights.open("key", lambda: (source, lambda: closed.append(1)))
+    second, _ = flights.open("key", None)
+    next(first)
+    first.close()
+    second.close()
+    second.close()
+    assert source.closed and closed == [1]
+    assert source.pulled == 1
+
+
+def test_stream_flight_shares_errors_and_failed_starts():
+    flights = StreamSingleFlight(name="test_stream_errors")
+    failure = RuntimeError("model failed")
+    first, _ = flights.open("key", lambda: (RecordingSource(["a"], failure), None))
+    second, _ = flights.open("key", None)
+    for subscriber in (first, second):
+        assert next(subscriber) == "a"
+        with pytest.raises(RuntimeError):
+            next(subscriber)
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def refused():
+        started.set()
+        release.wait(5)
+        raise Overloaded("queue_full", 1)
+
+    errors = []
+
+    def open_stream(start):
+        try:
+            flights.open("busy", start)
+        except Overloaded as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=open_stream, args=(refused,))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=open_stream, args=(None,))
+    follower.start()
+    while flights.coalesced.value < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pytest
+import faiss
+from ann_index import (
+    build_index, index_type_of, factory_string, save_index_params, load_index_params, to_flat,
+    search_params_of, search_reranked, load_rerank_vectors, VECTORS_FILE,
+)
+
+
+def clustered_vectors(n: int = 2000, d: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, d)) * 4
+    return (centers[rng.integers(0, 20, n)] + rng.standard_normal((n, d))).astype(np.float32)
+
+
+def recall_at_10(index, vectors: np.ndarray, queries: np.ndarray) -> float:
+    exact = to_flat(index, vectors)
+    _, truth = exact.search(queries, 10)
+    _, found = index.search(queries, 10)
+    return np.mean([len(set(t) & set(f)) / 10 for t, f in zip(truth, found)])
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw", "ivfpq"])
+def test_built_indexes_report_their_type_and_find_neighbours(index_type):
+    vectors = clustered_vectors()
+    index = build_index(vectors, index_type, {"nprobe": 16})
+    assert index.ntotal == len(vectors)
+    assert index_type_of(index) == index_type
+    minimum = {"flat": 1.0, "ivf": 0.9, "hnsw": 0.9, "ivfpq": 0.3}[index_type]
+    assert recall_at_10(index, vectors, vectors[:50]) >= minimum
+
+
+def test_factory_strings_use_build_parameters():
+    assert factory_string("ivf", 10000, 384, {"nlist": 64}) == "IVF64,Flat"
+    assert factory_string("hnsw", 10000, 384, {"hnsw_m": 16}) == "HNSW16"
+    assert factory_string("ivfpq", 10000, 384, {"nlist": 64, "pq_m": 48, "pq_nbits": 8}) == "IVF64,PQ48x8"
+    with pytest.raises(ValueError):
+        factory_string("annoy", 10000, 384, {})
+
+
+def test_search_parameters_round_trip_through_index_params(tmp_path):
+    vectors = clustered_vectors(n=500)
+    ivf = build_index(vectors, "ivf", {"nprobe": 3})
+    hnsw = build_index(vectors, "hnsw", {"efSearch": 40})
+    assert search_params_of(ivf) == {"index_type": "ivf", "nprobe": 3}
+    assert search_params_of(hnsw) == {"index_type": "hnsw", "efSearch": 40}
+
+    save_index_params(str(tmp_path), ivf)
+    assert load_index_params(str(tmp_path)) == {"index_type": "ivf", "nprobe": 3}
+    assert load_index_params(str(tmp_path / "missing")) == {}
+
+
+def test_to_flat_keeps_positions_for_incremental_updates():
+    vectors = clustered_vectors(n=500)
+    flat = to_flat(build_index(vectors, "hnsw"))
+    assert index_type_of(flat) == "flat"
+    np.testing.assert_allclose(flat.reconstruct_n(0, flat.ntotal), vectors, rtol=1e-6)
+    original = build_index(vectors, "flat")
+    assert to_flat(original) is original
+
+
+@pytest.mark.parametrize("index_type, max_ratio", [("fp16", 0.55), ("sq8", 0.3), ("pq", 0.3)])
+def test_quantized_types_shrink_the_index(index_type, max_ratio):
+    vectors = clustered_vectors()
+    flat_bytes = len(faiss.serialize_index(build_index(vectors, "flat")))
+    index = build_index(vectors, index_type)
+    assert index_type_of(index) == index_type
+    assert len(faiss.serialize_index(index)) <= max_ratio * flat_bytes
+
+
+def test_rerank_restores_exact_distances_and_recall(tmp_path):
+    vectors = clustered_vectors()
+    queries = vectors[:50]
+    index = build_index(vectors, "pq", {"pq_m": 4})
+    np.save(os.path.join(tmp_path, VECTORS_FILE), vectors)
+    mapped = load_rerank_vectors(str(tmp_path))
+    assert isinstance(mapped, np.memmap)
+
+    _, truth = to_flat(index, vectors).search(queries, 10)
+    _, approximate = search_reranked(index, queries, 10)
+    distances, reranked = search_reranked(index, queries, 10, mapped, rerank=8)
+
+    def recall(found):
+        return np.mean([len(set(t) & set(f)) / 10 for t, f in zip(truth, found)])
+
+    assert recall(reranked) > recall(approximate)
+    exact = np.sum((vectors[reranked[0]] - queries[0]) ** 2, axis=1)
+    np.testing.assert_allclose(distances[0], exact, rtol=1e-4, atol=1e-4)
+    # Without vectors, or with rerank <= 1, it is a plain search
+    np.testing.assert_array_equal(search_reranked(index, queries, 10, mapped, rerank=1)[1], approximate)
+    assert load_rerank_vectors(str(tmp_path / "missing")) is None
+
+
+def test_rerank_factor_is_saved_with_the_search_parameters(tmp_path):
+    index = build_index(clustered_vectors(n=500), "sq8")
+    save_index_params(str(tmp_path), index, rerank=4)
+    assert load_index_params(str(tmp_path)) == {"index_type": "sq8", "rerank": 4}
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import threading
+from answer_cache import SemanticAnswerCache
+
+VECTOR = [1.0, 0.0, 0.0]
+
+
+def persisted(path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return {subject: [entry["answer"] for entry in state["entries"]] for subject, state in json.load(f).items()}
+
+
+def test_store_does_not_write_until_flushed(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache(path=str(path), save_interval=3600)
+    cache.store("os", "g1", VECTOR, ["c1"], "answer")
+    assert not path.exists()
+    cache.flush()
+    assert persisted(path) == {"os": ["answer"]}
+    assert SemanticAnswerCache(path=str(path)).lookup("os", "g1", VECTOR, ["c1"]) == "answer"
+
+
+def test_workers_sharing_a_path_merge_their_answers(tmp_path):
+    path = str(tmp_path / "answers.json")
+    first = SemanticAnswerCache(path=path, save_interval=3600)
+    second = SemanticAnswerCache(path=path, save_interval=3600)
+    first.store("os", "g1", VECTOR, ["c1"], "from first")
+    second.store("os", "g1", VECTOR, ["c2"], "from second")
+    second.store("net", "g1", VECTOR, ["c3"], "net answer")
+    first.flush()
+    second.flush()
+    assert persisted(path) == {"os": ["from first", "from second"], "net": ["net answer"]}
+
+
+def test_newer_generation_replaces_older_entries_on_disk(tmp_path):
+    path = str(tmp_path / "answers.json")
+    old = SemanticAnswerCache(path=path, save_interval=3600)
+    old.store("os", "g1", VECTOR, ["c1"], "stale")
+    old.flush()
+    new = SemanticAnswerCache(path=path, save_interval=3600)
+    new.store("os", "g2", VECTOR, ["c1"], "fresh")
+    new.flush()
+    assert persisted(path) == {"os": ["fresh"]}
+
+
+def test_clear_removes_persisted_entries(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = SemanticAnswerCache(path=path, save_interval=3600)
+    cache.store("os", "g1", VECTOR, ["c1"], "answer")
+    cache.store("net", "g1", VECTOR, ["c1"], "kept")
+    cache.flush()
+    cache.clear("os")
+    cache.flush()
+    assert persisted(path) == {"net": ["kept"]}
+
+
+def test_background_writer_saves_after_the_interval(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache(path=str(path), save_interval=0.01)
+    cache.store("os", "g1", VECTOR, ["c1"], "answer")
+    for _ in range(500):
+        if path.exists():
+            break
+        time.sleep(0.01)
+    assert persisted(path) == {"os": ["answer"]}
+
+
+def test_concurrent_stores_start_one_writer(tmp_path, monkeypatch):
+    cache = SemanticAnswerCache(path=str(tmp_path / "answers.json"), save_interval=60)
+    started = []
+    original_start = threading.Thread.start
+    original_getpid = os.getpid
+
+    def slow_getpid():
+        # Widen the window between the writer check and the start
+        time.sleep(0.02)
+        return original_getpid()
+
+    def recording_start(thread):
+        started.append(thread.name)
+        original_start(thread)
+
+    barrier = threading.Barrier(5)
+
+    def store(i):
+        barrier.wait()
+        cache.store("os", "g1", VECTOR, [f"c{i}"], f"answer {i}")
+
+    threads = [threading.Thread(target=store, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    monkeypatch.setattr(os, "getpid", slow_getpid)
+    monkeypatch.setattr(threading.Thread, "start", recording_start)
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    assert started == ["answer-cache-writer"]
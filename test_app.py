@@ -0,0 +1,143 @@
+import json
+import time
+import threading
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("langchain_core")
+from langchain_core.documents import Document
+import app
+import query
+from answer_cache import SemanticAnswerCache
+from llm import FakeLLMClient
+
+DOCS = [
+    Document(page_content="TCP retransmits lost segments.", metadata={"source": "tcp.pdf"}, id="c1"),
+    Document(page_content="UDP does not.", metadata={"source": "udp.pdf"}, id="c2"),
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(query, "llm_client", FakeLLMClient(latency=0.01, tokens_per_second=0,
+                                                           answer="Segments are retransmitted."))
+    monkeypatch.setattr(app, "retrieve_context", lambda subject, user_query: (DOCS, "context"))
+    monkeypatch.setattr(app, "embed_query", lambda user_query: [1.0, 0.0, 0.0])
+    monkeypatch.setattr(app, "get_index_generation", lambda subject: "1")
+    monkeypatch.setattr(app, "answer_cache", SemanticAnswerCache())
+    return app.app.test_client()
+
+
+def parse_events(body: str) -> list[tuple[str, object]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_query_stream_sends_sources_then_tokens_then_done(client):
+    ttft_count = app.time_to_first_token.snapshot()["count"]
+
+    response = client.post("/query/stream", json={"subject": "networks", "query": "How does TCP recover?"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[0] == "sources"
+    assert names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+    assert [source["id"] for source in events[0][1]] == ["c1", "c2"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "Segments are retransmitted."
+    assert app.time_to_first_token.snapshot()["count"] == ttft_count + 1
+    # The LLM slot is released as soon as the answer stream has ended
+    assert query.llm_limiter.active == 0
+    response.close()
+    assert query.llm_limiter.active == 0
+
+
+def test_query_stream_releases_the_slot_when_the_client_leaves(client):
+    response = client.post("/query/stream", json={"subject": "networks", "query": "How does TCP recover?"},
+                           buffered=False)
+    assert query.llm_limiter.active == 1
+    response.close()
+    assert query.llm_limiter.active == 0
+
+
+def test_query_stream_replays_a_cached_answer(client):
+    first = client.post("/query/stream", json={"subject": "networks", "query": "How does TCP recover?"})
+    first.get_data()
+    first.close()
+    response = client.post("/query/stream", json={"subject": "networks", "query": "How does TCP recover?"})
+    events = parse_events(response.get_data(as_text=True))
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert events[1][1]["text"] == "Segments are retransmitted."
+
+
+def test_query_stream_requires_subject_and_query(client):
+    assert client.post("/query/stream", json={"subject": "networks"}).status_code == 400
+
+
+class TimingOutStream:
+    def stream(self, prompt, timeout=None):
+        yield "Partial "
+        raise TimeoutError("socket timed out")
+
+
+def test_query_stream_reports_llm_timeouts_like_query(client, monkeypatch):
+    monkeypatch.setattr(query, "llm_client", TimingOutStream())
+    monkeypatch.setenv("LLM_TIMEOUT", "5")
+    errors, timeouts = query.llm_errors.value, query.llm_timeouts.value
+
+    response = client.post("/query/stream", json={"subject": "networks", "query": "How does TCP recover?"})
+    events = parse_events(response.get_data(as_text=True))
+    response.close()
+
+    assert [name for name, _ in events] == ["sources", "token", "error"]
+    assert events[-1][1]["error"] == ("Error generating answer: the model did not respond within 5 seconds. "
+                                      "Please try again.")
+    assert (query.llm_errors.value, query.llm_timeouts.value) == (errors + 1, timeouts + 1)
+    assert query.llm_limiter.active == 0
+
+
+class GatedStream:
+    """Streams a fixed answer once released, counting LLM calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def stream(self, prompt, timeout=None):
+        self.calls += 1
+        self.release.wait(5)
+        yield from ["Segments ", "are ", "retransmitted."]
+
+
+def test_identical_streams_share_one_llm_call(client, monkeypatch):
+    llm = GatedStream()
+    monkeypatch.setattr(query, "llm_client", llm)
+    coalesced = query.answer_streams.coalesced.value
+    bodies = []
+
+    def ask():
+        response = app.app.test_client().post(
+            "/query/stream", json={"subject": "networks", "query": "How does TCP recover?"})
+        bodies.append(response.get_data(as_text=True))
+        response.close()
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while query.answer_streams.coalesced.value < coalesced + 3:
+        time.sleep(0.01)
+    llm.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert llm.calls == 1
+    for body in bodies:
+        events = parse_events(body)
+        assert "".join(data["text"] for name, data in events if name == "token") == "Segments are retransmitted."
+        assert events[-1][0] == "done"
+    assert query.llm_limiter.active == 0
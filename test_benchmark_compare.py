@@ -0,0 +1,70 @@
+import sys
+import pytest
+from benchmarks import components
+from benchmarks.components import compare, skipped_components
+
+BASELINE = {"results": {
+    "chunking/chunker": {"median_ms": 10.0},
+    "prompt/build": {"median_ms": 1.0},
+    "embedding/batch_8": {"median_ms": 50.0, "items_per_second": 160.0},
+}}
+
+
+def test_compare_flags_slowdowns_only_beyond_tolerance():
+    report = {"components": ["chunking", "prompt"], "results": {
+        "chunking/chunker": {"median_ms": 11.0},
+        "prompt/build": {"median_ms": 2.0},
+    }}
+    assert compare(report, BASELINE, 0.2) == ["prompt/build median_ms: 1.0 -> 2.0 (+100% worse)"]
+
+
+def test_compare_fails_on_missing_and_newly_skipped_metrics():
+    report = {"components": ["chunking", "prompt", "embedding"], "results": {
+        "chunking/chunk_text": {"median_ms": 10.0},
+        "prompt/build": {"median_ms": 1.0},
+        "embedding": {"skipped": "SkipComponent: embedding model unavailable"},
+    }}
+    regressions = compare(report, BASELINE, 0.2)
+    assert any(r.startswith("chunking/chunker: in the baseline but missing") for r in regressions)
+    assert any(r.startswith("embedding/batch_8: in the baseline but embedding was skipped") for r in regressions)
+    assert len(regressions) == 2
+
+
+def test_compare_ignores_components_not_run():
+    report = {"components": ["prompt"], "results": {"prompt/build": {"median_ms": 1.0}}}
+    assert compare(report, BASELINE, 0.2) == []
+
+
+def test_skipped_components_lists_requested_components_that_did_not_run():
+    report = {"components": ["pdf_extraction", "prompt"], "results": {
+        "pdf_extraction": {"skipped": "ImportError: no module"},
+        "prompt/build": {"median_ms": 1.0},
+    }}
+    assert skipped_components(report) == {"pdf_extraction": "ImportError: no module"}
+
+
+def run_main(monkeypatch, tmp_path, *args, results=None):
+    report = {"environment": {}, "components": ["prompt"],
+              "results": results or {"prompt/build": {"median_ms": 1.0}}}
+    monkeypatch.setattr(components, "run", lambda only, quick: report)
+    monkeypatch.setattr(sys, "argv", ["components", "--only", "prompt", "--output", str(tmp_path / "report.json"),
+                                      *args])
+    components.main()
+
+
+def test_missing_baseline_fails_only_with_compare(monkeypatch, tmp_path):
+    missing = str(tmp_path / "baseline.json")
+    run_main(monkeypatch, tmp_path, "--baseline", missing)
+    with pytest.raises(SystemExit) as exit_info:
+        run_main(monkeypatch, tmp_path, "--baseline", missing, "--compare")
+    assert exit_info.value.code == 1
+
+
+def test_compare_fails_on_a_skipped_component(monkeypatch, tmp_path):
+    baseline = str(tmp_path / "baseline.json")
+    run_main(monkeypatch, tmp_path, "--baseline", baseline, "--update-baseline")
+    run_main(monkeypatch, tmp_path, "--baseline", baseline, "--compare")
+    with pytest.raises(SystemExit) as exit_info:
+        run_main(monkeypatch, tmp_path, "--baseline", baseline, "--compare",
+                 results={"prompt": {"skipped": "ImportError: no module"}})
+    assert exit_info.value.code == 1
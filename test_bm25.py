@@ -0,0 +1,64 @@
+import types
+import faiss
+import numpy as np
+import query
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The TCP handshake uses SYN and ACK segments.",
+    "UDP sends datagrams without a handshake.",
+    "Routing tables map prefixes to next hops.",
+    "Congestion control in TCP reacts to packet loss.",
+]
+
+
+def test_bm25_ranks_documents_matching_more_query_terms_first():
+    index = BM25Index.build(TEXTS)
+    results = index.search("tcp handshake", k=10)
+    assert [doc_id for doc_id, _ in results][:1] == [0]
+    assert {doc_id for doc_id, _ in results} == {0, 1, 3}
+    assert all(score > 0 for _, score in results)
+    assert index.search("ospf", k=10) == []
+    assert tokenize("TCP/IP, v4!") == ["tcp", "ip", "v4"]
+
+
+def test_bm25_round_trips_through_its_files(tmp_path):
+    index = BM25Index.build(TEXTS)
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("tcp packet loss", k=3) == index.search("tcp packet loss", k=3)
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+
+def test_rrf_ranks_items_found_by_both_retrievers_first():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [4, 3, 5]])
+    assert fused[0][0] == 3
+    assert {item for item, _ in fused} == {1, 2, 3, 4, 5}
+    # Equal scores are broken by id, so the order is deterministic
+    assert [item for item, _ in fused[1:3]] == [1, 4]
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hybrid_search_adds_keyword_only_hits(monkeypatch):
+    # Dense search finds 0 and 2 for the query; BM25 finds 0 and 3
+    vectors = np.stack([unit([1, 0.1, 0]), unit([0, 1, 0]), unit([1, 0.3, 0]), unit([0, 0, 1])])
+    index = faiss.IndexFlatL2(3)
+    index.add(vectors)
+    faiss_db = types.SimpleNamespace(index=index, bm25=BM25Index.build(TEXTS), rerank_vectors=None, rerank=0)
+    query_vector = unit([1, 0, 0])
+    monkeypatch.setattr(query, "embed_query", lambda text: query_vector.tolist())
+    monkeypatch.setenv("HYBRID_CANDIDATES", "2")
+
+    ranked = query.search_ranked("tcp congestion", faiss_db, k=3)
+    assert ranked[0][0] == 0
+    assert {position for position, _ in ranked} == {0, 2, 3}
+    # The keyword-only hit is scored by its real vector, not a placeholder
+    keyword_only = dict(ranked)[3]
+    assert abs(keyword_only - float(np.dot(query_vector, vectors[3]))) < 1e-5
+
+    monkeypatch.setenv("HYBRID_RETRIEVAL", "0")
+    assert [position for position, _ in query.search_ranked("tcp congestion", faiss_db, k=2)] == [0, 2]
@@ -0,0 +1,23 @@
+import time
+import threading
+from src.api import chatbot
+
+
+def test_concurrent_first_requests_load_the_store_once(monkeypatch):
+    loads = []
+
+    class SlowVectorStore:
+        def __init__(self, subject):
+            loads.append(subject)
+            time.sleep(0.05)
+
+    monkeypatch.setattr(chatbot, "VectorStore", SlowVectorStore)
+    monkeypatch.setattr(chatbot, "vector_stores", {})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(chatbot.get_vector_store("os"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["os"]
+    assert len({id(store) for store in results}) == 1
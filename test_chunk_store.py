@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pytest
+from chunk_store import (
+    ChunkStore, ChunkDocstore, ReadOnlyDocstoreError, write_chunk_store, remove_stale_files,
+)
+
+
+def test_round_trip(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["b", "a"], ["first text", "zweiter Text ü"],
+                      [{"source": "x.pdf", "page": 1}, {"source": "y.pdf"}])
+    store = ChunkStore(directory)
+    assert len(store) == 2
+    assert store.text(1) == "zweiter Text ü"
+    assert store.metadata(0) == {"source": "x.pdf", "page": 1}
+    assert store.metadata(1) == {"source": "y.pdf"}
+    assert store.row_of("a") == 1 and store.row_of("missing") is None
+
+
+def test_rewrite_swaps_the_whole_store(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["1"], ["old"], [{}], prefix="physics.chunks")
+    old = ChunkStore(directory, "physics.chunks")
+    write_chunk_store(directory, ["1", "2"], ["new text", "more"], [{}, {}], prefix="physics.chunks")
+    new = ChunkStore(directory, "physics.chunks")
+
+    # An open store keeps reading its own files; a new one sees only the new write
+    assert old.text(0) == "old"
+    assert [new.text(0), new.text(1)] == ["new text", "more"]
+    data_files = [name for name in os.listdir(directory) if not name.endswith(".json")]
+    assert len(data_files) == 6
+    old.close()
+    assert remove_stale_files(directory, "physics.chunks") == []
+
+
+def test_stale_files_of_other_prefixes_are_kept(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["1"], ["a"], [{}], prefix="physics.chunks")
+    write_chunk_store(directory, ["1"], ["b"], [{}], prefix="physics2.chunks")
+    write_chunk_store(directory, ["1"], ["c"], [{}], prefix="physics.chunks")
+    assert ChunkStore(directory, "physics2.chunks").text(0) == "b"
+    assert ChunkStore(directory, "physics.chunks").text(0) == "c"
+
+
+def test_reads_version_1_stores(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["1"], ["legacy"], [{"page": 3}])
+    header_path = os.path.join(directory, "chunks.json")
+    import json
+    with open(header_path) as f:
+        header = json.load(f)
+    data = header.pop("data")
+    header["version"] = 1
+    for name in os.listdir(directory):
+        if name.startswith(data):
+            os.rename(os.path.join(directory, name), os.path.join(directory, "chunks" + name[len(data):]))
+    with open(header_path, "w") as f:
+        json.dump(header, f)
+    store = ChunkStore(directory)
+    assert store.text(0) == "legacy" and store.metadata(0) == {"page": 3}
+    assert isinstance(store.offsets, np.ndarray)
+
+
+def test_size_is_recorded_at_open_and_survives_close(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["a", "b"], ["first", "second"], [{"page": 1}, {"page": 2}])
+    store = ChunkStore(directory)
+    size = store.nbytes
+    assert size >= len("firstsecond")
+    store.close()
+    assert store.nbytes == size
+
+
+def test_docstore_refuses_changes(tmp_path):
+    directory = str(tmp_path)
+    write_chunk_store(directory, ["a"], ["first"], [{}])
+    docstore = ChunkDocstore(ChunkStore(directory))
+    with pytest.raises(ReadOnlyDocstoreError):
+        docstore.add({"b": "second"})
+    with pytest.raises(ReadOnlyDocstoreError):
+        docstore.delete(["a"])
+    assert docstore.search("a").page_content == "first"
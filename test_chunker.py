@@ -0,0 +1,80 @@
+import random
+from langchain_core.documents import Document
+from chunker import iter_chunks, split_text, split_documents
+
+
+def sample_text(sentences: int = 200, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = "the kernel schedules threads across cores while memory pages move between disk and ram".split()
+    parts = []
+    for i in range(sentences):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(4, 18))).capitalize() + ".")
+        if i % 7 == 6:
+            parts.append("\n\n")
+    return " ".join(parts)
+
+
+def test_offsets_match_the_text_and_respect_the_size():
+    text = sample_text()
+    spans = list(iter_chunks(text, chunk_size=300, chunk_overlap=60))
+    assert len(spans) > 10
+    assert split_text(text, 300, 60) == [text[start:end] for start, end in spans]
+    for start, end in spans:
+        assert 0 < end - start <= 300
+        assert text[start:end] == text[start:end].strip()
+    # Every non-space character is covered by some chunk
+    covered = set()
+    for start, end in spans:
+        covered.update(range(start, end))
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+
+def test_chunks_overlap_at_sentence_boundaries():
+    text = sample_text()
+    spans = list(iter_chunks(text, chunk_size=300, chunk_overlap=60))
+    # Offsets of ". " sentence ends; the next sentence starts two characters later
+    sentence_ends = [i for i in range(len(text) - 1) if text[i:i + 2] == ". "]
+    aligned = 0
+    for (_, previous_end), (start, end) in zip(spans, spans[1:]):
+        overlap = previous_end - start
+        assert 0 < overlap <= 60
+        # The overlap begins at a sentence start whenever the window has one
+        if any(previous_end - 60 <= i and i + 2 < previous_end for i in sentence_ends):
+            assert text[start].isupper()
+            aligned += 1
+        else:
+            assert text[start - 1] == " "
+    assert aligned
+    for start, end in spans[:-1]:
+        assert text[end - 1] == "."
+
+
+def test_without_overlap_chunks_are_consecutive():
+    text = sample_text()
+    spans = list(iter_chunks(text, chunk_size=250, chunk_overlap=0))
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start >= previous_end
+        assert text[previous_end:start].strip() == ""
+
+
+def test_long_words_are_cut_when_there_is_no_boundary():
+    text = "x" * 250
+    assert list(iter_chunks(text, chunk_size=100, chunk_overlap=20)) == [(0, 100), (80, 180), (160, 250)]
+
+
+def test_chunking_stays_within_the_given_range():
+    text = "Intro. " * 10 + "Body sentence here. " * 30
+    spans = list(iter_chunks(text, chunk_size=120, chunk_overlap=30, start=70, end=400))
+    assert spans[0][0] == 70 and spans[-1][1] <= 400
+
+
+def test_split_documents_keeps_metadata_and_records_offsets():
+    pages = [Document(page_content=sample_text(40, seed=page), metadata={"source": "os.pdf", "page": page})
+             for page in (1, 2)]
+    chunks = split_documents(pages, chunk_size=200, chunk_overlap=40)
+    assert {chunk.metadata["page"] for chunk in chunks} == {1, 2}
+    for chunk in chunks:
+        page = pages[chunk.metadata["page"] - 1].page_content
+        start = chunk.metadata["start_index"]
+        assert page[start:start + len(chunk.page_content)] == chunk.page_content
+        assert chunk.metadata["source"] == "os.pdf"
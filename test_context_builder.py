@@ -0,0 +1,32 @@
+from langchain_core.documents import Document
+from context_builder import merge_overlapping
+
+SHARED = "the transport layer provides reliable end to end delivery between processes"
+
+
+def test_merge_overlapping_joins_legacy_chunks_of_one_source():
+    docs = [
+        Document(page_content="Intro. " + SHARED, metadata={"source": "a.pdf"}),
+        Document(page_content=SHARED + " over unreliable links.", metadata={"source": "a.pdf"}),
+    ]
+    assert merge_overlapping(docs) == [("Intro. " + SHARED + " over unreliable links.", [0, 1])]
+
+
+def test_merge_overlapping_keeps_legacy_chunks_of_other_sources_apart():
+    docs = [
+        Document(page_content="Intro. " + SHARED, metadata={"source": "a.pdf"}),
+        Document(page_content=SHARED + " over unreliable links.", metadata={"source": "b.pdf"}),
+        Document(page_content="Summary. " + SHARED, metadata={"source": "a.pdf", "page": 2}),
+    ]
+    pieces = merge_overlapping(docs)
+    assert pieces == [(doc.page_content, [rank]) for rank, doc in enumerate(docs)]
+
+
+def test_merge_overlapping_uses_offsets_when_present():
+    text = "abcdefghij" * 3
+    docs = [
+        Document(page_content=text[10:25], metadata={"source": "a.pdf", "start_index": 10}),
+        Document(page_content=text[0:15], metadata={"source": "a.pdf", "start_index": 0}),
+        Document(page_content=text[0:15], metadata={"source": "b.pdf", "start_index": 0}),
+    ]
+    assert merge_overlapping(docs) == [(text[0:25], [1, 0]), (text[0:15], [2])]
@@ -0,0 +1,42 @@
+import pytest
+import torch
+import embedding_backend
+
+
+def small_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(64, 128), torch.nn.ReLU(), torch.nn.Linear(128, 32))
+
+
+def test_backend_comes_from_the_environment(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_BACKEND", raising=False)
+    assert embedding_backend.get_backend() == "torch"
+    monkeypatch.setenv("EMBEDDING_BACKEND", "int8")
+    assert embedding_backend.get_backend() == "int8"
+    monkeypatch.setenv("EMBEDDING_BACKEND", "onnx")
+    with pytest.raises(ValueError):
+        embedding_backend.get_backend()
+
+
+def test_int8_backend_quantizes_linear_layers_and_keeps_outputs_close(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_THREADS", raising=False)
+    inputs = torch.randn(16, 64)
+    model = small_model()
+    expected = model(inputs).detach()
+
+    quantized = embedding_backend.apply_backend(model, "int8")
+
+    assert not any(type(layer) is torch.nn.Linear for layer in quantized.modules())
+    cosine = torch.nn.functional.cosine_similarity(quantized(inputs), expected)
+    assert float(cosine.min()) > 0.99
+
+
+def test_torch_backend_leaves_the_model_alone_and_pins_threads(monkeypatch):
+    previous = torch.get_num_threads()
+    monkeypatch.setenv("EMBEDDING_THREADS", "2")
+    try:
+        model = embedding_backend.apply_backend(small_model(), "torch")
+        assert sum(type(layer) is torch.nn.Linear for layer in model.modules()) == 2
+        assert torch.get_num_threads() == 2
+    finally:
+        torch.set_num_threads(previous)
@@ -0,0 +1,53 @@
+import types
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import query
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def make_store(texts_and_vectors):
+    index = faiss.IndexFlatL2(3)
+    index.add(np.stack([unit(vector) for _, vector in texts_and_vectors]))
+    docstore = InMemoryDocstore({
+        str(i): Document(page_content=text, metadata={"source": f"{text}.pdf"})
+        for i, (text, _) in enumerate(texts_and_vectors)
+    })
+    return types.SimpleNamespace(index=index, docstore=docstore, bm25=None, rerank_vectors=None, rerank=0,
+                                 index_to_docstore_id={i: str(i) for i in range(len(texts_and_vectors))})
+
+
+def use_stores(monkeypatch, stores: dict):
+    monkeypatch.setattr(query, "list_subjects", lambda index_dir="faiss_index": list(stores))
+    monkeypatch.setattr(query, "load_faiss_database", lambda subject, index_dir="faiss_index": stores[subject])
+    monkeypatch.setattr(query, "embed_query", lambda text: unit([1, 0, 0]).tolist())
+
+
+def test_all_subjects_search_merges_hits_by_similarity(monkeypatch):
+    networks = make_store([("tcp", [1, 0.1, 0]), ("routing", [0, 1, 0])])
+    use_stores(monkeypatch, {
+        "networks": networks,
+        "os": make_store([("scheduler", [1, 0.5, 0]), ("paging", [0, 0, 1])]),
+        "empty": None,
+    })
+
+    hits = query.search_all_subjects("question", k=3)
+
+    assert [doc.page_content for doc, _ in hits] == ["tcp", "scheduler", "routing"]
+    assert [doc.metadata["subject"] for doc, _ in hits] == ["networks", "os", "networks"]
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+    # Tagging copies the documents; the stores keep their own metadata
+    assert "subject" not in networks.docstore.search("0").metadata
+    assert query.query_all_subjects("question", k=1)[0].page_content == "tcp"
+
+
+def test_all_subjects_search_without_indexes(monkeypatch):
+    use_stores(monkeypatch, {})
+    assert query.search_all_subjects("question", k=3) == []
+    assert query.retrieve_documents(query.ALL_SUBJECTS, "question") is None
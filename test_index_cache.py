@@ -0,0 +1,74 @@
+import time
+import threading
+from index_cache import IndexCache
+
+
+def loader(store, nbytes: int, calls: list | None = None, delay: float = 0.0):
+    def load():
+        if calls is not None:
+            calls.append(store)
+        time.sleep(delay)
+        return store, nbytes
+    return load
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = IndexCache(max_bytes=250)
+    cache.get_or_load("a", "1", loader("A", 100))
+    cache.get_or_load("b", "1", loader("B", 100))
+    assert cache.get("a", "1") == "A"  # "b" is now the least recently used
+    cache.get_or_load("c", "1", loader("C", 100))
+
+    assert "b" not in cache
+    assert cache.peek("a") == "A" and cache.peek("c") == "C"
+    stats = cache.stats()
+    assert stats["bytes"] == 200
+    assert stats["evictions"] == 1
+    assert stats["loads"] == 3
+
+
+def test_keeps_the_newest_entry_even_over_budget():
+    cache = IndexCache(max_bytes=100)
+    cache.get_or_load("a", "1", loader("A", 50))
+    cache.get_or_load("big", "1", loader("BIG", 500))
+    assert list(cache.stats()["subjects"]) == ["big"]
+    assert cache.nbytes == 500
+    assert cache.full()
+
+
+def test_no_budget_never_evicts():
+    cache = IndexCache(max_bytes=0)
+    for subject in "abcdef":
+        cache.get_or_load(subject, "1", loader(subject.upper(), 10**9))
+    assert len(cache) == 6
+    assert not cache.full()
+
+
+def test_new_generation_replaces_the_entry_and_its_bytes():
+    cache = IndexCache(max_bytes=1000)
+    cache.get_or_load("a", "1", loader("A1", 100))
+    assert cache.get("a", "2") is None
+    assert cache.get_or_load("a", "2", loader("A2", 300)) == "A2"
+    assert cache.nbytes == 300
+
+
+def test_failed_load_is_not_cached_and_previous_generation_stays():
+    cache = IndexCache(max_bytes=1000)
+    cache.get_or_load("a", "1", loader("A1", 100))
+    assert cache.get_or_load("a", "2", lambda: None) is None
+    assert cache.peek("a") == "A1"
+
+
+def test_concurrent_misses_load_once():
+    cache = IndexCache(max_bytes=1000)
+    calls, results = [], []
+    load = loader("A", 100, calls, delay=0.1)
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("a", "1", load)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["A"]
+    assert results == ["A"] * 8
+    assert cache.stats()["loads"] == 1
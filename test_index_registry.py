@@ -0,0 +1,45 @@
+import os
+import time
+from index_registry import publish_version, gc_versions, resolve_index_dir
+
+
+def make_version(index_dir, name: str, age: float = 0.0) -> str:
+    path = os.path.join(index_dir, name)
+    os.makedirs(path)
+    with open(os.path.join(path, "index.faiss"), "w") as f:
+        f.write(name)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return name
+
+
+def test_gc_versions_ignores_subjects_sharing_a_prefix(tmp_path):
+    index_dir = str(tmp_path)
+    vision_current = make_version(index_dir, "computer_vision_v" + "a" * 32, age=300)
+    vision_old = make_version(index_dir, "computer_vision_v" + "b" * 32, age=400)
+    publish_version("computer_vision", vision_current, index_dir)
+    old = [make_version(index_dir, f"computer_v{c * 32}", age=200 - i) for i, c in enumerate("cde")]
+    current = make_version(index_dir, "computer_v" + "f" * 32 + "_hnsw", age=0)
+    publish_version("computer", current, index_dir)
+
+    deleted = gc_versions("computer", keep=2, index_dir=index_dir)
+
+    assert sorted(deleted) == sorted(old[:2])
+    assert os.path.isdir(os.path.join(index_dir, old[2]))
+    assert os.path.isdir(os.path.join(index_dir, vision_current))
+    assert os.path.isdir(os.path.join(index_dir, vision_old))
+    assert resolve_index_dir("computer_vision", index_dir) == os.path.join(index_dir, vision_current)
+
+
+def test_gc_versions_keeps_directories_other_pointers_name(tmp_path):
+    index_dir = str(tmp_path)
+    shared = make_version(index_dir, "physics_v" + "1" * 32, age=500)
+    newer = [make_version(index_dir, f"physics_v{c * 32}", age=100 - i) for i, c in enumerate("234")]
+    publish_version("physics", newer[-1], index_dir)
+    # A pointer of another subject naming the directory protects it
+    publish_version("physics_archive", shared, index_dir)
+
+    deleted = gc_versions("physics", keep=1, index_dir=index_dir)
+
+    assert sorted(deleted) == sorted(newer[:2])
+    assert os.path.isdir(os.path.join(index_dir, shared))
@@ -0,0 +1,67 @@
+import threading
+import pytest
+from micro_batcher import MicroBatcher, batcher_from_env
+
+
+class RecordingEncoder:
+    def __init__(self, release: threading.Event | None = None):
+        self.batches = []
+        self.release = release
+
+    def __call__(self, texts):
+        if self.release is not None:
+            self.release.wait()
+        self.batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def test_concurrent_calls_share_one_encode_call():
+    encoder = RecordingEncoder()
+    batcher = MicroBatcher(encoder, max_batch_size=8, max_wait_ms=200, name="test_shared")
+    results = {}
+    barrier = threading.Barrier(5)
+
+    def ask(text):
+        barrier.wait()
+        results[text] = batcher.encode(text)
+
+    threads = [threading.Thread(target=ask, args=(f"q{i}",)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(encoder.batches) == 1
+    assert sorted(encoder.batches[0]) == [f"q{i}" for i in range(5)]
+    assert results == {f"q{i}": f"Q{i}" for i in range(5)}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    release = threading.Event()
+    encoder = RecordingEncoder(release)
+    batcher = MicroBatcher(encoder, max_batch_size=2, max_wait_ms=50, name="test_capped")
+    futures = [batcher.submit(f"q{i}") for i in range(5)]
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == [f"Q{i}" for i in range(5)]
+    assert all(len(batch) <= 2 for batch in encoder.batches)
+    assert sum(len(batch) for batch in encoder.batches) == 5
+
+
+def test_encode_errors_reach_every_caller_in_the_batch():
+    def failing(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(failing, max_batch_size=4, max_wait_ms=50, name="test_failing")
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_batching_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("EMBED_BATCH_WINDOW_MS", raising=False)
+    assert batcher_from_env(lambda texts: texts) is None
+    monkeypatch.setenv("EMBED_BATCH_WINDOW_MS", "5")
+    monkeypatch.setenv("EMBED_MAX_BATCH_SIZE", "16")
+    batcher = batcher_from_env(lambda texts: texts, name="test_env")
+    assert batcher.max_batch_size == 16 and batcher.max_wait == 0.005
@@ -0,0 +1,37 @@
+import os
+from ocr_cache import OCRPageCache
+
+SETTINGS = {"dpi": 300, "lang": "eng", "config": "", "tesseract": "5.3.0"}
+
+
+def test_pages_are_cached_per_pdf_page_and_settings(tmp_path):
+    cache = OCRPageCache(str(tmp_path))
+    key = OCRPageCache.settings_key(SETTINGS)
+    cache.put("pdfhash", 1, key, "page one")
+    cache.put("pdfhash", 2, key, "")
+
+    assert cache.get("pdfhash", 1, key) == "page one"
+    # Blank pages are cached too, so they are not OCRed again
+    assert cache.get("pdfhash", 2, key) == ""
+    assert cache.get("pdfhash", 3, key) is None
+    assert cache.get("otherhash", 1, key) is None
+    assert cache.get("pdfhash", 1, OCRPageCache.settings_key({**SETTINGS, "dpi": 200})) is None
+    assert (cache.hits, cache.misses) == (2, 3)
+    # A second cache over the same directory (another run or worker) sees the entries
+    assert OCRPageCache(str(tmp_path)).get("pdfhash", 1, key) == "page one"
+
+
+def test_settings_key_ignores_ordering():
+    reordered = dict(reversed(list(SETTINGS.items())))
+    assert OCRPageCache.settings_key(reordered) == OCRPageCache.settings_key(SETTINGS)
+
+
+def test_unreadable_entries_are_misses(tmp_path):
+    cache = OCRPageCache(str(tmp_path))
+    key = OCRPageCache.settings_key(SETTINGS)
+    cache.put("pdfhash", 1, key, "text")
+    path = cache._path("pdfhash", 1, key)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{truncated")
+    assert cache.get("pdfhash", 1, key) is None
+    assert not [name for name in os.listdir(os.path.dirname(path)) if ".tmp" in name]
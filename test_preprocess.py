@@ -0,0 +1,181 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+import preprocess
+
+
+def fake_load_document(path: str):
+    if path == "crash":
+        os._exit(1)
+    if path == "fail":
+        raise ValueError("unreadable")
+    return [path]
+
+
+def test_parallel_extraction_survives_crashing_and_failing_files(monkeypatch):
+    # Worker processes are forked, so they inherit the patched loader
+    monkeypatch.setattr(preprocess, "load_document", fake_load_document)
+    paths = ["a", "b", "crash", "c", "d", "fail", "e"]
+    results = list(preprocess.iter_documents_parallel(paths, workers=2, window=3))
+    assert results == [("a", ["a"]), ("b", ["b"]), ("crash", None), ("c", ["c"]),
+                       ("d", ["d"]), ("fail", None), ("e", ["e"])]
+
+
+def test_parallel_extraction_stays_within_its_window(monkeypatch):
+    submitted = []
+    lock = threading.Lock()
+
+    class CountingPool(ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            super().__init__(max_workers=max_workers)
+
+        def submit(self, fn, path):
+            with lock:
+                submitted.append(path)
+            return super().submit(fn, path)
+
+    monkeypatch.setattr(preprocess, "ProcessPoolExecutor", CountingPool)
+    monkeypatch.setattr(preprocess, "load_document", lambda path: [path])
+    paths = [f"file{i}" for i in range(20)]
+    consumed = 0
+    for path, documents in preprocess.iter_documents_parallel(paths, workers=2, window=3):
+        consumed += 1
+        assert documents == [path]
+        with lock:
+            assert len(submitted) - consumed <= 2
+    assert consumed == len(paths)
+
+
+def write_files(folder, files: dict[str, str]) -> None:
+    os.makedirs(folder, exist_ok=True)
+    for name, text in files.items():
+        with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def build_index(path, files: dict[str, dict]) -> None:
+    os.makedirs(path, exist_ok=True)
+    open(os.path.join(path, "index.faiss"), "w").close()
+    preprocess.save_manifest(str(path), "previous", files)
+
+
+def test_plan_extracts_only_changed_files_and_deletes_removed_ids(tmp_path):
+    subject = tmp_path / "networks"
+    write_files(subject, {"kept.pdf": "same", "changed.pdf": "new text", "added.pdf": "added"})
+    hashes = preprocess.get_file_hashes(str(subject))
+    build_index(tmp_path / "index", {
+        "kept.pdf": {"hash": hashes["kept.pdf"], "ids": ["k1"]},
+        "changed.pdf": {"hash": "outdated", "ids": ["c1", "c2"]},
+        "removed.pdf": {"hash": "gone", "ids": ["r1"]},
+    })
+
+    plan = preprocess.plan_subject_update(str(subject), str(tmp_path / "index"))
+
+    assert sorted(os.path.basename(path) for path in plan["extract"]) == ["added.pdf", "changed.pdf"]
+    assert sorted(plan["delete_ids"]) == ["c1", "c2", "r1"]
+    assert plan["removed"] == ["removed.pdf"]
+    assert plan["content_hash"] == preprocess.get_content_hash(hashes)
+
+
+def test_plan_rebuilds_everything_without_a_usable_index(tmp_path):
+    subject = tmp_path / "networks"
+    write_files(subject, {"a.pdf": "a", "b.pdf": "b"})
+    # A manifest whose index file is missing is ignored
+    os.makedirs(tmp_path / "index")
+    preprocess.save_manifest(str(tmp_path / "index"), "previous", {"a.pdf": {"hash": "x", "ids": ["a1"]}})
+
+    for current_path in (None, str(tmp_path / "index")):
+        plan = preprocess.plan_subject_update(str(subject), current_path)
+        assert plan["manifest"] is None
+        assert len(plan["extract"]) == 2 and plan["delete_ids"] == []
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+
+def read_text_document(path: str):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    return [preprocess.Document(page_content=text, metadata={"source": path})]
+
+
+def indexed_texts(subject: str) -> list[str]:
+    from index_registry import resolve_index_dir
+    docstore, index_to_docstore_id = preprocess.open_docstore(resolve_index_dir(subject, "faiss_index"))
+    return sorted(docstore.search(index_to_docstore_id[i]).page_content for i in range(len(index_to_docstore_id)))
+
+
+def test_incremental_run_replaces_changed_and_removes_deleted_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "HuggingFaceEmbeddings", lambda **kwargs: FakeEmbeddings())
+    monkeypatch.setattr(preprocess, "load_document", read_text_document)
+    write_files(tmp_path / "docs" / "os", {"a.pdf": "alpha text", "b.pdf": "beta text", "c.pdf": "gamma text"})
+    preprocess.process_subjects("docs")
+    assert indexed_texts("os") == ["alpha text", "beta text", "gamma text"]
+
+    write_files(tmp_path / "docs" / "os", {"b.pdf": "beta revised"})
+    os.remove(tmp_path / "docs" / "os" / "c.pdf")
+    extracted = []
+    monkeypatch.setattr(preprocess, "load_document", lambda path: extracted.append(path) or read_text_document(path))
+    preprocess.process_subjects("docs")
+
+    assert [os.path.basename(path) for path in extracted] == ["b.pdf"]
+    assert indexed_texts("os") == ["alpha text", "beta revised"]
+
+
+def test_files_that_fail_to_extract_are_retried(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(preprocess, "HuggingFaceEmbeddings", lambda **kwargs: FakeEmbeddings())
+    monkeypatch.setattr(preprocess, "load_document",
+                        lambda path: None if path.endswith("b.pdf") else read_text_document(path))
+    write_files(tmp_path / "docs" / "os", {"a.pdf": "alpha text", "b.pdf": "beta text"})
+    preprocess.process_subjects("docs")
+    assert indexed_texts("os") == ["alpha text"]
+
+    monkeypatch.setattr(preprocess, "load_document", read_text_document)
+    preprocess.process_subjects("docs")
+    assert indexed_texts("os") == ["alpha text", "beta text"]
+
+
+def fake_scanned_pdf(monkeypatch, tmp_path, page_texts: list[str]):
+    pdf = tmp_path / "scan.pdf"
+    pdf.write_bytes(b"%PDF scanned")
+    recognized = []
+
+    def ocr_page(pdf_path, page, settings):
+        recognized.append(page)
+        return page_texts[page - 1]
+
+    monkeypatch.setattr(preprocess, "pdfinfo_from_path", lambda path: {"Pages": len(page_texts)})
+    monkeypatch.setattr(preprocess, "ocr_page", ocr_page)
+    monkeypatch.setattr(preprocess, "get_ocr_settings", lambda: {"dpi": 300, "lang": "eng"})
+    return str(pdf), recognized
+
+
+def test_ocr_runs_per_page_and_reuses_the_page_cache(tmp_path, monkeypatch):
+    pdf, recognized = fake_scanned_pdf(monkeypatch, tmp_path, ["first page", "  ", "third page"])
+    cache = preprocess.OCRPageCache(str(tmp_path / "cache"))
+
+    pages = preprocess.extract_pages_from_image_pdf(pdf, workers=2, cache=cache)
+    assert pages == [(1, "first page"), (3, "third page")]
+    assert sorted(recognized) == [1, 2, 3]
+
+    recognized.clear()
+    assert preprocess.extract_pages_from_image_pdf(pdf, workers=2, cache=cache) == pages
+    assert recognized == []
+
+
+def test_ocr_separates_blank_documents_from_failures(tmp_path, monkeypatch):
+    pdf, _ = fake_scanned_pdf(monkeypatch, tmp_path, ["", " "])
+    cache = preprocess.OCRPageCache(str(tmp_path / "cache"))
+    assert preprocess.extract_pages_from_image_pdf(pdf, cache=cache) == []
+
+    monkeypatch.setattr(preprocess, "ocr_page", lambda *args: (_ for _ in ()).throw(RuntimeError("tesseract died")))
+    monkeypatch.setattr(preprocess, "pdfinfo_from_path", lambda path: {"Pages": 3})
+    assert preprocess.extract_pages_from_image_pdf(pdf, cache=cache) is None
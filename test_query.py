@@ -0,0 +1,138 @@
+import os
+import time
+import shutil
+import threading
+import asyncio
+import pytest
+import query
+from index_cache import IndexCache
+
+
+class TimingOutClient:
+    def generate(self, prompt, timeout=None):
+        raise TimeoutError("socket timed out")
+
+    async def agenerate(self, prompt, timeout=None):
+        raise TimeoutError("socket timed out")
+
+
+@pytest.fixture
+def timing_out_client(monkeypatch):
+    monkeypatch.setattr(query, "llm_client", TimingOutClient())
+
+
+@pytest.mark.parametrize("llm_timeout", ["0", "5"])
+def test_generate_answer_reports_timeouts(timing_out_client, monkeypatch, llm_timeout):
+    monkeypatch.setenv("LLM_TIMEOUT", llm_timeout)
+    answer = query.generate_answer("What is a packet?", "context")
+    assert answer.startswith("Error generating answer: the model did not respond")
+    assert asyncio.run(query.generate_answer_async("What is a packet?", "context")) == answer
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_embedding_cache_shares_entries_across_case_and_whitespace():
+    cache = query.EmbeddingCache(max_size=4)
+    cache.put("What is TCP?", [0.5, 0.25])
+    assert cache.get("  what   is tcp? ") == [0.5, 0.25]
+    assert cache.get("what is tcp") == [0.5, 0.25]
+    assert cache.get("What is UDP?") is None
+    assert cache.stats() == {"size": 1, "max_size": 4, "hits": 2, "misses": 1}
+
+
+def test_embedding_cache_evicts_the_least_recently_used_query():
+    cache = query.EmbeddingCache(max_size=2)
+    cache.put("first", [1.0])
+    cache.put("second", [2.0])
+    cache.get("first")
+    cache.put("third", [3.0])
+    assert cache.get("second") is None
+    assert cache.get("first") == [1.0] and cache.get("third") == [3.0]
+    cache = query.EmbeddingCache(max_size=0)
+    cache.put("first", [1.0])
+    assert cache.get("first") is None
+
+
+def test_embed_query_runs_the_model_once_per_normalized_question(monkeypatch):
+    model = CountingEmbeddings()
+    monkeypatch.setattr(query, "embedding_model", model)
+    monkeypatch.setattr(query, "embedding_cache", query.EmbeddingCache(max_size=8))
+    monkeypatch.setattr(query, "get_query_batcher", lambda: None)
+    first = query.embed_query("What is TCP?")
+    assert query.embed_query("what is  TCP?") == first
+    assert model.calls == ["What is TCP?"]
+
+
+def test_concurrent_first_requests_share_one_query_batcher(monkeypatch):
+    monkeypatch.setenv("EMBED_BATCH_WINDOW_MS", "5")
+    monkeypatch.setattr(query, "query_batcher", None)
+    monkeypatch.setattr(query, "query_batcher_configured", False)
+    built = []
+    real_batcher_from_env = query.batcher_from_env
+
+    def slow_batcher_from_env(encode_batch):
+        time.sleep(0.05)
+        batcher = real_batcher_from_env(encode_batch, name="test_query_batcher")
+        built.append(batcher)
+        return batcher
+
+    monkeypatch.setattr(query, "batcher_from_env", slow_batcher_from_env)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(query.get_query_batcher())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+    assert all(batcher is built[0] for batcher in results)
+
+
+def publish_fake_index(index_dir: str, subject: str, version: str) -> str:
+    from index_registry import publish_version
+    path = os.path.join(index_dir, version)
+    os.makedirs(path)
+    for name in ("index.faiss", "index.pkl"):
+        open(os.path.join(path, name), "w").close()
+    publish_version(subject, version, index_dir)
+    return path
+
+
+def test_load_faiss_database_falls_back_only_while_the_index_exists(tmp_path, monkeypatch):
+    index_dir = str(tmp_path)
+    monkeypatch.setattr(query, "faiss_cache", IndexCache())
+    monkeypatch.setattr(query, "store_nbytes", lambda faiss_db, path: 1)
+    monkeypatch.setattr(query, "open_faiss_store", lambda path, mmap=False: ("store", path))
+    first = publish_fake_index(index_dir, "os", "os_v" + "a" * 32)
+    assert query.load_faiss_database("os", index_dir) == ("store", first)
+
+    # A new version that cannot be read: keep serving the previous one
+    def unreadable(path, mmap=False):
+        raise OSError("truncated index")
+
+    monkeypatch.setattr(query, "open_faiss_store", unreadable)
+    second = publish_fake_index(index_dir, "os", "os_v" + "b" * 32)
+    assert query.load_faiss_database("os", index_dir) == ("store", first)
+
+    # The subject is removed: nothing is served and the cache lets go of it
+    for path in (first, second, os.path.join(index_dir, "os_latest")):
+        shutil.rmtree(path)
+    assert query.load_faiss_database("os", index_dir) is None
+    assert "os" not in query.faiss_cache
+
+
+def test_coalescing_and_embedding_cache_share_one_normalizer():
+    variants = ["What is TCP?", "  what is tcp ", "WHAT IS TCP!"]
+    assert len({query.coalesce_key("os", text, ["c1"]) for text in variants}) == 1
+    assert len({query.EmbeddingCache.normalize(text) for text in variants}) == 1
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_cors")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Seconds allowed for `import app` in a fresh interpreter
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+# Imported on first use only; none of them may load at boot
+HEAVY_MODULES = (
+    "faiss",
+    "torch",
+    "sentence_transformers",
+    "google.generativeai",
+    "langchain_community.vectorstores.faiss",
+    "langchain_huggingface",
+)
+
+IMPORT_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import app
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_app() -> dict:
+    env = {**os.environ, "PRELOAD_INDEXES": "0"}
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_import_within_budget():
+    # Best of three, so a busy machine does not fail the build on one slow run
+    seconds = min(import_app()["seconds"] for _ in range(3))
+    assert seconds < STARTUP_BUDGET_SECONDS, f"import app took {seconds:.2f}s (budget {STARTUP_BUDGET_SECONDS}s)"
+
+
+def test_app_import_defers_heavy_dependencies():
+    modules = set(import_app()["modules"])
+    loaded = [module for module in HEAVY_MODULES if module in modules]
+    assert not loaded, f"imported at startup: {', '.join(loaded)}"